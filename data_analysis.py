@@ -1,133 +1,361 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
 import pandas as pd
 import scipy.stats as stats
-import statsmodels.api as sm
-from statsmodels.formula.api import ols
 
 
 RESULTS_FILE = "experiment_results.csv"
+SUMMARY_FILE = "analysis_summary.txt"
+# Machine-readable copy of the summary, next to SUMMARY_FILE
+SUMMARY_JSON_FILE = "analysis_summary.json"
+SUMMARY_PARQUET_FILE = "analysis_summary.parquet"
+
+FACTORS = ['Algorithm', 'Type', 'Decimation']
+RESPONSES = ['Time', 'HausdorffDist']
+# Timing harness columns (older result files only have a single Time sample)
+STABILITY_COLUMNS = ['TimeMin', 'TimeRSE', 'TimeRepeats', 'TimeOutliers']
+# Mesh quality of the decimated meshes (metrics.QUALITY_FIELDNAMES; absent in older result files)
+QUALITY_COLUMNS = ['FinalVertices', 'AspectRatioMedian', 'AspectRatioP95', 'NormalDevMean', 'NormalDevP95',
+                   'BoundaryEdges', 'NonManifoldEdges', 'AreaChange', 'VolumeChange']
+# Only these columns are read from the results (column projection)
+ANALYSIS_COLUMNS = FACTORS + RESPONSES + STABILITY_COLUMNS + QUALITY_COLUMNS
+
+CONFIDENCE = 0.95
+ALPHA = 0.05
+# Shapiro-Wilk p-values are not reliable above 5000 samples; larger groups
+# are tested on a fixed-seed random subsample of this size
+SHAPIRO_MAX_N = 5000
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+
+def _present(columns, available):
+    if columns is None:
+        return None
+    return [c for c in columns if c in set(available)]
+
+
+def load_results(path=RESULTS_FILE, columns=ANALYSIS_COLUMNS):
+    # Result table from CSV, Parquet or Arrow IPC/Feather, reading only the
+    # `columns` the file has. Parquet and Arrow need pyarrow. Factors are
+    # categorical, which keeps millions of rows small.
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PARQUET_EXTENSIONS:
+        import pyarrow.parquet as pq
+        df = pd.read_parquet(path, columns=_present(columns, pq.read_schema(path).names))
+    elif ext in ARROW_EXTENSIONS:
+        import pyarrow.ipc as ipc
+        with ipc.open_file(path) as reader:
+            names = reader.schema.names
+        df = pd.read_feather(path, columns=_present(columns, names))
+    else:
+        names = pd.read_csv(path, nrows=0).columns
+        df = pd.read_csv(path, usecols=_present(columns, names),
+                         dtype={f: 'category' for f in FACTORS if f in names})
+    for f in FACTORS:
+        if f in df.columns and df[f].dtype != 'category':
+            df[f] = df[f].astype('category')
+    # Failed jobs have no measurements
+    return df.dropna(subset=[c for c in RESPONSES if c in df.columns]).reset_index(drop=True)
+
+
+class Groups:
+    # One groupby pass over `keys`: the group labels, each row's group
+    # number, and (built once, on first use) the row positions of every
+    # group. Everything per group is then a bincount or an index lookup
+    # instead of a boolean mask over the whole frame.
+
+    def __init__(self, df, keys):
+        grouped = df.groupby(keys, observed=True, sort=True)
+        self.keys = keys
+        self.labels = list(grouped.size().index)
+        self.codes = grouped.ngroup().to_numpy()
+        self.counts = np.bincount(self.codes, minlength=len(self.labels))
+        self._indices = None
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            order = np.argsort(self.codes, kind='stable')
+            self._indices = np.split(order, np.cumsum(self.counts)[:-1])
+        return self._indices
+
+    def split(self, values):
+        return [values[idx] for idx in self.indices]
+
+    def moments(self, values):
+        # (count, mean, sample variance) per group; variance is NaN below two rows
+        n = self.counts
+        mean = np.bincount(self.codes, weights=values, minlength=len(n)) / n
+        dev = values - mean[self.codes]
+        ss = np.bincount(self.codes, weights=dev * dev, minlength=len(n))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = np.where(n > 1, ss / (n - 1), np.nan)
+        return n, mean, var
+
+
+def confidence_intervals(n, mean, var, confidence=CONFIDENCE):
+    # t-intervals for every group at once: (sem, low, high)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sem = np.sqrt(var / n)
+        half = stats.t.ppf(0.5 + confidence / 2, n - 1) * sem
+    return sem, mean - half, mean + half
+
+
+def describe(groups, df):
+    # Mean/std/count/sem and CI bounds per group and response, one row per group
+    table = pd.DataFrame(index=pd.MultiIndex.from_tuples(groups.labels, names=groups.keys))
+    for col in RESPONSES:
+        n, mean, var = groups.moments(df[col].to_numpy(dtype=float))
+        sem, low, high = confidence_intervals(n, mean, var)
+        table[(col, 'mean')] = mean
+        table[(col, 'std')] = np.sqrt(var)
+        table[(col, 'count')] = n
+        table[(col, 'sem')] = sem
+        table[(col, 'ci_low')] = low
+        table[(col, 'ci_high')] = high
+    table.columns = pd.MultiIndex.from_tuples(table.columns)
+    return table
+
+
+def anova_type2(cells, values, factors=FACTORS):
+    # Type II ANOVA of the full factorial model on `factors`, as
+    # statsmodels' anova_lm(ols('y ~ C(A) * C(B) * C(C)'), typ=2).
+    # It is computed from per-cell count, mean and within-cell sum of squares:
+    # every model compared is constant within a cell, so its residual SS
+    # is the within-cell SS plus the count-weighted misfit of the cell
+    # means. The design matrices have one row per cell, not per result.
+    n, mean, var = cells.moments(values)
+    within = np.nansum(var * (n - 1))
+    frame = pd.DataFrame(cells.labels, columns=factors).astype(str)
+    weight = np.sqrt(n)
+
+    def fit(model_terms):
+        # Intercept plus one indicator per level combination of each term;
+        # redundant columns only lower the rank
+        design = np.column_stack([np.ones(len(frame))] + [
+            pd.get_dummies(frame[list(t)].agg("|".join, axis=1)).to_numpy(dtype=float)
+            for t in model_terms
+        ]) * weight[:, None]
+        coef, _, rank, _ = np.linalg.lstsq(design, mean * weight, rcond=None)
+        misfit = mean * weight - design @ coef
+        return within + misfit @ misfit, rank
+
+    terms = [t for size in range(1, len(factors) + 1) for t in itertools.combinations(factors, size)]
+    ssr_full, rank_full = fit(terms)
+    df_resid = n.sum() - rank_full
+    mse = ssr_full / df_resid if df_resid > 0 else np.nan
+
+    rows = {}
+    for term in terms:
+        # SS(term | every term that does not contain it)
+        others = [t for t in terms if not set(term) <= set(t)]
+        ssr_without, rank_without = fit(others)
+        ssr_with, rank_with = fit(others + [term])
+        df_term = rank_with - rank_without
+        sum_sq = ssr_without - ssr_with
+        f_value = sum_sq / df_term / mse if df_term > 0 else np.nan
+        rows[":".join(f"C({f})" for f in term)] = {
+            'sum_sq': sum_sq, 'df': float(df_term), 'F': f_value,
+            'PR(>F)': stats.f.sf(f_value, df_term, df_resid) if df_term > 0 else np.nan,
+        }
+    rows['Residual'] = {'sum_sq': ssr_full, 'df': float(df_resid), 'F': np.nan, 'PR(>F)': np.nan}
+    return pd.DataFrame.from_dict(rows, orient='index')
 
-def analyze_results():
+
+def tukey_hsd(groups, values, alpha=ALPHA):
+    # Tukey-Kramer pairwise comparisons of every group (as statsmodels'
+    # pairwise_tukeyhsd), vectorized over pairs from the group moments
+    n, mean, var = groups.moments(values)
+    k = len(n)
+    df_resid = n.sum() - k
+    mse = np.nansum(var * (n - 1)) / df_resid
+    i, j = np.triu_indices(k, 1)
+    diff = mean[j] - mean[i]
+    se = np.sqrt(mse / 2 * (1 / n[i] + 1 / n[j]))
+    crit = stats.studentized_range.ppf(1 - alpha, k, df_resid)
+    p_adj = stats.studentized_range.sf(np.abs(diff) / se, k, df_resid)
+    names = ["_".join(str(v) for v in label) for label in groups.labels]
+    return pd.DataFrame({
+        'group1': [names[a] for a in i],
+        'group2': [names[b] for b in j],
+        'meandiff': diff,
+        'p-adj': p_adj,
+        'lower': diff - crit * se,
+        'upper': diff + crit * se,
+        'reject': p_adj < alpha,
+    })
+
+
+def _records(table, index_names=None):
+    # JSON-friendly records (NaN -> None), index included
+    table = table.reset_index() if index_names else table
+    if index_names:
+        table.columns = index_names + list(table.columns[len(index_names):])
+    records = table.to_dict(orient='records')
+    return [{k: (None if isinstance(v, float) and np.isnan(v) else
+                 v.item() if isinstance(v, np.generic) else v)
+             for k, v in r.items()} for r in records]
+
+
+def write_summary(summary, path):
+    # analysis_summary.json, or a long-format Parquet table (one row per
+    # record, with its section and response) for .parquet paths
+    if path.endswith(PARQUET_EXTENSIONS):
+        rows = []
+        for section, content in summary.items():
+            if isinstance(content, list):
+                rows.extend(dict(r, section=section) for r in content)
+            elif isinstance(content, dict):
+                for response, records in content.items():
+                    if isinstance(records, list):
+                        rows.extend(dict(r, section=section, response=response) for r in records)
+                    else:
+                        rows.append({'section': section, 'response': response, 'value': records})
+        pd.DataFrame(rows).to_parquet(path, index=False)
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def analyze_results(path=RESULTS_FILE):
+    # Prints the report and returns it as a dict (see write_summary)
     try:
-        df = pd.read_csv(RESULTS_FILE)
+        df = load_results(path)
     except FileNotFoundError:
-        print(f"Error: {RESULTS_FILE} not found. Run experiment_runner.py first.")
-        return
+        print(f"Error: {path} not found. Run experiment_runner.py first.")
+        return None
 
     import warnings
     warnings.filterwarnings("ignore")
 
-    # Calculate descriptive stats
-    # Group by Algorithm and Type
-    grouped = df.groupby(['Algorithm', 'Type'])
-    
+    # Group splits are computed once and shared by every test below
+    pairs = Groups(df, ['Algorithm', 'Type'])
+    cells = Groups(df, FACTORS)
+    values = {col: df[col].to_numpy(dtype=float) for col in RESPONSES}
+    summary = {'source': path, 'rows': len(df)}
+
     print("\n--- Descriptive Statistics with 95% CI ---")
-    summary = grouped.agg({
-        'Time': ['mean', 'std', 'count', 'sem'],
-        'HausdorffDist': ['mean', 'std', 'count', 'sem']
-    })
+    table = describe(pairs, df)
     print("Summary Table:")
-    print(summary)
-    
-    # Calculate 95% CI
-    # We use t-distribution because n is small (15)
-    from scipy import stats
-    
-    def get_ci(row, col):
-        mean = row[(col, 'mean')]
-        sem = row[(col, 'sem')]
-        count = row[(col, 'count')]
-        return stats.t.interval(0.95, count-1, loc=mean, scale=sem)
+    print(table.loc[:, [(c, s) for c in RESPONSES for s in ('mean', 'std', 'count', 'sem')]].to_string())
+    summary['descriptive'] = _records(
+        table.set_axis([f"{c}_{s}" for c, s in table.columns], axis=1), pairs.keys)
 
     # Print formatted table
     print(f"{'Algorithm':<15} {'Type':<20} {'Time Mean':<10} {'Time 95% CI':<25} {'HD Mean':<10} {'HD 95% CI':<25}")
     print("-" * 110)
-    
-    for idx, row in summary.iterrows():
-        algo, mtype = idx
-        
-        time_mean = row[('Time', 'mean')]
-        time_ci = get_ci(row, 'Time')
-        
-        hd_mean = row[('HausdorffDist', 'mean')]
-        hd_ci = get_ci(row, 'HausdorffDist')
-        
-        print(f"{algo:<15} {mtype:<20} {time_mean:<10.4f} ({time_ci[0]:.4f}, {time_ci[1]:.4f})    {hd_mean:<10.4f} ({hd_ci[0]:.4f}, {hd_ci[1]:.4f})")
-        
+    for (algo, mtype), row in table.iterrows():
+        print(f"{algo:<15} {mtype:<20} {row[('Time', 'mean')]:<10.4f} "
+              f"({row[('Time', 'ci_low')]:.4f}, {row[('Time', 'ci_high')]:.4f})    "
+              f"{row[('HausdorffDist', 'mean')]:<10.4f} "
+              f"({row[('HausdorffDist', 'ci_low')]:.4f}, {row[('HausdorffDist', 'ci_high')]:.4f})")
     print("-" * 110)
 
+    if 'TimeRSE' in df.columns:
+        print("\n--- Timing Stability (Time = median of repeated runs) ---")
+        stability = df[STABILITY_COLUMNS + ['Time']].groupby(pairs.codes).agg(
+            TimeMin=('TimeMin', 'median'),
+            TimeMedian=('Time', 'median'),
+            MeanRSE=('TimeRSE', 'mean'),
+            MaxRSE=('TimeRSE', 'max'),
+            MeanRepeats=('TimeRepeats', 'mean'),
+            Outliers=('TimeOutliers', 'sum')
+        )
+        stability.index = pd.MultiIndex.from_tuples(pairs.labels, names=pairs.keys)
+        print(stability.to_string())
+        print("-" * 110)
+        summary['stability'] = _records(stability, pairs.keys)
+
+    quality_columns = [c for c in QUALITY_COLUMNS if c in df.columns and df[c].notna().any()]
+    if quality_columns:
+        print("\n--- Mesh Quality (median per Algorithm x Type x Decimation) ---")
+        quality = df[quality_columns].groupby(cells.codes).median()
+        quality.index = pd.MultiIndex.from_tuples(cells.labels, names=cells.keys)
+        print(quality.to_string(float_format=lambda v: f"{v:.4g}"))
+        print("-" * 110)
+        summary['quality'] = _records(quality, cells.keys)
+
     # Note: Shapiro-Wilk is sensitive to sample size.
     print("Shapiro-Wilk Test for Normality (p-value < 0.05 indicates non-normality):")
-    for algo in df['Algorithm'].unique():
-        for mtype in df['Type'].unique():
-            subset = df[(df['Algorithm'] == algo) & (df['Type'] == mtype)]
-            if len(subset) > 3: # Need at least 3 data points
-                _, p_time = stats.shapiro(subset['Time'])
-                _, p_hd = stats.shapiro(subset['HausdorffDist'])
-                print(f"  {algo} - {mtype}: Time p={p_time:.4f}, HD p={p_hd:.4f}")
-    
+    rng = np.random.default_rng(0)
+    summary['shapiro'] = []
+    for (algo, mtype), idx in zip(pairs.labels, pairs.indices):
+        if len(idx) > 3:  # Need at least 3 data points
+            if len(idx) > SHAPIRO_MAX_N:
+                idx = rng.choice(idx, SHAPIRO_MAX_N, replace=False)
+            _, p_time = stats.shapiro(values['Time'][idx])
+            _, p_hd = stats.shapiro(values['HausdorffDist'][idx])
+            print(f"  {algo} - {mtype}: Time p={p_time:.4f}, HD p={p_hd:.4f}")
+            summary['shapiro'].append({'Algorithm': algo, 'Type': mtype, 'n': int(len(idx)),
+                                       'Time_p': float(p_time), 'HausdorffDist_p': float(p_hd)})
+
     # Homogeneity of Variance (Levene's Test)
     print("\nLevene's Test for Homogeneity of Variance (p-value < 0.05 indicates unequal variances):")
-    # We test across the 6 groups (3 algos * 2 types)
-    groups_time = [df[(df['Algorithm'] == a) & (df['Type'] == t)]['Time'] for a in df['Algorithm'].unique() for t in df['Type'].unique()]
-    groups_hd = [df[(df['Algorithm'] == a) & (df['Type'] == t)]['HausdorffDist'] for a in df['Algorithm'].unique() for t in df['Type'].unique()]
-    
-    _, p_levene_time = stats.levene(*groups_time)
-    _, p_levene_hd = stats.levene(*groups_hd)
+    # Across every Algorithm x Type group
+    _, p_levene_time = stats.levene(*pairs.split(values['Time']))
+    _, p_levene_hd = stats.levene(*pairs.split(values['HausdorffDist']))
     print(f"  Time: p={p_levene_time:.4f}")
     print(f"  Hausdorff Distance: p={p_levene_hd:.4f}")
     print("\n")
+    summary['levene'] = {'Time': float(p_levene_time), 'HausdorffDist': float(p_levene_hd)}
+
     # --- Three-Way ANOVA ---
     print("--- Three-Way ANOVA Results ---")
-    
-    # Model for Time
-    print("Dependent Variable: Execution Time")
-    model_time = ols('Time ~ C(Algorithm) * C(Type) * C(Decimation)', data=df).fit()
-    anova_time = sm.stats.anova_lm(model_time, typ=2)
-    print(anova_time)
-    print("\n")
+    summary['anova'] = {}
+    for col, title in (('Time', 'Execution Time'), ('HausdorffDist', 'Hausdorff Distance')):
+        print(f"Dependent Variable: {title}")
+        anova = anova_type2(cells, values[col])
+        print(anova)
+        print("\n")
+        summary['anova'][col] = _records(anova, ['term'])
 
-    # Model for Hausdorff Distance
-    print("Dependent Variable: Hausdorff Distance")
-    model_hd = ols('HausdorffDist ~ C(Algorithm) * C(Type) * C(Decimation)', data=df).fit()
-    anova_hd = sm.stats.anova_lm(model_hd, typ=2)
-    print(anova_hd)
-    print("\n")
-    
-    
     # --- Post-Hoc Analysis (Tukey's HSD) ---
     print("--- Post-Hoc Analysis (Tukey's HSD) ---")
     print("Performing pairwise comparisons to control for Type 1 error.\n")
-    
-    # Create a combined group column for interaction analysis
-    df['Group'] = df['Algorithm'] + "_" + df['Type'] + "_" + df['Decimation']
-    
-    from statsmodels.stats.multicomp import pairwise_tukeyhsd
-    
-    print("1. Tukey HSD for Execution Time:")
-    tukey_time = pairwise_tukeyhsd(endog=df['Time'], groups=df['Group'], alpha=0.05)
-    print(tukey_time)
-    print("\n")
-    
-    print("2. Tukey HSD for Hausdorff Distance:")
-    tukey_hd = pairwise_tukeyhsd(endog=df['HausdorffDist'], groups=df['Group'], alpha=0.05)
-    print(tukey_hd)
-    print("\n")
+    summary['tukey'] = {}
+    for number, (col, title) in enumerate((('Time', 'Execution Time'), ('HausdorffDist', 'Hausdorff Distance')), 1):
+        print(f"{number}. Tukey HSD for {title} (FWER={ALPHA}):")
+        tukey = tukey_hsd(cells, values[col])
+        print(tukey.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print("\n")
+        summary['tukey'][col] = _records(tukey)
 
     print("=== Analysis Complete ===")
     print("\nInterpretation Guide:")
     print("- If Levene's test p < 0.05: Variances are unequal, T-test results may be affected.")
+    return summary
 
 if __name__ == "__main__":
-    import sys
-    
+    parser = argparse.ArgumentParser(description="Statistical analysis of the benchmark results.")
+    parser.add_argument("--input", default=RESULTS_FILE,
+                        help="Results as CSV, Parquet (.parquet) or Arrow/Feather (.arrow, .feather); "
+                             "Parquet and Arrow need pyarrow")
+    parser.add_argument("--summary-format", choices=["json", "parquet"], default="json",
+                        help=f"Machine-readable summary written next to {SUMMARY_FILE}")
+    args = parser.parse_args()
+
     # Redirect stdout to file
-    with open("analysis_summary.txt", "w", encoding="utf-8") as f:
+    with open(SUMMARY_FILE, "w", encoding="utf-8") as f:
         original_stdout = sys.stdout
         sys.stdout = f
-        
+
         try:
-            analyze_results()
+            summary = analyze_results(args.input)
         finally:
             sys.stdout = original_stdout
-            
-    print("Analysis complete. Results saved to analysis_summary.txt")
+
+    if summary is not None:
+        summary_path = SUMMARY_PARQUET_FILE if args.summary_format == "parquet" else SUMMARY_JSON_FILE
+        write_summary(summary, summary_path)
+        print(f"Analysis complete. Results saved to {SUMMARY_FILE} and {summary_path}")
+    else:
+        print(f"Analysis failed. See {SUMMARY_FILE}")
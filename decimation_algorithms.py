@@ -0,0 +1,160 @@
+import itertools
+
+import numpy as np
+import pymeshlab
+
+# name -> algorithm spec (see register_algorithm)
+ALGORITHMS = {}
+
+# How an algorithm is driven to a face count:
+#   "target"    - the filter takes the target face count directly
+#   "threshold" - the filter takes a cell size; the runner bisects it
+FACE_CONTROL_TARGET = "target"
+FACE_CONTROL_THRESHOLD = "threshold"
+
+
+def register_algorithm(name, params=None, grid=None, face_control=FACE_CONTROL_TARGET, progressive=False):
+    # Decorator registering fn(ms, target_faces, threshold, **params), which
+    # decimates the current mesh of `ms` in place.
+    #   params      - default keyword arguments passed to fn
+    #   grid        - {param: [values]} swept by the runner's --grid mode
+    #   progressive - the output can be decimated further to reach a lower
+    #                 level (true for edge-collapse methods)
+    def decorator(fn):
+        ALGORITHMS[name] = {
+            "name": name,
+            "apply": fn,
+            "params": dict(params or {}),
+            "grid": dict(grid or {}),
+            "face_control": face_control,
+            "progressive": progressive,
+        }
+        return fn
+
+    return decorator
+
+
+def get_algorithm(name):
+    try:
+        return ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown algorithm {name!r}. Registered: {', '.join(ALGORITHMS)}") from None
+
+
+def resolve_params(name, overrides=None):
+    # Default parameters of `name` updated with `overrides`
+    params = dict(get_algorithm(name)["params"])
+    params.update(overrides or {})
+    return params
+
+
+def param_grid(name):
+    # Every combination of the algorithm's grid, as override dicts.
+    # Without a grid this is a single empty override (the defaults).
+    grid = get_algorithm(name)["grid"]
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def params_label(overrides):
+    # Compact, filename-safe label for a set of overrides ("" for defaults)
+    return "_".join(f"{k}-{overrides[k]}" for k in sorted(overrides))
+
+
+def apply(ms, name, target_faces, threshold=None, params=None):
+    algo = get_algorithm(name)
+    algo["apply"](ms, target_faces, threshold, **resolve_params(name, params))
+
+
+# --- PyMeshLab backends ---
+
+QEM_PARAMS = {
+    "preservenormal": True,
+    "preserveboundary": True,
+    "preservetopology": True,
+    "qualitythr": 0.3,
+    "optimalplacement": True,
+}
+
+
+@register_algorithm(
+    "QEM",
+    params=QEM_PARAMS,
+    grid={"optimalplacement": [True, False], "preservetopology": [True, False]},
+    progressive=True,
+)
+def qem(ms, target_faces, threshold=None, **params):
+    ms.meshing_decimation_quadric_edge_collapse(targetfacenum=target_faces, **params)
+
+
+@register_algorithm(
+    "QEMTexture",
+    params={
+        "qualitythr": 0.3,
+        "extratcoordw": 1.0,
+        "preserveboundary": True,
+        "optimalplacement": True,
+        "preservenormal": True,
+    },
+    grid={"optimalplacement": [True, False]},
+    progressive=True,
+)
+def qem_texture(ms, target_faces, threshold=None, **params):
+    # Needs per-wedge texture coordinates; fails on untextured meshes
+    ms.meshing_decimation_quadric_edge_collapse_with_texture(targetfacenum=target_faces, **params)
+
+
+@register_algorithm("Clustering", face_control=FACE_CONTROL_THRESHOLD)
+def clustering(ms, target_faces, threshold=None):
+    # Vertex Clustering
+    # Use provided threshold or default to 0.1% if not tuned (shouldn't happen in exp)
+    t = threshold if threshold is not None else 0.1
+    ms.meshing_decimation_clustering(threshold=pymeshlab.PercentageValue(t))
+
+
+# --- Pure NumPy backends ---
+
+def vertex_clustering(vertices, faces, cell_size):
+    # Uniform-grid vertex clustering. Vertices in the same cell collapse to
+    # their mean; faces that become degenerate or duplicated are dropped.
+    # Returns (vertices, faces) of the simplified mesh.
+    origin = vertices.min(axis=0)
+    cells = np.floor((vertices - origin) / cell_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+
+    counts = np.bincount(cluster)
+    centers = np.stack([np.bincount(cluster, weights=vertices[:, axis]) for axis in range(3)], axis=1)
+    centers /= counts[:, None]
+
+    new_faces = cluster[faces]
+    keep = (
+        (new_faces[:, 0] != new_faces[:, 1])
+        & (new_faces[:, 1] != new_faces[:, 2])
+        & (new_faces[:, 0] != new_faces[:, 2])
+    )
+    new_faces = new_faces[keep]
+
+    # Drop duplicates regardless of winding, keeping the first occurrence
+    _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    new_faces = new_faces[np.sort(first)]
+
+    # Drop cells no face refers to any more
+    used, remap = np.unique(new_faces, return_inverse=True)
+    return centers[used], remap.reshape(-1, 3).astype(np.int32)
+
+
+@register_algorithm("NumpyClustering", face_control=FACE_CONTROL_THRESHOLD)
+def numpy_clustering(ms, target_faces, threshold=None):
+    # Same threshold meaning as "Clustering": cell size as a percentage of
+    # the bounding-box diagonal
+    t = threshold if threshold is not None else 0.1
+    mesh = ms.current_mesh()
+    vertices = mesh.vertex_matrix()
+    faces = mesh.face_matrix()
+    cell_size = t / 100.0 * mesh.bounding_box().diagonal()
+
+    new_vertices, new_faces = vertex_clustering(vertices, faces, cell_size)
+    ms.clear()
+    ms.add_mesh(pymeshlab.Mesh(vertex_matrix=new_vertices, face_matrix=new_faces))
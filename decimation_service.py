@@ -0,0 +1,558 @@
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import urllib.parse
+
+import numpy as np
+import pymeshlab
+
+import experiment_runner
+import mesh_io
+import timing
+from result_store import job_key
+
+SPOOL_DIR = "service_spool"  # Uploads, converted meshes and finished results
+HOST = "127.0.0.1"
+PORT = 8765
+NUM_WORKERS = 1
+# Jobs waiting for a worker, at most. When the queue is full the HTTP
+# service refuses new jobs with 503 and Retry-After instead of piling them
+# up in memory; the library API waits for room (or raises, with wait=False).
+MAX_QUEUED = 16
+RETRY_AFTER = 1  # Seconds
+MAX_UPLOAD_BYTES = 1 << 30
+UPLOAD_FORMATS = ["obj", "ply", "off", "stl", "npz"]  # npz: arrays 'vertices' and 'faces'
+# Callers mostly want the mesh, so jobs get a shorter timing run than a sweep
+SERVICE_TIMING = timing.timing_config(warmups=0, min_repeats=1, max_repeats=5, time_budget=1.0)
+
+
+def _spool_path(spool_dir, kind, name):
+    return os.path.join(spool_dir, kind, name)
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def import_upload(upload_path, mesh_path):
+    # Upload -> binary pair at mesh_path (mesh_io), once per mesh
+    if upload_path.endswith(".npz"):
+        with np.load(upload_path) as arrays:
+            mesh_io.save_binary(mesh_path, arrays["vertices"], arrays["faces"])
+        return
+    ms = pymeshlab.MeshSet()
+    ms.load_new_mesh(upload_path)
+    mesh_io.save_mesh_binary(mesh_path, ms.current_mesh())
+
+
+# --- Worker process side ---
+
+def _init_worker(spool_dir):
+    # Service workers keep their tuned thresholds and the provenance of
+    # their outputs apart from the sweep's
+    experiment_runner.THRESHOLD_CACHE_FILE = os.path.join(spool_dir, "clustering_thresholds.jsonl")
+    experiment_runner.PROVENANCE_FILE = os.path.join(spool_dir, "provenance.sqlite")
+
+
+def run_service_job(spec):
+    # Decimates and measures one uploaded mesh at one level exactly like a
+    # sweep job (experiment_runner.run_job), saving the mesh and the result
+    # row under the job's key. Returns the result record.
+    if not mesh_io.has_binary(spec['mesh_path']):
+        import_upload(spec['upload_path'], spec['mesh_path'])
+    row = experiment_runner.run_job({
+        'mesh_type': 'service',
+        'filepath': spec['mesh_path'],
+        'target_pct': spec['keep'],
+        'algo': spec['algorithm'],
+        'params': spec['params'],
+        'timing': spec['timing'],
+        'metric_backend': spec['metric_backend'],
+        'save_obj': False,
+        'save_path': spec['result_path'],
+    })
+    if row is None:
+        raise RuntimeError(f"{spec['algorithm']} failed on mesh {spec['mesh_hash']} (see the service log)")
+    result = {key: spec[key] for key in ('job', 'mesh_hash', 'algorithm', 'keep', 'params')}
+    result['metrics'] = row
+    _write_atomic(spec['result_path'] + ".json", json.dumps(result).encode("utf-8"))
+    return result
+
+
+# --- Library API ---
+
+class DecimationService:
+    # Bounded job queue in front of a process pool. A job is one level of
+    # one uploaded mesh, keyed by result_store.job_key over the upload's
+    # content hash, the algorithm settings, the level and the library
+    # version. Identical requests share the running job, and finished
+    # jobs are answered from the spool without running again.
+    #
+    #     async with DecimationService() as service:
+    #         mesh_hash = await service.store_upload(data, "obj")
+    #         result = await service.decimate(mesh_hash, "obj", "QEM", 0.5)
+    #         vertices, faces = service.load_mesh(result['job'])
+
+    def __init__(self, spool_dir=SPOOL_DIR, num_workers=NUM_WORKERS, max_queued=MAX_QUEUED,
+                 timing_config=SERVICE_TIMING, metric_backend=experiment_runner.METRIC_BACKEND):
+        self.spool_dir = spool_dir
+        self.num_workers = num_workers
+        self.max_queued = max_queued
+        self.timing_config = timing_config
+        self.metric_backend = metric_backend
+        self.library_version = experiment_runner.library_version()
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'cached': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+        self.running = 0
+        self._jobs = {}  # job key -> future of the queued or running job
+        self._queue = None
+        self._pool = None
+        self._runners = []
+        for kind in ("uploads", "meshes", "results"):
+            os.makedirs(_spool_path(spool_dir, kind, ""), exist_ok=True)
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.max_queued)
+        ctx = multiprocessing.get_context("spawn")
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_workers, mp_context=ctx, initializer=_init_worker, initargs=(self.spool_dir,))
+        self._runners = [asyncio.create_task(self._run()) for _ in range(self.num_workers)]
+        return self
+
+    async def close(self):
+        for task in self._runners:
+            task.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._pool.shutdown(cancel_futures=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _run(self):
+        # One runner task per worker process, so a job leaves the queue only
+        # when a worker is free for it
+        loop = asyncio.get_running_loop()
+        while True:
+            spec, future = await self._queue.get()
+            self.running += 1
+            try:
+                result = await loop.run_in_executor(self._pool, run_service_job, spec)
+                self.stats['completed'] += 1
+                future.set_result(result)
+            except Exception as e:
+                self.stats['failed'] += 1
+                future.set_exception(e)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    def status(self):
+        return dict(self.stats, queued=self._queue.qsize() if self._queue else 0, running=self.running,
+                    workers=self.num_workers, max_queued=self.max_queued)
+
+    async def store_upload(self, data, fmt):
+        # Saves the upload under its content hash and returns the hash
+        if fmt not in UPLOAD_FORMATS:
+            raise ValueError(f"Unsupported format {fmt!r}. Supported: {', '.join(UPLOAD_FORMATS)}")
+        mesh_hash = hashlib.sha256(data).hexdigest()
+        path = self.upload_path(mesh_hash, fmt)
+        if not os.path.exists(path):
+            await asyncio.to_thread(_write_atomic, path, data)
+        return mesh_hash
+
+    def upload_path(self, mesh_hash, fmt):
+        return _spool_path(self.spool_dir, "uploads", f"{mesh_hash}.{fmt}")
+
+    def result_path(self, key):
+        return _spool_path(self.spool_dir, "results", f"{key}.obj")
+
+    def job_key(self, mesh_hash, algorithm, keep, params=None):
+        settings = dict(experiment_runner.algorithm_params(algorithm, params), metric_backend=self.metric_backend)
+        return job_key(mesh_hash, algorithm, settings, keep, self.library_version)
+
+    def load_result(self, key):
+        # Finished result record, or None
+        path = self.result_path(key) + ".json"
+        if not (os.path.exists(path) and mesh_io.has_binary(self.result_path(key))):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_mesh(self, key):
+        # (vertices, faces) of a finished job
+        return mesh_io.load_binary(self.result_path(key), mmap=False)
+
+    async def submit(self, mesh_hash, fmt, algorithm, keep, params=None, wait=True):
+        # Future of the result record. Raises asyncio.QueueFull with
+        # wait=False when the queue has no room, ValueError on bad input.
+        if not 0 < keep <= 1:
+            raise ValueError(f"keep must be in (0, 1], got {keep}")
+        key = self.job_key(mesh_hash, algorithm, keep, params)
+        self.stats['submitted'] += 1
+        if key in self._jobs:
+            self.stats['deduplicated'] += 1
+            return self._jobs[key]
+
+        result = await asyncio.to_thread(self.load_result, key)
+        if result is not None:
+            self.stats['cached'] += 1
+            return self._finished(result)
+        if key in self._jobs:
+            # Submitted by someone else while the spool was checked
+            self.stats['deduplicated'] += 1
+            return self._jobs[key]
+
+        spec, future = self._new_job(key, mesh_hash, fmt, algorithm, keep, params)
+        try:
+            if wait:
+                await self._queue.put((spec, future))
+            else:
+                self._queue.put_nowait((spec, future))
+        except BaseException:
+            self._jobs.pop(key, None)
+            future.cancel()
+            raise
+        return future
+
+    async def submit_levels(self, mesh_hash, fmt, algorithm, levels, params=None):
+        # Futures of the result records of several levels of one mesh, all
+        # or none: raises asyncio.QueueFull, queueing nothing, unless the
+        # queue has room for every level that is not already running or
+        # finished. ValueError on bad input, or more new levels than the
+        # queue can ever hold.
+        for keep in levels:
+            if not 0 < keep <= 1:
+                raise ValueError(f"keep must be in (0, 1], got {keep}")
+        keys = [self.job_key(mesh_hash, algorithm, keep, params) for keep in levels]
+        finished = {}
+        for key in dict.fromkeys(keys):
+            if key not in self._jobs:
+                result = await asyncio.to_thread(self.load_result, key)
+                if result is not None:
+                    finished[key] = result
+
+        # Nothing is awaited from here on, so no other request can take the room
+        new = [key for key in dict.fromkeys(keys) if key not in self._jobs and key not in finished]
+        if self._queue.maxsize > 0:
+            if len(new) > self._queue.maxsize:
+                raise ValueError(f"{len(new)} new levels, but at most {self._queue.maxsize} jobs can be queued")
+            if self._queue.maxsize - self._queue.qsize() < len(new):
+                raise asyncio.QueueFull
+        futures = []
+        for key, keep in zip(keys, levels):
+            self.stats['submitted'] += 1
+            if key in self._jobs:
+                self.stats['deduplicated'] += 1
+                futures.append(self._jobs[key])
+            elif key in finished:
+                self.stats['cached'] += 1
+                futures.append(self._finished(finished[key]))
+            else:
+                spec, future = self._new_job(key, mesh_hash, fmt, algorithm, keep, params)
+                self._queue.put_nowait((spec, future))
+                futures.append(future)
+        return futures
+
+    def _finished(self, result):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        return future
+
+    def _new_job(self, key, mesh_hash, fmt, algorithm, keep, params):
+        # (spec, future) of a job to queue. The future is registered before
+        # the job is queued, so duplicates arriving meanwhile attach to it.
+        spec = {
+            'job': key,
+            'mesh_hash': mesh_hash,
+            'algorithm': algorithm,
+            'keep': keep,
+            'params': params or {},
+            'upload_path': self.upload_path(mesh_hash, fmt),
+            'mesh_path': _spool_path(self.spool_dir, "meshes", f"{mesh_hash}.obj"),
+            'result_path': self.result_path(key),
+            'timing': self.timing_config,
+            'metric_backend': self.metric_backend,
+        }
+        future = asyncio.get_running_loop().create_future()
+        self._jobs[key] = future
+        future.add_done_callback(lambda _: self._jobs.pop(key, None))
+        return spec, future
+
+    async def decimate(self, mesh_hash, fmt, algorithm, keep, params=None):
+        # Shielded: the job is shared, one caller giving up must not cancel it
+        return await asyncio.shield(await self.submit(mesh_hash, fmt, algorithm, keep, params))
+
+
+# --- HTTP service ---
+#
+#   GET  /health                       queue and worker status
+#   POST /decimate?algorithm=QEM&keep=0.5,0.1&format=obj[&params={json}]
+#        body: the mesh file. Streams one JSON line per event: "accepted"
+#        with the job keys, then "result" (or "error") per level as it
+#        finishes. 503 with Retry-After when the queue has no room for
+#        every level; none of them is queued then.
+#   GET  /results/<job>                result record of a finished job
+#   GET  /results/<job>/mesh           its mesh as .npz (vertices, faces)
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def _send(writer, status, body, content_type="application/json", headers=None):
+    if content_type == "application/json":
+        body = json.dumps(body).encode("utf-8")
+    head = [f"HTTP/1.1 {status} {http.client.responses.get(status, '')}",
+            f"Content-Type: {content_type}", f"Content-Length: {len(body)}", "Connection: close"]
+    head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+
+def _send_chunk(writer, record):
+    line = json.dumps(record).encode("utf-8") + b"\n"
+    writer.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+
+
+async def _read_request(reader):
+    method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, value = line.decode("latin-1").split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_UPLOAD_BYTES:
+        raise HTTPError(413, f"Upload larger than {MAX_UPLOAD_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    url = urllib.parse.urlsplit(target)
+    return method, url.path.rstrip("/"), dict(urllib.parse.parse_qsl(url.query)), body
+
+
+async def _decimate_stream(service, query, body, writer):
+    fmt = query.get("format", "obj").lower()
+    algorithm = query.get("algorithm", "QEM")
+    try:
+        levels = [float(k) for k in query.get("keep", "0.5").split(",")]
+        params = json.loads(query["params"]) if query.get("params") else None
+        mesh_hash = await service.store_upload(body, fmt)
+        # All levels or none, so a refused request leaves no jobs behind
+        futures = await service.submit_levels(mesh_hash, fmt, algorithm, levels, params)
+    except asyncio.QueueFull:
+        service.stats['rejected'] += 1
+        raise HTTPError(503, "Job queue is full, retry later", {"Retry-After": RETRY_AFTER}) from None
+    except (ValueError, KeyError) as e:
+        raise HTTPError(400, str(e)) from None
+
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                 b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+    keys = [service.job_key(mesh_hash, algorithm, keep, params) for keep in levels]
+    _send_chunk(writer, {'event': 'accepted', 'mesh_hash': mesh_hash,
+                         'jobs': [{'job': key, 'keep': keep} for key, keep in zip(keys, levels)]})
+    await writer.drain()
+
+    pending = {asyncio.ensure_future(asyncio.shield(f)): (key, keep) for f, key, keep in zip(futures, keys, levels)}
+    while pending:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            key, keep = pending.pop(task)
+            if task.exception() is not None:
+                _send_chunk(writer, {'event': 'error', 'job': key, 'keep': keep, 'error': str(task.exception())})
+            else:
+                _send_chunk(writer, dict(task.result(), event='result'))
+        await writer.drain()
+    writer.write(b"0\r\n\r\n")
+
+
+async def handle_connection(service, reader, writer):
+    # One request per connection
+    try:
+        method, path, query, body = await _read_request(reader)
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/health":
+            _send(writer, 200, service.status())
+        elif method == "POST" and path == "/decimate":
+            await _decimate_stream(service, query, body, writer)
+        elif method == "GET" and parts[0] == "results" and len(parts) in (2, 3):
+            # Keys are SHA-256 hex digests; anything else never names a spool file
+            if len(parts[1]) != 64 or not all(c in "0123456789abcdef" for c in parts[1]):
+                raise HTTPError(404, f"No finished job {parts[1]}")
+            result = await asyncio.to_thread(service.load_result, parts[1])
+            if result is None:
+                raise HTTPError(404, f"No finished job {parts[1]}")
+            if len(parts) == 2:
+                _send(writer, 200, result)
+            elif parts[2] == "mesh":
+                vertices, faces = service.load_mesh(parts[1])
+                buffer = io.BytesIO()
+                np.savez(buffer, vertices=vertices, faces=faces)
+                _send(writer, 200, buffer.getvalue(), "application/octet-stream")
+            else:
+                raise HTTPError(404, f"Unknown path {path}")
+        else:
+            raise HTTPError(404, f"Unknown path {path}")
+    except HTTPError as e:
+        _send(writer, e.status, {'error': str(e)}, headers=e.headers)
+    except (ValueError, asyncio.IncompleteReadError):
+        _send(writer, 400, {'error': "Malformed request"})
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+async def serve(host=HOST, port=PORT, unix_socket=None, **service_options):
+    async with DecimationService(**service_options) as service:
+        handler = lambda reader, writer: handle_connection(service, reader, writer)
+        if unix_socket:
+            server = await asyncio.start_unix_server(handler, path=unix_socket)
+            where = unix_socket
+        else:
+            server = await asyncio.start_server(handler, host, port)
+            where = f"http://{host}:{port}"
+        print(f"Decimation service on {where} ({service.num_workers} workers, "
+              f"queue of {service.max_queued}, spool {service.spool_dir})")
+        async with server:
+            await server.serve_forever()
+
+
+# --- Client ---
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class DecimationClient:
+    # Blocking client for a local service on a TCP port or a Unix socket
+
+    def __init__(self, host=HOST, port=PORT, unix_socket=None, timeout=None):
+        self.host, self.port, self.unix_socket, self.timeout = host, port, unix_socket, timeout
+
+    def _request(self, method, path, body=None):
+        if self.unix_socket:
+            conn = UnixHTTPConnection(self.unix_socket, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        conn.request(method, path, body=body)
+        return conn.getresponse()
+
+    def _json(self, method, path):
+        response = self._request(method, path)
+        data = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f"{response.status}: {data.get('error')}")
+        return data
+
+    def health(self):
+        return self._json("GET", "/health")
+
+    def result(self, key):
+        return self._json("GET", f"/results/{key}")
+
+    def mesh(self, key):
+        response = self._request("GET", f"/results/{key}/mesh")
+        data = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"{response.status}: {json.loads(data).get('error')}")
+        with np.load(io.BytesIO(data)) as arrays:
+            return arrays["vertices"], arrays["faces"]
+
+    def decimate(self, path, algorithm="QEM", keep=(0.5,), params=None):
+        # Uploads the mesh at `path` and yields the service's events as
+        # they arrive. Raises RuntimeError on 503 (queue full) and errors.
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        query = {"algorithm": algorithm, "keep": ",".join(str(k) for k in keep), "format": fmt}
+        if params:
+            query["params"] = json.dumps(params)
+        with open(path, "rb") as f:
+            response = self._request("POST", "/decimate?" + urllib.parse.urlencode(query), f.read())
+        if response.status != 200:
+            data = json.loads(response.read())
+            retry = response.getheader("Retry-After")
+            raise RuntimeError(f"{response.status}: {data.get('error')}" + (f" (retry after {retry}s)" if retry else ""))
+        for line in response:
+            yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local decimation service and its client.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--socket", default=None, help="Unix socket path instead of a TCP port")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the service")
+    serve_parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Worker processes")
+    serve_parser.add_argument("--max-queued", type=int, default=MAX_QUEUED,
+                              help="Jobs waiting for a worker before new ones are refused with 503")
+    serve_parser.add_argument("--spool", default=SPOOL_DIR, help="Directory for uploads and results")
+    serve_parser.add_argument("--metric-backend", choices=["pymeshlab", "kdtree"],
+                              default=experiment_runner.METRIC_BACKEND)
+
+    submit_parser = commands.add_parser("submit", help="Decimate a mesh with a running service")
+    submit_parser.add_argument("mesh", help=f"Mesh file ({', '.join(UPLOAD_FORMATS)})")
+    submit_parser.add_argument("--algorithm", default="QEM")
+    submit_parser.add_argument("--keep", default="0.5", help="Fractions of faces to keep, e.g. 0.5,0.1")
+    submit_parser.add_argument("--params", default=None, help="Algorithm parameter overrides as JSON")
+    submit_parser.add_argument("--output", default=None,
+                               help="Directory to save the decimated meshes in (binary pairs, see mesh_io.py)")
+
+    commands.add_parser("health", help="Print the service status")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.socket, spool_dir=args.spool, num_workers=args.workers,
+                              max_queued=args.max_queued, metric_backend=args.metric_backend))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    client = DecimationClient(args.host, args.port, args.socket)
+    if args.command == "health":
+        print(json.dumps(client.health(), indent=2))
+        sys.exit(0)
+
+    keep = [float(k) for k in args.keep.split(",")]
+    failed = False
+    for event in client.decimate(args.mesh, args.algorithm, keep, json.loads(args.params) if args.params else None):
+        if event['event'] == 'accepted':
+            print(f"Accepted {len(event['jobs'])} job(s) for mesh {event['mesh_hash'][:12]}")
+        elif event['event'] == 'error':
+            failed = True
+            print(f"\033[91m  keep={event['keep']}: {event['error']}\033[0m")
+        else:
+            row = event['metrics']
+            print(f"  keep={event['keep']}: Time={row['Time']:.4f}s, HD={row['HausdorffDist']:.6f}, "
+                  f"Faces={row['FinalFaces']} (job {event['job'][:12]})")
+            if args.output:
+                os.makedirs(args.output, exist_ok=True)
+                name = os.path.splitext(os.path.basename(args.mesh))[0]
+                path = os.path.join(args.output, f"{name}_{args.algorithm}_keep{event['keep']}.obj")
+                mesh_io.save_binary(path, *client.mesh(event['job']))
+                print(f"    saved to {mesh_io.binary_paths(path)[0]}")
+    sys.exit(1 if failed else 0)
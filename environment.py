@@ -0,0 +1,87 @@
+import contextlib
+import importlib.metadata
+import os
+import platform
+import socket
+import subprocess
+import time
+
+# Environment variables that set the thread count of native libraries
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+PACKAGES = ["pymeshlab", "numpy", "scipy"]
+
+
+def package_version(name):
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def cpu_model():
+    # "model name" from /proc/cpuinfo on Linux, else whatever platform knows
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def usable_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def git_revision(path="."):
+    # (commit SHA, dirty) of the checkout at `path`, or (None, None) outside git
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, capture_output=True,
+                             text=True, timeout=10, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                                capture_output=True, text=True, timeout=30, check=True).stdout
+        return sha, bool(status.strip())
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+
+
+@contextlib.contextmanager
+def thread_limits(threads):
+    # Sets every THREAD_ENV_VARS to `threads` for processes started inside
+    # the block (OpenMP in PyMeshLab, BLAS behind NumPy/SciPy). It has no
+    # effect on libraries this process has already initialized.
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    if threads:
+        os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def collect(**extra):
+    # What a run's timings depend on: library versions, machine, threads, code
+    sha, dirty = git_revision(os.path.dirname(os.path.abspath(__file__)))
+    info = {
+        "created_at": time.time(),
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_model": cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "usable_cores": usable_cores(),
+        "thread_env": {name: os.environ.get(name) for name in THREAD_ENV_VARS},
+        "git_sha": sha,
+        "git_dirty": dirty,
+    }
+    info.update({f"{name}_version": package_version(name) for name in PACKAGES})
+    info.update(extra)
+    return info
@@ -0,0 +1,273 @@
+import argparse
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import time
+
+import decimation_algorithms
+import instrumentation
+import timing
+from experiment_runner import (DATASET_DIRS, MESH_CACHE, MESH_TRACKER, METRIC_BACKEND, SKIP_DUPLICATES,
+                               THRESHOLD_MAX, THRESHOLD_MIN, benchmark_sources, measure_distances)
+from mesh_cache import clone_meshset
+from metrics import DISTANCE_FIELDNAMES
+from result_store import write_csv_atomic
+
+EB_RESULTS_FILE = "error_budget.csv"
+
+ALGORITHMS = ["QEM", "Clustering"]
+# Two-sided Hausdorff distance allowed, in model units (or a fraction of the
+# bounding-box diagonal with --relative)
+TOLERANCE = 0.01
+
+# The search stops once the smallest passing and the largest failing probe
+# are within FACE_RESOLUTION (relative) of each other, or after MAX_PROBES
+FACE_RESOLUTION = 0.02
+MAX_PROBES = 16
+# Bracketing steps multiply (or divide) the reduction by this much
+EXPAND = 4.0
+MIN_FACES = 4
+# First probe of every search, so a model's result does not depend on which
+# models were searched before it (or on which worker)
+START_KEEP = 0.1
+START_THRESHOLD = 1.0
+
+# One timed run per probe: the search needs the error, not a precise time
+EB_TIMING = timing.timing_config(warmups=0, min_repeats=1, max_repeats=1)
+NUM_WORKERS = 1
+
+FIELDNAMES = ['Model', 'Type', 'Algorithm', 'Tolerance', 'Met', 'InitialFaces', 'MinFaces', 'Keep', 'Threshold',
+              'Time', 'SearchTime', 'Start', 'Probes', 'Progressive', 'HausdorffDist'] + DISTANCE_FIELDNAMES
+
+def _interpolate(ok, ok_err, bad, bad_err, tolerance):
+    # Error grows roughly like a power of the reduction, so interpolate
+    # log(reduction) against log(error) between the bracket ends. Without
+    # a positive error at both ends take the log-midpoint.
+    if ok_err and bad_err and bad_err > ok_err:
+        frac = (math.log(tolerance) - math.log(ok_err)) / (math.log(bad_err) - math.log(ok_err))
+        # Keep clear of the ends so a bad model still shrinks the bracket
+        frac = min(max(frac, 0.05), 0.95)
+    else:
+        frac = 0.5
+    return math.exp(math.log(ok) + frac * (math.log(bad) - math.log(ok)))
+
+
+def search_error_budget(probe, start, lower, upper, tolerance, lower_faces, resolution=FACE_RESOLUTION,
+                        max_probes=MAX_PROBES):
+    # Largest reduction u in [lower, upper] whose error is within
+    # `tolerance`, assuming the error does not fall as u grows. probe(u)
+    # returns (error, faces). `lower` counts as passing without a probe,
+    # with `lower_faces` faces. The bracket is found by stepping from
+    # `start` by EXPAND, then narrowed by log-log interpolation.
+    # Returns (u, number of probes); u is `lower` if no probe passed.
+    ok, ok_err, ok_faces = lower, None, lower_faces
+    bad, bad_err, bad_faces = None, None, None
+    u = min(max(start, lower), upper)
+    probes = 0
+    while probes < max_probes:
+        err, faces = probe(u)
+        probes += 1
+        if err <= tolerance:
+            ok, ok_err, ok_faces = u, err, faces
+        else:
+            bad, bad_err, bad_faces = u, err, faces
+
+        if bad is None:
+            if ok >= upper:
+                break
+            u = min(upper, ok * EXPAND)
+        elif bad <= ok * (1 + 1e-4) or ok_faces - bad_faces <= resolution * ok_faces:
+            break
+        elif ok == lower and ok_err is None and bad / EXPAND > lower:
+            # Nothing has passed yet: step down before interpolating
+            u = bad / EXPAND
+        else:
+            u = _interpolate(ok, ok_err, bad, bad_err, tolerance)
+    return ok, probes
+
+
+def run_search(filepath, mesh_type, algo, tolerance, relative=False, timing_config=None,
+               metric_backend=METRIC_BACKEND, progressive=True):
+    # Fewest faces `algo` reaches on one model with a two-sided Hausdorff
+    # distance within the tolerance. One row.
+    #
+    # Target-driven algorithms search the reduction u = initial / target
+    # faces; progressive ones (QEM) decimate each probe from the smallest
+    # mesh that has passed so far instead of from the original, and Time is
+    # the chain that produced the final mesh. A chained probe that fails is
+    # decimated again from the original, which decides the probe. Threshold-driven algorithms
+    # search the cell-size threshold directly. Every probe's distance uses
+    # the original's cached MeshSet or SurfaceIndex (MESH_CACHE).
+    filename = os.path.basename(filepath)
+    start_time = time.perf_counter()
+    mesh_orig = MESH_CACHE.get(filepath)
+    initial_faces = mesh_orig.face_number()
+    if relative:
+        tolerance *= mesh_orig.bounding_box().diagonal()
+    spec = decimation_algorithms.get_algorithm(algo)
+    chained = progressive and spec['progressive']
+    threshold_driven = spec['face_control'] == decimation_algorithms.FACE_CONTROL_THRESHOLD
+    timing_config = timing_config or EB_TIMING
+
+    # Smallest passing mesh so far: the original until a probe passes
+    best = {'ms': None, 'u': None, 'time': 0.0}
+    measured = {}
+
+    def decimate(u, base, target_faces, threshold):
+        with instrumentation.span("decimate", model=filename, algorithm=algo, reduction=u):
+            stats, ms = timing.measure(
+                lambda ms_run: decimation_algorithms.apply(ms_run, algo, target_faces, threshold),
+                lambda: MESH_TRACKER.track(clone_meshset(base)),
+                config=timing_config,
+                teardown=MESH_TRACKER.release
+            )
+        with instrumentation.span("hausdorff", model=filename, algorithm=algo, reduction=u):
+            distances = measure_distances(filepath, mesh_orig, ms.current_mesh(), metric_backend)
+        return stats, ms, distances
+
+    def probe(u):
+        if threshold_driven:
+            target_faces, threshold = None, u
+        else:
+            target_faces, threshold = max(int(initial_faces / u), MIN_FACES), None
+        base_time = 0.0
+        if chained and not threshold_driven and best['ms'] is not None:
+            base_time = best['time']
+            stats, ms, distances = decimate(u, best['ms'].current_mesh(), target_faces, threshold)
+            if distances['HausdorffDist'] > tolerance:
+                # Error builds up along the chain, so a chained failure is
+                # no bound: only the original's own result counts
+                MESH_TRACKER.release(ms)
+                base_time = 0.0
+                stats, ms, distances = decimate(u, mesh_orig, target_faces, threshold)
+        else:
+            stats, ms, distances = decimate(u, mesh_orig, target_faces, threshold)
+        faces = ms.current_mesh().face_number()
+        measured[u] = (distances, faces)
+        if distances['HausdorffDist'] <= tolerance:
+            if best['ms'] is not None:
+                MESH_TRACKER.release(best['ms'])
+            best.update(ms=ms, u=u, time=base_time + stats['median'])
+        else:
+            MESH_TRACKER.release(ms)
+        return distances['HausdorffDist'], faces
+
+    if threshold_driven:
+        lower, upper, start = THRESHOLD_MIN, THRESHOLD_MAX, START_THRESHOLD
+    else:
+        lower, upper, start = 1.0, initial_faces / MIN_FACES, 1 / START_KEEP
+    _, probes = search_error_budget(probe, start, lower, upper, tolerance, initial_faces)
+    if best['ms'] is not None:
+        MESH_TRACKER.release(best['ms'])
+
+    met = best['u'] is not None or not threshold_driven
+    if best['u'] is not None:
+        distances, min_faces = measured[best['u']]
+    else:
+        # Nothing passed: a target-driven algorithm keeps the original
+        distances, min_faces = {'HausdorffDist': 0.0}, initial_faces if met else None
+
+    row = {
+        'Model': filename,
+        'Type': mesh_type,
+        'Algorithm': algo,
+        'Tolerance': tolerance,
+        'Met': met,
+        'InitialFaces': initial_faces,
+        'MinFaces': min_faces,
+        'Keep': min_faces / initial_faces if min_faces is not None else None,
+        'Threshold': best['u'] if threshold_driven else None,
+        'Time': best['time'],
+        'SearchTime': time.perf_counter() - start_time,
+        'Start': start,
+        'Probes': probes,
+        'Progressive': chained,
+    }
+    row.update(distances if met else {})
+    print(f"    {filename} {algo}: MinFaces={row['MinFaces']} (keep {row['Keep'] or 0:.4f}), "
+          f"HD={row.get('HausdorffDist') or 0:.6f} <= {tolerance:.6g}, Time={row['Time']:.4f}s, "
+          f"probes={probes}, search {row['SearchTime']:.2f}s")
+    return row
+
+
+def _run_task(task):
+    filepath, mesh_type, algo, tolerance, relative, timing_config, metric_backend, progressive = task
+    try:
+        return run_search(filepath, mesh_type, algo, tolerance, relative, timing_config, metric_backend, progressive)
+    except Exception as e:
+        print(f"\033[91m    Failed {algo} on {os.path.basename(filepath)}: {e}\033[0m")
+        return None
+
+
+def run_error_budget(tolerance=TOLERANCE, relative=False, algorithms=None, timing_config=None,
+                     metric_backend=METRIC_BACKEND, progressive=True, num_workers=NUM_WORKERS,
+                     skip_duplicates=SKIP_DUPLICATES):
+    algorithms = algorithms or ALGORITHMS
+    tasks = []
+    # Same sources as the main sweep (duplicates and decimated outputs left out)
+    sources = benchmark_sources(DATASET_DIRS, skip_duplicates)
+    for mesh_type in DATASET_DIRS:
+        files = [path for source_type, path in sources if source_type == mesh_type]
+        print(f"--- Queued {mesh_type} ({len(files)} files) ---")
+        tasks += [(filepath, mesh_type, algo, tolerance, relative, timing_config, metric_backend, progressive)
+                  for filepath in files for algo in algorithms]
+
+    rows = []
+    num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+    if num_workers > 1 and len(tasks) > 1:
+        print(f"Searching {len(tasks)} (model, algorithm) pairs on {num_workers} worker processes...")
+        ctx = multiprocessing.get_context("spawn")
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx)
+        results = pool.map(_run_task, tasks)
+    else:
+        pool = None
+        results = map(_run_task, tasks)
+    try:
+        for i, row in enumerate(results, 1):
+            if row is not None:
+                rows.append(row)
+            # Completed models survive an interrupted run
+            if i % len(algorithms) == 0:
+                write_csv_atomic(EB_RESULTS_FILE, FIELDNAMES, rows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    write_csv_atomic(EB_RESULTS_FILE, FIELDNAMES, rows)
+
+    print(f"Error-budget search complete. Results saved to {EB_RESULTS_FILE}")
+    for algo in algorithms:
+        done = [r for r in rows if r['Algorithm'] == algo and r['Met']]
+        if done:
+            print(f"  {algo}: mean keep {sum(r['Keep'] for r in done) / len(done):.4f}, "
+                  f"{sum(r['Probes'] for r in done) / len(done):.1f} probes and "
+                  f"{sum(r['SearchTime'] for r in done) / len(done):.2f}s per model")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fewest faces per model and algorithm whose two-sided "
+                                                 "Hausdorff distance stays within a tolerance.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Allowed Hausdorff distance in model units")
+    parser.add_argument("--relative", action="store_true",
+                        help="Read --tolerance as a fraction of each model's bounding-box diagonal")
+    parser.add_argument("--algorithms", default=",".join(ALGORITHMS),
+                        help="Comma-separated algorithms. Registered: " + ", ".join(decimation_algorithms.ALGORITHMS))
+    parser.add_argument("--independent", action="store_true",
+                        help="Decimate every probe from the original, even for progressive algorithms")
+    parser.add_argument("--metric-backend", choices=["pymeshlab", "kdtree"], default=METRIC_BACKEND,
+                        help="Surface distance implementation")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Worker processes (0 = one per core)")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Also run sources that duplicate another one or are decimated outputs "
+                             "(see provenance.py)")
+    args = parser.parse_args()
+
+    algorithms = [a.strip() for a in args.algorithms.split(",") if a.strip()]
+    for algo in algorithms:
+        decimation_algorithms.get_algorithm(algo)
+    run_error_budget(args.tolerance, args.relative, algorithms, EB_TIMING, args.metric_backend,
+                     progressive=not args.independent, num_workers=args.workers,
+                     skip_duplicates=not args.keep_duplicates)
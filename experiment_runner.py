@@ -1,9 +1,31 @@
 import pymeshlab
 import os
-import glob
 import time
 import csv
 import shutil
+import socket
+import argparse
+import contextlib
+import concurrent.futures
+import multiprocessing
+import json
+import math
+import statistics
+import importlib.metadata
+
+import decimation_algorithms
+import environment
+import instrumentation
+import io_pipeline
+import memory_budget
+import mesh_io
+import metrics
+import provenance
+import sharding
+import timing
+
+from mesh_cache import MeshCache, clone_meshset
+from result_store import ResultStore, job_id, job_key, write_csv_atomic
 
 # Setup paths
 DATASET_DIRS = {
@@ -12,6 +34,14 @@ DATASET_DIRS = {
 }
 RESULTS_FILE = "experiment_results.csv"
 DECIMATED_DIR = "decimated_meshes"
+THRESHOLD_CACHE_FILE = "clustering_thresholds.jsonl"  # Tuned thresholds of every threshold-driven algorithm
+STORE_FILE = "experiment_results.sqlite"
+RUN_METADATA_FILE = "experiment_results.run.json"  # Environment of the run that wrote RESULTS_FILE
+PROVENANCE_FILE = provenance.PROVENANCE_FILE  # Where saved outputs are recorded (per shard when sharded)
+
+# Skip sources that duplicate an earlier one or are decimated outputs
+# (by geometry hash, see provenance.py)
+SKIP_DUPLICATES = True
 
 # Target reduction (e.g., 50% of original face count)
 # Target reductions (Percentage of original face count to KEEP)
@@ -19,60 +49,294 @@ DECIMATED_DIR = "decimated_meshes"
 # 90% decimation -> keep 0.1
 TARGET_PERCENTAGES = [0.5, 0.1]
 
+# Algorithms to test (names registered in decimation_algorithms.py)
+ALGORITHMS = ["QEM", "Clustering"]
+
+# Time is the cost of producing a level from the original mesh. For
+# progressive rows that is cumulative over the chain, and IncrementalTime
+# (plus the TimeMin..TimeSamples stats) covers only the step from the level above.
+FIELDNAMES = (['Model', 'Type', 'Algorithm', 'Params', 'Decimation', 'Time', 'HausdorffDist', 'InitialFaces', 'FinalFaces']
+              + timing.TIMING_FIELDNAMES + ['IncrementalTime', 'Progressive'] + metrics.DISTANCE_FIELDNAMES
+              + ['PeakMemMB', 'PeakMeshMB', 'Threads'] + metrics.QUALITY_FIELDNAMES)
+
+# Surface distance backend: "pymeshlab" (get_hausdorff_distance on vertex
+# samples) or "kdtree" (metrics.py: exact distances from vertices and face
+# samples, mean/RMS/percentiles in one pass, original's index reused)
+METRIC_BACKEND = "pymeshlab"
+
+# Decimated meshes are saved as binary .npy pairs (mesh_io.py); OBJ copies are opt-in
+SAVE_OBJ = False
+# False skips saving decimated meshes altogether (pure throughput runs)
+SAVE_MESHES = True
+# Disk I/O on background threads (io_pipeline.py): the next source meshes
+# are loaded ahead and outputs and result rows are written behind. The
+# threads pause while a decimation is being timed.
+PIPELINE_IO = True
+
+# Parallel execution
+# NUM_WORKERS = 1 keeps the original serial behaviour.
+# TIMING_SLOTS caps how many workers may be inside a timed section at once,
+# so timings are not skewed by CPU contention from the other workers.
+NUM_WORKERS = 1
+TIMING_SLOTS = 1
+PIN_WORKERS = True
+
+# Intra-op threads per worker (OpenMP in PyMeshLab, BLAS in NumPy/SciPy).
+# None leaves the libraries' defaults. Several counts sweep them: every job
+# runs once per count and strong-scaling efficiency per algorithm goes to
+# THREAD_SCALING_FILE.
+THREADS = None
+THREAD_SCALING_FILE = "thread_scaling.csv"
+THREAD_SCALING_FIELDNAMES = ['Algorithm', 'Threads', 'Jobs', 'MeanTime', 'Speedup', 'Efficiency',
+                             'Workers', 'RelativeThroughput']
+
+# Source meshes are parsed once per process and cloned in memory. Every
+# MeshSet the runner creates is tracked, so each job can report its peak
+# live mesh memory (PeakMeshMB) next to its measured peak RSS (PeakMemMB).
+MESH_TRACKER = memory_budget.MeshTracker()
+MESH_CACHE = MeshCache(tracker=MESH_TRACKER)
+
+# RAM for the whole sweep in bytes (None = unbounded). With a budget the
+# worker count is chosen to fit the largest job and each worker keeps only
+# one source mesh cached.
+MEMORY_BUDGET = None
+
+# This process's io_pipeline.IOPipeline, created by the first job that uses it
+PIPELINE = None
+# Per-process provenance index, where saved outputs are recorded
+PROVENANCE = None
+
+# Threshold search for cell-size driven algorithms (e.g. Clustering)
+# Stop once the face count is within TUNING_TOLERANCE of the target.
+TUNING_TOLERANCE = 0.01
+TUNING_MAX_STEPS = 25
+# Search range of the threshold (percentage of the bounding-box diagonal)
+THRESHOLD_MIN = 0.001
+THRESHOLD_MAX = 20.0
+# Face counts jump at some thresholds; give up once the bracket is this tight (relative)
+THRESHOLD_RESOLUTION = 1e-4
+THRESHOLD_LOCK_STALE = 60  # Seconds after which a threshold cache lock is considered abandoned
+
 def get_face_count(ms):
     return ms.current_mesh().face_number()
 
-def tune_clustering_threshold(filepath, target_faces):
-    min_t = 0.001
-    max_t = 20.0
+# This process's copy of the threshold cache and how far the file has been read
+_THRESHOLD_CACHE = {'path': None, 'offset': 0, 'entries': {}}
+
+def load_threshold_cache():
+    # {cache key: threshold}. The file is an append-only log of JSON lines,
+    # read once per process; later calls only read what other workers and
+    # nodes appended since.
+    cache = _THRESHOLD_CACHE
+    if cache['path'] != THRESHOLD_CACHE_FILE:
+        cache.update(path=THRESHOLD_CACHE_FILE, offset=0, entries={})
+    try:
+        with open(THRESHOLD_CACHE_FILE, 'rb') as f:
+            f.seek(cache['offset'])
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                cache['offset'] += len(line)
+                try:
+                    entry = json.loads(line)
+                    cache['entries'][entry['key']] = entry['threshold']
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return cache['entries']
+
+@contextlib.contextmanager
+def threshold_cache_lock():
+    # Lock file around the cache's read-modify-write. Worker processes and
+    # shard nodes on a shared filesystem all update the same file; O_EXCL
+    # creation is atomic on both. A lock older than THRESHOLD_LOCK_STALE
+    # was left by a crashed process and is broken.
+    lock_path = f"{THRESHOLD_CACHE_FILE}.lock"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > THRESHOLD_LOCK_STALE:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.05)
+    try:
+        os.write(fd, f"{socket.gethostname()} {os.getpid()}".encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(lock_path)
+
+def save_threshold_cache(entries):
+    # Appends the new entries only; the lock keeps lines of other workers
+    # and nodes from interleaving on shared filesystems
+    lines = "".join(json.dumps({'key': key, 'threshold': threshold}) + "\n" for key, threshold in entries.items())
+    with threshold_cache_lock():
+        with open(THRESHOLD_CACHE_FILE, 'a') as f:
+            f.write(lines)
+    load_threshold_cache().update(entries)
+
+def tune_threshold(filepath, target_faces, algo="Clustering", params=None, tolerance=TUNING_TOLERANCE):
+    # Searches the cell-size threshold of a threshold-driven algorithm until
+    # it produces ~target_faces. Larger thresholds give fewer faces.
+    params_key = json.dumps(decimation_algorithms.resolve_params(algo, params), sort_keys=True)
+    mesh_key = f"{MESH_CACHE.content_hash(filepath)}:{algo}:{params_key}"
+    # The tolerance decides where the search stops, so it is part of the key
+    cache_key = f"{mesh_key}:{target_faces}:{tolerance}"
+    cached = load_threshold_cache().get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Probes of earlier targets on the same mesh bracket this search
+    probes = _THRESHOLD_PROBES.setdefault(mesh_key, {})
+    best_t = search_threshold(MESH_CACHE.get(filepath), target_faces, algo, params, tolerance, probes)
+    save_threshold_cache({cache_key: best_t})
+    return best_t
+
+# threshold -> face count of every probe made in this process, per mesh/algorithm
+_THRESHOLD_PROBES = {}
+
+def _interpolate_threshold(lo, hi, probes, target_faces):
+    # Face count falls roughly like a power of the threshold, so interpolate
+    # log(threshold) against log(faces) between the bracket ends. Without
+    # both ends probed (or on a degenerate bracket) take the log-midpoint.
+    f_lo, f_hi = probes.get(lo), probes.get(hi)
+    if f_lo and f_hi and f_lo > f_hi and target_faces > 0:
+        frac = (math.log(f_lo) - math.log(target_faces)) / (math.log(f_lo) - math.log(f_hi))
+        # Keep clear of the ends so a bad model still shrinks the bracket
+        frac = min(max(frac, 0.05), 0.95)
+    else:
+        frac = 0.5
+    return math.exp(math.log(lo) + frac * (math.log(hi) - math.log(lo)))
+
+def search_threshold(mesh, target_faces, algo="Clustering", params=None, tolerance=TUNING_TOLERANCE,
+                     probes=None, guess=None):
+    # The uncached search behind tune_threshold. Every probe runs on an
+    # in-memory copy of `mesh` and is recorded in `probes` (threshold ->
+    # faces); pass the same dict for several targets on one mesh and the
+    # earlier probes bracket the later searches. `guess` is tried first.
+    probes = {} if probes is None else probes
+
+    # Bracket: lo leaves too many faces, hi too few
+    lo, hi = THRESHOLD_MIN, THRESHOLD_MAX
+    for t, faces in probes.items():
+        if faces >= target_faces and t > lo:
+            lo = t
+        elif faces < target_faces and t < hi:
+            hi = t
+
     best_t = 0.1
     best_diff = float('inf')
-    
-    # Binary search (approximate)
-    for _ in range(25):
-        mid_t = (min_t + max_t) / 2
-        
+    for t, faces in probes.items():
+        if abs(faces - target_faces) < best_diff:
+            best_t, best_diff = t, abs(faces - target_faces)
+    if best_diff <= tolerance * target_faces:
+        return best_t
+
+    t = guess
+    for _ in range(TUNING_MAX_STEPS):
+        if hi <= lo * (1 + THRESHOLD_RESOLUTION):
+            # The target lies in a jump of the face count; best_t is as close as it gets
+            break
+        if t is None or not lo < t < hi:
+            t = _interpolate_threshold(lo, hi, probes, target_faces)
+
         # Test this threshold
-        ms_test = pymeshlab.MeshSet()
-        ms_test.load_new_mesh(filepath)
-        ms_test.meshing_decimation_clustering(threshold=pymeshlab.PercentageValue(mid_t))
-        
-        res_faces = ms_test.current_mesh().face_number()
+        if t not in probes:
+            ms_test = _clone(mesh)
+            decimation_algorithms.apply(ms_test, algo, target_faces, t, params)
+            probes[t] = ms_test.current_mesh().face_number()
+            MESH_TRACKER.release(ms_test)
+        res_faces = probes[t]
         diff = abs(res_faces - target_faces)
-        
+
         if diff < best_diff:
             best_diff = diff
-            best_t = mid_t
-        
+            best_t = t
+
+        # Close enough to the target face count, stop early
+        if diff <= tolerance * target_faces:
+            break
+
         if res_faces < target_faces:
             # Too aggressive (too few faces) -> Reduce threshold (smaller cells)
-            max_t = mid_t
+            hi = t
         else:
             # Too many faces -> Increase threshold (larger cells)
-            min_t = mid_t
-            
+            lo = t
+        t = None
+
     return best_t
 
-def apply_algorithm(ms, algo_name, target_faces, clustering_threshold=None):
-    if algo_name == "QEM":
-        ms.meshing_decimation_quadric_edge_collapse(
-            targetfacenum=target_faces,
-            preservenormal=True,
-            preserveboundary=True,
-            preservetopology=True,
-            qualitythr=0.3,
-            optimalplacement=True
-        )
-    elif algo_name == "Clustering":
-        # Vertex Clustering
-        # Use provided threshold or default to 0.1% if not tuned (shouldn't happen in exp)
-        t = clustering_threshold if clustering_threshold is not None else 0.1
-        ms.meshing_decimation_clustering(threshold=pymeshlab.PercentageValue(t))
-
-def run_experiment():
-    results = []
-    
-    # Clear decimated_meshes directory
+def _clone(mesh):
+    return MESH_TRACKER.track(clone_meshset(mesh))
+
+def algorithm_params(algo_name, overrides=None):
+    # Settings that affect an algorithm's output; part of each result's key
+    params = decimation_algorithms.resolve_params(algo_name, overrides)
+    if decimation_algorithms.get_algorithm(algo_name)['face_control'] == decimation_algorithms.FACE_CONTROL_THRESHOLD:
+        params['tuning_tolerance'] = TUNING_TOLERANCE
+    return params
+
+def apply_algorithm(ms, algo_name, target_faces, threshold=None, params=None):
+    decimation_algorithms.apply(ms, algo_name, target_faces, threshold, params)
+
+def prepare_algorithm(filepath, algo_name, target_faces, params=None):
+    # Face-count control: threshold-driven algorithms get their threshold
+    # tuned for this target; target-driven ones need nothing (None)
+    if decimation_algorithms.get_algorithm(algo_name)['face_control'] == decimation_algorithms.FACE_CONTROL_THRESHOLD:
+        return tune_threshold(filepath, target_faces, algo_name, params)
+    return None
+
+def measure_distances(filepath, mesh_orig, mesh_dec, backend=METRIC_BACKEND):
+    # Two-sided surface distance between the original and decimated mesh.
+    # Returns the HausdorffDist / MeanDist / RMSDist / P95Dist / P99Dist columns.
+    if backend == "kdtree":
+        # Exact distances from vertices and area-weighted face samples; the
+        # original's index is built once per model and reused
+        index_orig = MESH_CACHE.surface_index(filepath)
+        index_dec = metrics.SurfaceIndex.from_mesh(mesh_dec)
+        return metrics.distance_columns(metrics.surface_distance(index_orig, index_dec))
+
+    # The decimated mesh goes in as a temporary layer of the cached original
+    # rather than copying both into a new MeshSet, and is deleted right
+    # after. The original stays current: filter defaults are taken from it.
+    ms_src = MESH_CACHE.meshset(filepath)
+    orig_id = ms_src.current_mesh_id()
+    ms_src.add_mesh(mesh_dec)
+    dec_id = ms_src.current_mesh_id()
+    MESH_TRACKER.track(ms_src)
+    try:
+        ms_src.set_current_mesh(orig_id)
+
+        # 1. Processed -> Original
+        res1 = ms_src.get_hausdorff_distance(sampledmesh=dec_id, targetmesh=orig_id)
+
+        # 2. Original -> Processed
+        res2 = ms_src.get_hausdorff_distance(sampledmesh=orig_id, targetmesh=dec_id)
+    finally:
+        ms_src.set_current_mesh(dec_id)
+        ms_src.delete_current_mesh()
+        ms_src.set_current_mesh(orig_id)
+        MESH_TRACKER.track(ms_src)
+
+    n1, n2 = res1['n_samples'], res2['n_samples']
+    n = max(n1 + n2, 1)
+    return {
+        'HausdorffDist': max(res1['max'], res2['max']),
+        'MeanDist': (res1['mean'] * n1 + res2['mean'] * n2) / n,
+        'RMSDist': ((res1['RMS'] ** 2 * n1 + res2['RMS'] ** 2 * n2) / n) ** 0.5,
+        # PyMeshLab only reports max/mean/RMS
+        'P95Dist': None,
+        'P99Dist': None
+    }
+
+def clear_decimated_dir():
     if os.path.exists(DECIMATED_DIR):
         print("Clearing decimated_meshes directory...")
         for filename in os.listdir(DECIMATED_DIR):
@@ -87,119 +351,766 @@ def run_experiment():
     else:
         os.makedirs(DECIMATED_DIR)
 
-    # Prepare CSV
-    with open(RESULTS_FILE, 'w', newline='') as csvfile:
-        fieldnames = ['Model', 'Type', 'Algorithm', 'Decimation', 'Time', 'HausdorffDist', 'InitialFaces', 'FinalFaces']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for mesh_type, dir_path in DATASET_DIRS.items():
-            files = glob.glob(os.path.join(dir_path, "*.obj"))
-            print(f"--- Processing {mesh_type} ({len(files)} files) ---")
-            
-            for filepath in files:
-                filename = os.path.basename(filepath)
-                    
-                print(f"Processing {filename}...")
-                
-                # Load original mesh to get baseline
-                ms_orig = pymeshlab.MeshSet()
-                ms_orig.load_new_mesh(filepath)
-                initial_faces = get_face_count(ms_orig)
-                
-                for target_pct in TARGET_PERCENTAGES:
-                    target_faces = int(initial_faces * target_pct)
-                    decimation_label = f"{int((1-target_pct)*100)}pct"
-                    print(f"  Target: {decimation_label} Decimation ({target_faces} faces)")
-                    
-                    # Algorithms to test
-                    algorithms = ["QEM", "Clustering"]
-                    
-                    for algo in algorithms:
-                        try:
-                            # Tune parameters if needed
-                            clustering_threshold = None
-                            if algo == "Clustering":
-                                clustering_threshold = tune_clustering_threshold(filepath, target_faces)
-                            
-                            # Warm-up run (if needed, to load libraries/caches)
-                            # For simple scripts, this might be overkill, but good practice.
-                            # We'll run once without timing.
-                            print(f"    Running {algo}...", end='', flush=True)
-                            ms = pymeshlab.MeshSet()
-                            ms.load_new_mesh(filepath)
-                            apply_algorithm(ms, algo, target_faces, clustering_threshold)
-                        
-                        # Measure Time (Average of N runs)
-                            NUM_REPEATS = 1
-                            total_time = 0
-                            
-                            for _ in range(NUM_REPEATS):
-                                # Reload mesh for each run to ensure identical starting state
-                                ms_timing = pymeshlab.MeshSet()
-                                ms_timing.load_new_mesh(filepath)
-                                
-                                start_time = time.perf_counter_ns()
-                                apply_algorithm(ms_timing, algo, target_faces, clustering_threshold)
-                                end_time = time.perf_counter_ns()
-                                total_time += (end_time - start_time)
-                            
-                            # Convert nanoseconds to seconds for consistency with analysis
-                            execution_time = (total_time / NUM_REPEATS) / 1e9
-                            
-                            # Final application for geometric analysis (using the last run's result)
-                            # We can just use the ms from the last iteration or reload one last time.
-                            # Let's reload to be safe and consistent with the "FinalFaces" count.
-                            ms = pymeshlab.MeshSet()
-                            ms.load_new_mesh(filepath)
-                            apply_algorithm(ms, algo, target_faces, clustering_threshold)
-                            
-                            final_faces = get_face_count(ms)
-                            final_verts = ms.current_mesh().vertex_number()
-                            
-                            # Save the decimated mesh
-                            output_dir = "./decimated_meshes"
-                            os.makedirs(output_dir, exist_ok=True)
-                            name_only = os.path.splitext(filename)[0]
-                            save_path = os.path.join(output_dir, f"{name_only}_{algo}_{decimation_label}.obj")
-                            ms.save_current_mesh(save_path)
-                            
-                            # Measure Hausdorff Distance (Two-Sided)
-                            # Create a clean MeshSet to ensure correct layer indices
-                            ms_hd = pymeshlab.MeshSet()
-                            ms_hd.load_new_mesh(save_path)  # Layer 0: Decimated
-                            ms_hd.load_new_mesh(filepath)   # Layer 1: Original
-                            
-                            # 1. Processed -> Original
-                            res1 = ms_hd.get_hausdorff_distance(sampledmesh=0, targetmesh=1)
-                            hd1 = res1['max']
-                            
-                            # 2. Original -> Processed
-                            res2 = ms_hd.get_hausdorff_distance(sampledmesh=1, targetmesh=0)
-                            hd2 = res2['max']
-                            
-                            hausdorff_dist = max(hd1, hd2)
-                            
-                            # Record result
-                            row = {
-                                'Model': filename,
-                                'Type': mesh_type,
-                                'Algorithm': algo,
-                                'Decimation': decimation_label,
-                                'Time': execution_time,
-                                'HausdorffDist': hausdorff_dist,
-                                'InitialFaces': initial_faces,
-                                'FinalFaces': final_faces
-                            }
-                            writer.writerow(row)
-                            results.append(row)
-                            print(f"    {algo}: Time={execution_time:.4f}s, HD={hausdorff_dist:.6f}, Faces={final_faces}")
-                        
-                        except Exception as e:
-                            # Print error in RED
-                            print(f"\033[91m    Failed {algo} on {filename}: {e}\033[0m")
-
-    print(f"Experiment complete. Results saved to {RESULTS_FILE}")
+def parse_dataset_dirs(entries):
+    # ["clean_cad=./dataset/clean_cad", ...] -> {mesh type: directory}
+    dataset_dirs = {}
+    for entry in entries:
+        mesh_type, sep, dir_path = entry.partition("=")
+        if not sep or not mesh_type or not dir_path:
+            raise ValueError(f"Invalid dataset {entry!r}, expected TYPE=DIR")
+        dataset_dirs[mesh_type] = dir_path
+    return dataset_dirs
+
+def benchmark_sources(dataset_dirs=None, skip_duplicates=SKIP_DUPLICATES, readonly=False):
+    # [(mesh_type, path)] of the models to benchmark. With skip_duplicates,
+    # the sources provenance.filter_sources rejects are left out.
+    # readonly leaves the provenance index untouched (shard nodes).
+    models = sharding.list_models(dataset_dirs or DATASET_DIRS)
+    if not skip_duplicates:
+        return models
+    with provenance.ProvenanceIndex(PROVENANCE_FILE, readonly=readonly) as index:
+        kept, skipped = provenance.filter_sources(models, index)
+    for path, reason in skipped.items():
+        print(f"Skipping {path}: {reason}")
+    return kept
+
+def build_jobs(timing_config=None, metric_backend=METRIC_BACKEND, algorithms=None, grid=False, save_obj=SAVE_OBJ,
+               progressive=False, thread_counts=None, dataset_dirs=None, models=None,
+               skip_duplicates=SKIP_DUPLICATES):
+    # One job per (model, decimation level, algorithm, parameter set), in the
+    # same order the serial runner has always used. The CSV is written in
+    # this order. With grid=True every combination of each algorithm's
+    # parameter grid is swept; otherwise only the defaults are run.
+    # With progressive=True, algorithms that support it get one job per
+    # model covering every level, after that model's single-level jobs.
+    # With thread_counts, the whole list is repeated once per count.
+    # `models` is the [(mesh_type, path)] sources to sweep (one shard's);
+    # by default benchmark_sources(dataset_dirs, skip_duplicates).
+    algorithms = algorithms or ALGORITHMS
+    dataset_dirs = dataset_dirs or DATASET_DIRS
+    if models is None:
+        models = benchmark_sources(dataset_dirs, skip_duplicates)
+    variants = [
+        (algo, overrides)
+        for algo in algorithms
+        for overrides in (decimation_algorithms.param_grid(algo) if grid else [{}])
+    ]
+    jobs = []
+    for mesh_type in dataset_dirs:
+        files = [path for source_type, path in models if source_type == mesh_type]
+        print(f"--- Queued {mesh_type} ({len(files)} files) ---")
+        for filepath in files:
+            for target_pct in TARGET_PERCENTAGES:
+                for algo, overrides in variants:
+                    if progressive and decimation_algorithms.get_algorithm(algo)['progressive']:
+                        continue
+                    jobs.append({
+                        'mesh_type': mesh_type,
+                        'filepath': filepath,
+                        'target_pct': target_pct,
+                        'algo': algo,
+                        'params': overrides,
+                        'timing': timing_config,
+                        'metric_backend': metric_backend,
+                        'save_obj': save_obj
+                    })
+            if progressive:
+                for algo, overrides in variants:
+                    if not decimation_algorithms.get_algorithm(algo)['progressive']:
+                        continue
+                    jobs.append({
+                        'mesh_type': mesh_type,
+                        'filepath': filepath,
+                        'target_pcts': sorted(TARGET_PERCENTAGES, reverse=True),
+                        'progressive': True,
+                        'algo': algo,
+                        'params': overrides,
+                        'timing': timing_config,
+                        'metric_backend': metric_backend,
+                        'save_obj': save_obj
+                    })
+    return [dict(job, threads=threads) for threads in (thread_counts or [None]) for job in jobs]
+
+def _level_label(target_pct):
+    return f"{int((1-target_pct)*100)}pct"
+
+def decimated_path(job, target_pct):
+    # Where a level of `job` is saved (binary pair named after this path);
+    # jobs may name the file themselves with 'save_path'
+    if job.get('save_path'):
+        return job['save_path']
+    name_only = os.path.splitext(os.path.basename(job['filepath']))[0]
+    params_label = decimation_algorithms.params_label(job.get('params') or {})
+    variant = f"{job['algo']}_{params_label}" if params_label else job['algo']
+    return os.path.join(DECIMATED_DIR, f"{name_only}_{variant}_{_level_label(target_pct)}.obj")
+
+def _finish_level(job, target_pct, mesh_orig, ms, stats, extra=None):
+    # Saves the decimated mesh in `ms`, measures its distance to the original
+    # and returns the result row for one level of `job`
+    filepath = job['filepath']
+    filename = os.path.basename(filepath)
+    algo = job['algo']
+    params_label = decimation_algorithms.params_label(job.get('params') or {})
+    decimation_label = _level_label(target_pct)
+
+    mesh_dec = ms.current_mesh()
+    final_faces = mesh_dec.face_number()
+
+    # Save the decimated mesh (binary cache; OBJ only with --save-obj).
+    # With the I/O pipeline the binary pair is written by the writer
+    # thread; OBJ export needs PyMeshLab and stays on this thread.
+    if job.get('save', SAVE_MESHES):
+        with instrumentation.span("save", model=filename, algorithm=algo):
+            save_path = decimated_path(job, target_pct)
+            os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+            geometry = provenance.mesh_geometry_hash(mesh_dec)
+
+            def record():
+                # Lineage of the output, so it is never benchmarked as a
+                # source; only once the files exist
+                _provenance(job.get('provenance_file')).record(save_path, geometry, "decimated", parent=filepath, faces=final_faces,
+                                     algorithm=algo, params=params_label, target=target_pct)
+
+            if job.get('pipeline_io') and not job.get('save_obj', SAVE_OBJ):
+                _io_pipeline().save_mesh(save_path, mesh_dec, then=record)
+            else:
+                mesh_io.save_meshset(ms, save_path, obj=job.get('save_obj', SAVE_OBJ))
+                record()
+
+    # Measure Hausdorff Distance (Two-Sided)
+    metric_backend = job.get('metric_backend', METRIC_BACKEND)
+    with instrumentation.span("hausdorff", model=filename, algorithm=algo, backend=metric_backend):
+        distances = measure_distances(filepath, mesh_orig, mesh_dec, metric_backend)
+    hausdorff_dist = distances['HausdorffDist']
+
+    # Aspect ratio, normal deviation, manifoldness, area and volume change
+    # in one NumPy pass; the original's side is computed once per model
+    with instrumentation.span("quality", model=filename, algorithm=algo):
+        quality = metrics.quality_columns(MESH_CACHE.mesh_properties(filepath),
+                                          metrics.MeshProperties.from_mesh(mesh_dec))
+
+    row = {
+        'Model': filename,
+        'Type': job['mesh_type'],
+        'Algorithm': algo,
+        'Params': params_label,
+        'Decimation': decimation_label,
+        'Time': stats['median'],
+        'HausdorffDist': hausdorff_dist,
+        'InitialFaces': mesh_orig.face_number(),
+        'FinalFaces': final_faces
+    }
+    row.update(timing.timing_columns(stats))
+    row.update(IncrementalTime=stats['median'], Progressive=False, Threads=job.get('threads'))
+    row.update(extra or {})
+    row.update(distances)
+    row.update(quality)
+    print(f"    {filename} {decimation_label} {algo}{' ' + params_label if params_label else ''}: "
+          f"Time={row['Time']:.4f}s, HD={hausdorff_dist:.6f}, Faces={final_faces}")
+    return row
+
+def run_job(job):
+    filepath = job['filepath']
+    target_pct = job['target_pct']
+    algo = job['algo']
+    params = job.get('params') or {}
+    filename = os.path.basename(filepath)
+
+    try:
+        _start_memory_window()
+        # Every stage is a span so traces show where a job's wall clock goes
+        with instrumentation.span("job", cat="job", profile=False, model=filename, algorithm=algo,
+                                  params=decimation_algorithms.params_label(params), target=target_pct) as job_span:
+            # Original mesh, parsed once and shared by every pass below
+            with instrumentation.span("load", model=filename):
+                mesh_orig = MESH_CACHE.get(filepath)
+            target_faces = int(mesh_orig.face_number() * target_pct)
+
+            # Tune parameters if needed
+            with instrumentation.span("tune", model=filename, algorithm=algo):
+                threshold = prepare_algorithm(filepath, algo, target_faces, params)
+
+            # Warm-up, then repeated timed runs on fresh in-memory copies so
+            # every run starts from an identical state. Only TIMING_SLOTS
+            # workers may be inside a timed section at once.
+            with instrumentation.span("decimate", model=filename, algorithm=algo):
+                stats, ms = timing.measure(
+                    lambda ms_run: apply_algorithm(ms_run, algo, target_faces, threshold, params),
+                    lambda: _clone(mesh_orig),
+                    config=job.get('timing'),
+                    guard=_timing_slot,
+                    teardown=MESH_TRACKER.release
+                )
+
+            # The last timed run starts from the same state as any other run,
+            # so its result is used for the geometric analysis.
+            row = _finish_level(job, target_pct, mesh_orig, ms, stats)
+            row.update(_memory_columns(job_span))
+
+            with instrumentation.span("cleanup", model=filename, algorithm=algo):
+                MESH_TRACKER.release(ms)
+        return row
+
+    except Exception as e:
+        # Print error in RED. A failed job never stops the sweep.
+        print(f"\033[91m    Failed {algo} on {filename}: {e}\033[0m")
+        return None
+
+def run_progressive_job(job):
+    # All levels of job['target_pcts'] from one simplification pass: each
+    # level continues from the previous level's mesh. Per level, the timed
+    # repeats cover only the step from the previous level (IncrementalTime);
+    # Time is the cumulative cost of reaching the level from the original.
+    # Returns one row (or None) per level, in job['target_pcts'] order.
+    filepath = job['filepath']
+    algo = job['algo']
+    params = job.get('params') or {}
+    filename = os.path.basename(filepath)
+    rows = []
+
+    try:
+        _start_memory_window()
+        with instrumentation.span("job", cat="job", profile=False, model=filename, algorithm=algo,
+                                  params=decimation_algorithms.params_label(params), progressive=True) as job_span:
+            with instrumentation.span("load", model=filename):
+                mesh_orig = MESH_CACHE.get(filepath)
+            initial_faces = mesh_orig.face_number()
+
+            ms_prev = None
+            cumulative = 0.0
+            for target_pct in job['target_pcts']:
+                target_faces = int(initial_faces * target_pct)
+                base = mesh_orig if ms_prev is None else ms_prev.current_mesh()
+                with instrumentation.span("decimate", model=filename, algorithm=algo, target=target_pct):
+                    stats, ms = timing.measure(
+                        lambda ms_run: apply_algorithm(ms_run, algo, target_faces, None, params),
+                        lambda: _clone(base),
+                        config=job.get('timing'),
+                        guard=_timing_slot,
+                        teardown=MESH_TRACKER.release
+                    )
+                if ms_prev is not None:
+                    MESH_TRACKER.release(ms_prev)
+                cumulative += stats['median']
+                rows.append(_finish_level(job, target_pct, mesh_orig, ms, stats, {
+                    'Time': cumulative,
+                    'IncrementalTime': stats['median'],
+                    'Progressive': True,
+                }))
+                # Peak so far: each level's row covers the chain down to it
+                rows[-1].update(_memory_columns(job_span))
+                ms_prev = ms
+            MESH_TRACKER.release(ms_prev)
+        return rows
+
+    except Exception as e:
+        print(f"\033[91m    Failed progressive {algo} on {filename}: {e}\033[0m")
+        return rows + [None] * (len(job['target_pcts']) - len(rows))
+
+def _start_memory_window():
+    # Per-job peaks: reset the RSS high-water mark and the tracker's peak
+    instrumentation.reset_peak_rss()
+    MESH_TRACKER.reset_peak()
+
+def _memory_columns(job_span):
+    peak_kb = instrumentation.open_span_peak_rss_kb(job_span)
+    return {
+        'PeakMemMB': peak_kb / 1024 if peak_kb else None,
+        'PeakMeshMB': MESH_TRACKER.peak_bytes / (1 << 20),
+    }
+
+def job_levels(job):
+    # One single-level job per row a job produces (for keys and CSV views)
+    if job.get('progressive'):
+        return [dict(job, target_pct=pct) for pct in job['target_pcts']]
+    return [job]
+
+def _io_pipeline():
+    global PIPELINE
+    if PIPELINE is None:
+        PIPELINE = io_pipeline.IOPipeline()
+        MESH_CACHE.prefetcher = PIPELINE
+    return PIPELINE
+
+def _provenance(path=None):
+    global PROVENANCE
+    path = path or PROVENANCE_FILE
+    if PROVENANCE is None or PROVENANCE.path != path:
+        if PROVENANCE is not None:
+            PROVENANCE.close()
+        PROVENANCE = provenance.ProvenanceIndex(path)
+    return PROVENANCE
+
+def upcoming_meshes(jobs, depth=io_pipeline.PREFETCH_DEPTH):
+    # Per job, the next `depth` source meshes after its own in run order
+    order = list(dict.fromkeys(job['filepath'] for job in jobs))
+    position = {path: i for i, path in enumerate(order)}
+    return [order[position[job['filepath']] + 1:position[job['filepath']] + 1 + depth] for job in jobs]
+
+def run_task(job):
+    # Rows of a job, aligned with job_levels(job); failed levels are None
+    if job.get('pipeline_io'):
+        # Loads overlap with this job's compute
+        _io_pipeline().prefetch(job.get('prefetch') or [])
+    if job.get('memory_bounded'):
+        # Jobs come grouped by model, so one cached source mesh is enough
+        MESH_CACHE.max_meshes = 1
+        MESH_CACHE.trim()
+    rows = run_progressive_job(job) if job.get('progressive') else [run_job(job)]
+    if job.get('pipeline_io') and PIPELINE is not None:
+        # The job's meshes were written while its distances were measured;
+        # a row whose mesh is missing on disk counts as failed
+        try:
+            PIPELINE.wait_saves()
+        except Exception as e:
+            print(f"\033[91m    Failed to save decimated meshes of {os.path.basename(job['filepath'])}: {e}\033[0m")
+            return [None] * len(rows)
+    return rows
+
+# --- Worker process state (parallel mode) ---
+_TIMING_SLOTS = None
+
+@contextlib.contextmanager
+def _timing_slot():
+    # At most TIMING_SLOTS workers time at once, and this process's
+    # background I/O waits while it does
+    with (_TIMING_SLOTS or contextlib.nullcontext()), \
+            (PIPELINE.quiet() if PIPELINE is not None else contextlib.nullcontext()):
+        yield
+
+def _init_worker(timing_slots, core_queue):
+    global _TIMING_SLOTS
+    _TIMING_SLOTS = timing_slots
+
+    # Pin this worker to its own cores (one per intra-op thread) so timed
+    # sections do not migrate or share cores with other workers
+    if core_queue is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, set(core_queue.get_nowait()))
+        except Exception:
+            pass
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def iter_results_parallel(jobs, num_workers, timing_slots=TIMING_SLOTS, pin_cores=PIN_WORKERS, threads=None):
+    # Yields (job, rows) in job order, no matter which worker finishes first.
+    # With `threads`, workers start with the thread environment variables
+    # set to it and are pinned to that many cores each.
+    ctx = multiprocessing.get_context("spawn")
+    slots = ctx.Semaphore(timing_slots) if timing_slots else None
+
+    core_queue = None
+    cores = _available_cores()
+    per_worker = threads or 1
+    if pin_cores and len(cores) >= num_workers * per_worker:
+        core_queue = ctx.Queue()
+        for w in range(num_workers):
+            core_queue.put(cores[w * per_worker:(w + 1) * per_worker])
+
+    with environment.thread_limits(threads), concurrent.futures.ProcessPoolExecutor(
+        max_workers=num_workers, mp_context=ctx,
+        initializer=_init_worker, initargs=(slots, core_queue)
+    ) as pool:
+        futures = {pool.submit(run_task, job): i for i, job in enumerate(jobs)}
+        finished = {}
+        next_index = 0
+
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                finished[i] = future.result()
+            except Exception as e:
+                # Worker died (e.g. a crash inside PyMeshLab); keep going
+                job = jobs[i]
+                print(f"\033[91m    Failed {job['algo']} on {os.path.basename(job['filepath'])}: {e}\033[0m")
+                finished[i] = [None] * len(job_levels(job))
+
+            while next_index in finished:
+                yield jobs[next_index], finished.pop(next_index)
+                next_index += 1
+
+def iter_results_by_threads(jobs, num_workers, thread_counts):
+    # One pool per thread count, since the setting only reaches new
+    # processes. build_jobs groups jobs by count, so job order is kept.
+    # Workers are capped so that workers x threads fits the usable cores.
+    cores = len(_available_cores())
+    for threads in thread_counts:
+        subset = [job for job in jobs if job.get('threads') == threads]
+        if not subset:
+            continue
+        workers = max(1, min(num_workers, cores // threads))
+        print(f"Running {len(subset)} jobs with {threads} thread(s) per worker on {workers} worker process(es)...")
+        yield from iter_results_parallel(subset, workers, threads=threads)
+
+def thread_scaling(results):
+    # Strong scaling per algorithm over the same jobs at every thread count.
+    # Speedup is the geometric mean over jobs of T(fewest threads) / T(threads)
+    # and Efficiency divides it by the thread ratio. RelativeThroughput
+    # estimates jobs per second on this host when its cores are split into
+    # cores // threads workers, relative to the split with the fewest threads.
+    cores = len(_available_cores())
+    times = {}
+    for row in results:
+        if row.get('Threads') in (None, ''):
+            continue
+        job = (row['Model'], row.get('Params', ''), row['Decimation'])
+        times.setdefault(row['Algorithm'], {}).setdefault(int(row['Threads']), {})[job] = float(row['Time'])
+
+    scaling = []
+    for algo, by_threads in sorted(times.items()):
+        base_threads = min(by_threads)
+        base = by_threads[base_threads]
+        for threads in sorted(by_threads):
+            shared = [j for j, t in by_threads[threads].items() if t > 0 and base.get(j, 0) > 0]
+            if not shared:
+                continue
+            speedup = math.exp(statistics.fmean(math.log(base[j] / by_threads[threads][j]) for j in shared))
+            workers = max(1, cores // threads)
+            scaling.append({
+                'Algorithm': algo,
+                'Threads': threads,
+                'Jobs': len(shared),
+                'MeanTime': statistics.fmean(by_threads[threads][j] for j in shared),
+                'Speedup': speedup,
+                'Efficiency': speedup * base_threads / threads,
+                'Workers': workers,
+                'RelativeThroughput': workers * speedup / max(1, cores // base_threads),
+            })
+    return scaling
+
+def print_thread_scaling(scaling):
+    print("\n--- Strong scaling over intra-op threads ---")
+    print(f"  {'Algorithm':<15} {'Threads':>7} {'Speedup':>8} {'Efficiency':>10} {'Workers':>7} {'Throughput':>10}")
+    for s in scaling:
+        print(f"  {s['Algorithm']:<15} {s['Threads']:>7} {s['Speedup']:>8.2f} {s['Efficiency']:>10.2f} "
+              f"{s['Workers']:>7} {s['RelativeThroughput']:>10.2f}")
+    for algo in sorted({s['Algorithm'] for s in scaling}):
+        best = max((s for s in scaling if s['Algorithm'] == algo), key=lambda s: s['RelativeThroughput'])
+        print(f"  Best split for {algo}: {best['Workers']} worker(s) x {best['Threads']} thread(s)")
+
+def library_version():
+    try:
+        return f"pymeshlab-{importlib.metadata.version('pymeshlab')}"
+    except importlib.metadata.PackageNotFoundError:
+        return "pymeshlab-unknown"
+
+def job_meta(job, version):
+    params = dict(algorithm_params(job['algo'], job['params']), metric_backend=job['metric_backend'])
+    if job.get('progressive'):
+        # A progressive level depends on the levels decimated before it
+        params['progressive_chain'] = [p for p in job['target_pcts'] if p >= job['target_pct']]
+    if job.get('threads'):
+        params['threads'] = job['threads']
+    return {
+        'mesh_hash': MESH_CACHE.content_hash(job['filepath']),
+        'algorithm': job['algo'],
+        'params': params,
+        'target': job['target_pct'],
+        'library_version': version
+    }
+
+def fastest_within_budget(results, max_hd):
+    # For each (Type, Decimation) pick the fastest (Algorithm, Params) whose
+    # mean Hausdorff distance over the models stays within max_hd.
+    groups = {}
+    for row in results:
+        key = (row['Type'], row['Decimation'], row['Algorithm'], row.get('Params', ''))
+        groups.setdefault(key, []).append(row)
+
+    best = {}
+    for (mesh_type, decimation, algo, params), rows in groups.items():
+        hd = sum(float(r['HausdorffDist']) for r in rows) / len(rows)
+        t = sum(float(r['Time']) for r in rows) / len(rows)
+        if hd > max_hd:
+            continue
+        current = best.get((mesh_type, decimation))
+        if current is None or t < current[2]:
+            best[(mesh_type, decimation)] = (algo, params, t, hd)
+    return best
+
+def print_fastest_within_budget(results, max_hd):
+    print(f"\n--- Fastest configuration with mean HausdorffDist <= {max_hd} ---")
+    best = fastest_within_budget(results, max_hd)
+    levels = sorted({(r['Type'], r['Decimation']) for r in results})
+    for mesh_type, decimation in levels:
+        found = best.get((mesh_type, decimation))
+        if found is None:
+            print(f"  {mesh_type} {decimation}: no configuration meets the budget")
+            continue
+        algo, params, t, hd = found
+        print(f"  {mesh_type} {decimation}: {algo}{' ' + params if params else ''} "
+              f"(Time={t:.4f}s, HD={hd:.6f})")
+
+def workers_for_memory(jobs, num_workers, budget_bytes):
+    # Worker count whose largest jobs fit in budget_bytes together, from
+    # face counts read without loading any mesh
+    faces = {}
+    for job in jobs:
+        if job['filepath'] not in faces:
+            faces[job['filepath']] = memory_budget.mesh_face_count(job['filepath'])
+    if not faces:
+        return num_workers
+    largest = max(faces, key=faces.get)
+    peak = max(memory_budget.job_bytes(faces[job['filepath']], job['metric_backend']) for job in jobs)
+    workers = memory_budget.workers_for_budget(budget_bytes, peak, num_workers)
+    print(f"Memory budget {budget_bytes / (1 << 30):.2f} GB: largest job ~{peak / (1 << 20):.0f} MB "
+          f"({os.path.basename(largest)}, {faces[largest]} faces) -> {workers} worker(s)")
+    if peak + memory_budget.WORKER_BASE_MB * (1 << 20) > budget_bytes:
+        print("\033[91m    Warning: the largest job alone may exceed the memory budget\033[0m")
+    return workers
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+def write_run_metadata(run_id, label, metadata, path=RUN_METADATA_FILE):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(metadata, run_id=run_id, label=label), f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def run_experiment(num_workers=NUM_WORKERS, incremental=False, timing_config=None, metric_backend=METRIC_BACKEND,
+                   algorithms=None, grid=False, max_hd=None, save_obj=SAVE_OBJ, progressive=False,
+                   memory_budget_bytes=MEMORY_BUDGET, run_label=None, thread_counts=THREADS,
+                   save_meshes=SAVE_MESHES, pipeline_io=PIPELINE_IO, shard=None, dataset_dirs=None,
+                   skip_duplicates=SKIP_DUPLICATES):
+    # Every call is recorded as a run in the store (see regression.py) with
+    # the environment it ran in and the rows it produced.
+    #
+    # shard=(index, count) runs only that shard's models (sharding.py) and
+    # writes the CSV, store and metadata to per-shard files under
+    # sharding.SHARD_DIR instead; `sharding.py merge` combines them.
+    results = []
+    results_file, store_file, metadata_file = RESULTS_FILE, STORE_FILE, RUN_METADATA_FILE
+    provenance_file = PROVENANCE_FILE
+    # Duplicates are left out before sharding, so the plan only spreads the
+    # models that run. Nodes only read the shared provenance index; run
+    # `provenance.py scan` once beforehand so they need not hash every source.
+    models = benchmark_sources(dataset_dirs, skip_duplicates, readonly=shard is not None)
+    if shard is not None:
+        results_file, store_file, metadata_file, provenance_file = (
+            sharding.shard_path(path, *shard) for path in (RESULTS_FILE, STORE_FILE, RUN_METADATA_FILE, PROVENANCE_FILE))
+        os.makedirs(sharding.SHARD_DIR, exist_ok=True)
+        shard_paths = sharding.shard_models(models, *shard)
+        models = [(mesh_type, path) for mesh_type, path in models if path in shard_paths]
+
+    if not incremental and shard is None:
+        # Clear decimated_meshes directory
+        clear_decimated_dir()
+    else:
+        # Other shards write their own models' meshes here too
+        os.makedirs(DECIMATED_DIR, exist_ok=True)
+
+    jobs = build_jobs(timing_config or timing.timing_config(), metric_backend, algorithms, grid, save_obj,
+                      progressive, thread_counts, dataset_dirs, models, skip_duplicates)
+    if memory_budget_bytes:
+        num_workers = workers_for_memory(jobs, num_workers, memory_budget_bytes)
+        for job in jobs:
+            job['memory_bounded'] = True
+    for job in jobs:
+        job.update(save=save_meshes, pipeline_io=pipeline_io, provenance_file=provenance_file)
+    version = library_version()
+    # Keys and metadata per result row; a progressive job has one per level
+    levels = [job_levels(job) for job in jobs]
+    metas = [[job_meta(level, version) for level in job_level] for job_level in levels]
+    keys = [[job_key(**meta) for meta in job_metas] for job_metas in metas]
+    ids = [[job_id(m['mesh_hash'], m['algorithm'], m['params'], m['target']) for m in job_metas]
+           for job_metas in metas]
+
+    run_id = new_run_id() + (f"-s{shard[0]}" if shard else "")
+    run_metadata = environment.collect(
+        library_version=version, workers=num_workers, metric_backend=metric_backend,
+        algorithms=algorithms or ALGORITHMS, grid=grid, progressive=progressive, threads=thread_counts,
+        save_meshes=save_meshes, pipeline_io=pipeline_io, shard=shard, skip_duplicates=skip_duplicates, timing=timing_config or timing.timing_config())
+
+    with ResultStore(store_file) as store, \
+            instrumentation.span("sweep", cat="sweep", profile=False, jobs=len(jobs), workers=num_workers):
+        # Every finished job goes into the store as soon as it completes, so
+        # an interrupted sweep can be picked up again with --incremental.
+        # Only jobs that actually run in this call are part of the run.
+        store.start_run(run_id, run_metadata, run_label)
+        pending = list(range(len(jobs)))
+        if incremental:
+            done = store.existing_keys(k for job_keys in keys for k in job_keys)
+            pending = [i for i in pending if not all(k in done for k in keys[i])]
+            print(f"Incremental run: {len(jobs) - len(pending)} of {len(jobs)} jobs already stored, {len(pending)} to run.")
+
+        todo = [jobs[i] for i in pending]
+        if pipeline_io and not memory_budget_bytes:
+            # Prefetching holds extra source meshes, so not in memory-bounded runs
+            for job, upcoming in zip(todo, upcoming_meshes(todo)):
+                job['prefetch'] = upcoming
+        # Result rows are persisted on the writer thread, behind the jobs
+        writer_io = _io_pipeline() if pipeline_io else None
+
+        if thread_counts and todo:
+            # Always in worker processes: thread settings need a fresh process
+            job_results = iter_results_by_threads(todo, num_workers, thread_counts)
+        elif num_workers > 1 and todo:
+            print(f"Running {len(todo)} jobs on {num_workers} worker processes...")
+            job_results = iter_results_parallel(todo, num_workers)
+        else:
+            print(f"Running {len(todo)} jobs serially...")
+            job_results = ((job, run_task(job)) for job in todo)
+
+        def persist(i, rows, csv_writer=None, csvfile=None):
+            for key, jid, meta, row in zip(keys[i], ids[i], metas[i], rows):
+                if row is None:
+                    continue
+                store.put(key, meta, row)
+                store.put_run_row(run_id, jid, key, row)
+                if csv_writer is not None:
+                    csv_writer.writerow(row)
+            if csvfile is not None:
+                csvfile.flush()
+
+        def persist_all(csv_writer=None, csvfile=None):
+            # Runs the jobs and stores their rows as they finish; returns the rows
+            fresh, writes = [], []
+            for i, (job, rows) in zip(pending, job_results):
+                if writer_io is not None:
+                    writes.append(writer_io.submit(persist, i, rows, csv_writer, csvfile))
+                else:
+                    persist(i, rows, csv_writer, csvfile)
+                fresh.extend(row for row in rows if row is not None)
+            if writer_io is not None:
+                writer_io.flush()
+                # Rows missing from the store and CSV fail the run (and keep
+                # a shard's partial CSV from being published)
+                failed = [w.exception() for w in writes if w.exception() is not None]
+                if failed:
+                    raise RuntimeError(f"{len(failed)} of {len(writes)} result writes failed, first: "
+                                       f"{failed[0]}") from failed[0]
+            return fresh
+
+        if incremental:
+            persist_all()
+
+            # The CSV is a view over the store, in job order. Identical meshes
+            # share stored rows, so name each row after the job it answers.
+            for job, job_keys in zip(jobs, keys):
+                for key in job_keys:
+                    row = store.get(key)
+                    if row is not None:
+                        row.update(Model=os.path.basename(job['filepath']), Type=job['mesh_type'])
+                        results.append(row)
+            store.export_csv(results_file, FIELDNAMES, results)
+        else:
+            # Prepare CSV. A shard's partial file only appears once it is
+            # complete, so a merge never picks up a half-written shard.
+            csv_path = f"{results_file}.{os.getpid()}.tmp" if shard else results_file
+            with open(csv_path, 'w', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+                writer.writeheader()
+                results.extend(persist_all(writer, csvfile))
+            if shard:
+                os.replace(csv_path, results_file)
+
+    write_run_metadata(run_id, run_label, run_metadata, metadata_file)
+    print(f"Experiment complete. Results saved to {results_file}")
+    print(f"Recorded as run {run_id}{f' ({run_label})' if run_label else ''} in {store_file}; "
+          f"environment in {metadata_file}")
+    if max_hd is not None:
+        print_fastest_within_budget(results, max_hd)
+    if thread_counts and len(thread_counts) > 1:
+        scaling = thread_scaling(results)
+        print_thread_scaling(scaling)
+        write_csv_atomic(THREAD_SCALING_FILE, THREAD_SCALING_FIELDNAMES, scaling)
+        print(f"Thread scaling saved to {THREAD_SCALING_FILE}")
+    return results
 
 if __name__ == "__main__":
-    run_experiment()
+    parser = argparse.ArgumentParser(description="Run the mesh decimation benchmark.")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Number of worker processes (1 = serial, 0 = one per core)")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Keep previous results in {STORE_FILE} and only run jobs that are not stored yet")
+    parser.add_argument("--warmups", type=int, default=timing.WARMUPS,
+                        help="Untimed warm-up runs per job")
+    parser.add_argument("--min-repeats", type=int, default=timing.MIN_REPEATS,
+                        help="Timed runs per job before the stopping rule is checked")
+    parser.add_argument("--max-repeats", type=int, default=timing.MAX_REPEATS,
+                        help="Upper bound on timed runs per job")
+    parser.add_argument("--target-rse", type=float, default=timing.TARGET_RSE,
+                        help="Stop repeating once the relative standard error is below this")
+    parser.add_argument("--time-budget", type=float, default=timing.TIME_BUDGET,
+                        help="Seconds of timed work per job before giving up on --target-rse")
+    parser.add_argument("--metric-backend", choices=["pymeshlab", "kdtree"], default=METRIC_BACKEND,
+                        help="Surface distance implementation used for HausdorffDist and friends")
+    parser.add_argument("--keep-gc", action="store_true",
+                        help="Leave the garbage collector enabled during timed runs")
+    parser.add_argument("--algorithms", default=",".join(ALGORITHMS),
+                        help="Comma-separated algorithms to run. Registered: "
+                             + ", ".join(decimation_algorithms.ALGORITHMS))
+    parser.add_argument("--grid", action="store_true",
+                        help="Sweep every combination of each algorithm's parameter grid")
+    parser.add_argument("--progressive", action="store_true",
+                        help="Produce every decimation level of progressive algorithms (QEM) from one "
+                             "simplification pass per model")
+    parser.add_argument("--save-obj", action="store_true",
+                        help=f"Also write decimated meshes as OBJ to {DECIMATED_DIR} for inspection")
+    parser.add_argument("--no-save", action="store_true",
+                        help="Do not write decimated meshes at all (pure throughput benchmarks)")
+    parser.add_argument("--sync-io", action="store_true",
+                        help="Load and save on the job's own thread instead of the background I/O pipeline")
+    parser.add_argument("--trace", default=None,
+                        help="Write per-stage span timings and peak RSS of every job to this file")
+    parser.add_argument("--trace-format", choices=instrumentation.TRACE_FORMATS, default="jsonl",
+                        help="jsonl: one record per line; chrome: load in chrome://tracing or Perfetto")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Run each traced stage under cProfile and dump .prof files here (needs --trace)")
+    parser.add_argument("--max-hd", type=float, default=None,
+                        help="Report the fastest configuration whose mean HausdorffDist is within this budget")
+    parser.add_argument("--memory-budget", type=memory_budget.parse_size, default=MEMORY_BUDGET,
+                        help="RAM for the whole sweep, e.g. 16G or 512M: caps --workers to what fits and "
+                             "keeps one source mesh per worker")
+    parser.add_argument("--threads", default=None,
+                        help="Intra-op threads per worker (OpenMP/BLAS), e.g. 1; a list such as 1,2,4 runs "
+                             f"every job at each count and writes strong-scaling efficiency to {THREAD_SCALING_FILE}")
+    parser.add_argument("--run-label", default=None,
+                        help="Name this run (e.g. pymeshlab-2025.7) to compare against it with regression.py")
+    parser.add_argument("--dataset", action="append", default=None, metavar="TYPE=DIR",
+                        help="Dataset directory per mesh type, repeatable (default: "
+                             + ", ".join(f"{k}={v}" for k, v in DATASET_DIRS.items()) + ")")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Also benchmark sources that duplicate another one or are decimated outputs "
+                             f"(see provenance.py; recorded in {provenance.PROVENANCE_FILE})")
+    parser.add_argument("--shard", default=None, metavar="INDEX/COUNT",
+                        help="Run only this shard of the models (e.g. 0/4, balanced by face count) and write "
+                             f"partial results to {sharding.SHARD_DIR}/; combine them with sharding.py merge")
+    args = parser.parse_args()
+    algorithms = [a.strip() for a in args.algorithms.split(",") if a.strip()]
+    for algo in algorithms:
+        decimation_algorithms.get_algorithm(algo)
+
+    if args.trace:
+        instrumentation.configure(args.trace, args.trace_format, args.profile_dir)
+
+    try:
+        dataset_dirs = parse_dataset_dirs(args.dataset) if args.dataset else None
+        shard = sharding.parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    thread_counts = None
+    if args.threads:
+        thread_counts = sorted({int(t) for t in args.threads.split(",") if t.strip()})
+        if not thread_counts or min(thread_counts) < 1:
+            parser.error("--threads needs positive thread counts")
+    config = timing.timing_config(
+        warmups=args.warmups,
+        min_repeats=args.min_repeats,
+        max_repeats=args.max_repeats,
+        target_rse=args.target_rse,
+        time_budget=args.time_budget,
+        disable_gc=not args.keep_gc
+    )
+    run_experiment(num_workers=workers, incremental=args.incremental, timing_config=config,
+                   metric_backend=args.metric_backend, algorithms=algorithms, grid=args.grid,
+                   max_hd=args.max_hd, save_obj=args.save_obj, progressive=args.progressive,
+                   memory_budget_bytes=args.memory_budget, run_label=args.run_label,
+                   thread_counts=thread_counts, save_meshes=not args.no_save, pipeline_io=not args.sync_io,
+                   shard=shard, dataset_dirs=dataset_dirs, skip_duplicates=not args.keep_duplicates)
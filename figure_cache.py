@@ -0,0 +1,224 @@
+import concurrent.futures
+import glob
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import types
+
+import numpy as np
+import pandas as pd
+
+import data_analysis
+
+# Parsed result tables and the hash of every rendered figure's inputs
+CACHE_DIR = ".figure_cache"
+MANIFEST_FILE = os.path.join(CACHE_DIR, "manifest.json")
+
+# Finest grouping any figure needs; coarser ones are combined from it
+CELL_KEYS = ['Type', 'Algorithm', 'Decimation']
+NUM_WORKERS = 0  # Render processes, 0 = one per core
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# --- Shared aggregate table ---
+
+def cell_moments(rows, values, keys=CELL_KEYS):
+    # One row per (Type, Algorithm, Decimation) cell with the count, mean
+    # and sum of squared deviations of every value column. Any coarser
+    # grouping's mean/std/sem follows from these (summarize) without
+    # touching the rows again.
+    grouped = rows.groupby(keys, observed=True, sort=True)
+    cells = grouped.size().rename('Rows').to_frame()
+    for col in values:
+        n = grouped[col].count()
+        cells[f'{col}_n'] = n
+        cells[f'{col}_mean'] = grouped[col].mean()
+        cells[f'{col}_m2'] = (grouped[col].var(ddof=0) * n).fillna(0.0)
+    return cells.reset_index()
+
+
+def summarize(cells, by, col):
+    # mean, std, count, sem and ci95 (1.96 sem) of `col` per `by`, as
+    # data.groupby(by)[col].agg(['mean', 'std', 'count', 'sem']) on the rows
+    # would give. Cell moments are pooled with Chan's formula.
+    n = cells[f'{col}_n'].to_numpy(dtype=float)
+    cell_mean = np.nan_to_num(cells[f'{col}_mean'].to_numpy(dtype=float))
+    grouped = cells.groupby(by, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    groups = grouped.ngroups
+    count = np.bincount(codes, weights=n, minlength=groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, weights=n * cell_mean, minlength=groups) / count
+        m2 = np.bincount(codes, weights=cells[f'{col}_m2'].to_numpy(dtype=float)
+                         + n * (cell_mean - mean[codes]) ** 2, minlength=groups)
+        std = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+        sem = std / np.sqrt(count)
+    stats = pd.DataFrame({'mean': np.where(count > 0, mean, np.nan), 'std': std, 'count': count.astype(int),
+                          'sem': sem}, index=grouped.size().index)
+    stats['ci95'] = 1.96 * stats['sem']
+    return stats
+
+
+def results_table(path=data_analysis.RESULTS_FILE, columns=data_analysis.ANALYSIS_COLUMNS, cache_dir=CACHE_DIR):
+    # (rows, cells) of a result file: the projected rows (data_analysis.load_results)
+    # and their cell_moments. Both are cached under the file's content
+    # hash, so an unchanged file is parsed and aggregated once for every
+    # figure script.
+    digest = hashlib.sha256((file_digest(path) + json.dumps(columns)).encode()).hexdigest()[:16]
+    stem = os.path.basename(path).replace('.', '_')
+    cache_path = os.path.join(cache_dir, f"{stem}-{digest}.pkl")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+
+    rows = data_analysis.load_results(path, columns)
+    values = [c for c in rows.columns if c not in CELL_KEYS and pd.api.types.is_numeric_dtype(rows[c])]
+    table = (rows, cell_moments(rows, values))
+    os.makedirs(cache_dir, exist_ok=True)
+    # Only the latest version of each result file is kept
+    for old in glob.glob(os.path.join(cache_dir, f"{stem}-*.pkl")):
+        os.remove(old)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return table
+
+
+# --- Figure builds ---
+
+def figure(output, render, *args):
+    # One figure: render(*args) writes `output`. Keep args to what the
+    # figure draws (small aggregate frames) so it is only rendered again
+    # when that changes.
+    return {'output': output, 'render': render, 'args': args}
+
+
+def _code_source(fn):
+    # Source of `fn` plus the functions and constants of its module it uses
+    # (transitively), so editing a plot or one of its parameters re-renders it
+    module = inspect.getmodule(fn)
+    parts, seen, stack = [], set(), [fn]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if not inspect.isfunction(item):
+            parts.append(repr(item))
+            continue
+        parts.append(inspect.getsource(item))
+        names, codes = set(), [item.__code__]
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            codes.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+        for name in sorted(names):
+            value = getattr(module, name, None)
+            if inspect.isfunction(value) and inspect.getmodule(value) is module:
+                stack.append(value)
+            elif isinstance(value, (str, int, float, bool, tuple, list, dict)):
+                stack.append(value)
+    return "\n".join(parts)
+
+
+def _update(h, obj):
+    # Frames by content, containers item by item, anything else by repr
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        h.update(repr((type(obj).__name__, list(obj.index.names),
+                       list(obj.columns) if isinstance(obj, pd.DataFrame) else obj.name)).encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}:{len(obj)}".encode())
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, dict):
+        h.update(f"dict:{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+    else:
+        h.update(repr(obj).encode())
+
+
+def figure_key(fig):
+    h = hashlib.sha256(_code_source(fig['render']).encode())
+    _update(h, fig['args'])
+    return h.hexdigest()
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _render(output, render, args):
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    render(*args)
+    return output
+
+
+def build(figures, num_workers=NUM_WORKERS, force=False, manifest_file=MANIFEST_FILE):
+    # Renders the figures whose output is missing or whose key (inputs and
+    # plotting code) changed since it was last rendered, on worker
+    # processes when there are several. Returns the number rendered.
+    manifest = _load_manifest(manifest_file)
+    stale = []
+    for fig in figures:
+        key = figure_key(fig)
+        name = os.path.normpath(fig['output'])
+        if force or manifest.get(name) != key or not os.path.exists(fig['output']):
+            stale.append((fig, name, key))
+    print(f"{len(figures) - len(stale)} of {len(figures)} figures up to date, rendering {len(stale)}")
+
+    def done(name, key, error=None):
+        if error is None:
+            manifest[name] = key
+        else:
+            manifest.pop(name, None)
+            print(f"\033[91m    Failed to render {name}: {error}\033[0m")
+
+    num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+    num_workers = min(num_workers, len(stale))
+    try:
+        if num_workers > 1:
+            ctx = multiprocessing.get_context("spawn")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx) as pool:
+                futures = {pool.submit(_render, fig['output'], fig['render'], fig['args']): (name, key)
+                           for fig, name, key in stale}
+                for future in concurrent.futures.as_completed(futures):
+                    done(*futures[future], future.exception())
+        else:
+            for fig, name, key in stale:
+                try:
+                    _render(fig['output'], fig['render'], fig['args'])
+                    done(name, key)
+                except Exception as e:
+                    done(name, key, e)
+    finally:
+        _save_manifest(manifest, manifest_file)
+    return len(stale)
@@ -1,65 +1,43 @@
-import pandas as pd
+import argparse
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
-import os
+import pandas as pd
+
+import figure_cache
+from figure_cache import figure, summarize
 
-# Create figures directory if it doesn't exist
-os.makedirs('Report/figures', exist_ok=True)
-
-# Read the data
-df = pd.read_csv('experiment_results.csv')
-
-# Helper function to compute stats
-def get_stats(data, group_col, value_col):
-    grouped = data.groupby([group_col, 'Algorithm'])[value_col].agg(['mean', 'std', 'count', 'sem'])
-    grouped['ci95'] = 1.96 * grouped['sem']
-    return grouped.unstack()
-
-# 1. Execution Time Bar Chart
-stats_time = get_stats(df, 'Type', 'Time')
-means = stats_time['mean']
-errs = stats_time['ci95']
-
-fig, ax = plt.subplots(figsize=(10, 6))
-means.plot(kind='bar', yerr=errs, capsize=4, ax=ax, rot=0)
-ax.set_yscale('log') # Use log scale for huge time differences
-plt.title('Execution Time by Mesh Type and Algorithm')
-plt.ylabel('Time (s) - Log Scale')
-plt.xlabel('Mesh Type')
-plt.legend(title='Algorithm')
-plt.tight_layout()
-plt.savefig('Report/figures/time_bar_chart.pdf')
-plt.close()
-
-# 2. Hausdorff Distance Bar Chart
-stats_hd = get_stats(df, 'Type', 'HausdorffDist')
-means_hd = stats_hd['mean']
-errs_hd = stats_hd['ci95']
-
-fig, ax = plt.subplots(figsize=(10, 6))
-means_hd.plot(kind='bar', yerr=errs_hd, capsize=4, ax=ax, rot=0)
-plt.title('Hausdorff Distance by Mesh Type and Algorithm')
-plt.ylabel('Hausdorff Distance')
-plt.xlabel('Mesh Type')
-plt.legend(title='Algorithm')
-plt.tight_layout()
-plt.savefig('Report/figures/hd_bar_chart.pdf')
-plt.close()
+RESULTS_FILE = 'experiment_results.csv'
+FIGURES_DIR = 'Report/figures'
+
+# Helper function to compute stats (from the shared cell table, see figure_cache)
+def get_stats(cells, group_col, value_col):
+    return summarize(cells, [group_col, 'Algorithm'], value_col).unstack()
+
+# 1./2. Bar charts of Time and Hausdorff distance by mesh type
+def plot_bar_chart(means, errs, filename, title, ylabel, log_scale=False):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    means.plot(kind='bar', yerr=errs, capsize=4, ax=ax, rot=0)
+    if log_scale:
+        ax.set_yscale('log') # Use log scale for huge time differences
+    plt.title(title)
+    plt.ylabel(ylabel)
+    plt.xlabel('Mesh Type')
+    plt.legend(title='Algorithm')
+    plt.tight_layout()
+    plt.savefig(filename)
+    plt.close()
 
 # 3. Interaction Plots (Manual implementation for Matplotlib)
-def plot_interaction(df, y_col, filename, title):
+def plot_interaction(stats, algorithms, y_col, filename, title):
+    # stats: summarize(cells, ['Algorithm', 'Type'], y_col)
     fig, ax = plt.subplots(figsize=(8, 6))
-    
-    algorithms = df['Algorithm'].unique()
-    mesh_types = df['Type'].unique()
-    
+
     for alg in algorithms:
-        subset = df[df['Algorithm'] == alg]
-        stats = subset.groupby('Type')[y_col].agg(['mean', 'sem'])
-        stats['ci95'] = 1.96 * stats['sem']
-        
-        ax.errorbar(stats.index, stats['mean'], yerr=stats['ci95'], label=alg, capsize=5, marker='o' if alg == 'QEM' else 's')
-    
+        alg_stats = stats.loc[alg]
+        ax.errorbar(alg_stats.index, alg_stats['mean'], yerr=alg_stats['ci95'], label=alg, capsize=5, marker='o' if alg == 'QEM' else 's')
+
     ax.set_title(title)
     ax.set_ylabel(y_col)
     if y_col == 'Time':
@@ -70,25 +48,18 @@ def plot_interaction(df, y_col, filename, title):
     plt.savefig(filename)
     plt.close()
 
-plot_interaction(df, 'Time', 'Report/figures/time_interaction.pdf', 'Interaction Plot: Time vs. Mesh Type & Algorithm')
-plot_interaction(df, 'HausdorffDist', 'Report/figures/hd_interaction.pdf', 'Interaction Plot: Geometric Error vs. Mesh Type & Algorithm')
-
 # 4. Decimation Faceted plots (Simplified to Interaction-like plots per decimation level or just simple bars)
 # Just creating separate plots for 50% vs 90% might be clearer or just Algorithm x Decimation
 # Let's do Algorithm x Decimation for each Type
 
-def plot_decimation_effect(df, mesh_type, y_col, filename_suffix, title_prefix):
+def plot_decimation_effect(stats, mesh_type, y_col, filename, title_prefix):
+    # stats: summarize(cells of mesh_type, ['Decimation', 'Algorithm'], y_col)
     fig, ax = plt.subplots(figsize=(8, 6))
-    subset = df[df['Type'] == mesh_type]
-    
-    algorithms = subset['Algorithm'].unique()
-    
+
     # Organize data for bar plot
-    stats = subset.groupby(['Decimation', 'Algorithm'])[y_col].agg(['mean', 'sem'])
-    stats['ci95'] = 1.96 * stats['sem']
     means = stats['mean'].unstack()
     errs = stats['ci95'].unstack()
-    
+
     means.plot(kind='bar', yerr=errs, capsize=4, ax=ax, rot=0)
     ax.set_title(f'{title_prefix} - {mesh_type}')
     ax.set_ylabel(y_col)
@@ -96,12 +67,138 @@ def plot_decimation_effect(df, mesh_type, y_col, filename_suffix, title_prefix):
         ax.set_yscale('log')
     ax.set_xlabel('Decimation Level')
     plt.tight_layout()
-    plt.savefig(f'Report/figures/{filename_suffix}_{mesh_type}.pdf')
+    plt.savefig(filename)
+    plt.close()
+
+def decimation_figures(cells, y_col, filename_suffix, title_prefix):
+    return [figure(f'{FIGURES_DIR}/{filename_suffix}_{mesh_type}.pdf', plot_decimation_effect,
+                   summarize(cells[cells['Type'] == mesh_type], ['Decimation', 'Algorithm'], y_col),
+                   mesh_type, y_col, f'{FIGURES_DIR}/{filename_suffix}_{mesh_type}.pdf', title_prefix)
+            for mesh_type in cells['Type'].unique()]
+
+# 5. Scaling curves (only if scaling_benchmark.py has been run)
+def plot_scaling(stats, fits, y_col, filename, title, ylabel):
+    # stats: mean y_col per (Algorithm, InputFaces); fits: the power-law fits of y_col
+    fig, ax = plt.subplots(figsize=(8, 6))
+
+    for alg in stats.index.get_level_values('Algorithm').unique():
+        alg_stats = stats.loc[alg].sort_index()
+        line = ax.plot(alg_stats.index, alg_stats.values, marker='o' if alg == 'QEM' else 's', linestyle='', label=alg)[0]
+
+        # Fitted power law y = c * n^k over the measured range
+        fit = fits[fits['Algorithm'] == alg]
+        if len(fit) and np.isfinite(fit['Exponent'].iloc[0]):
+            c, k = fit['Coefficient'].iloc[0], fit['Exponent'].iloc[0]
+            n = np.geomspace(alg_stats.index.min(), alg_stats.index.max(), 50)
+            ax.plot(n, c * n ** k, color=line.get_color(), label=f'{alg} fit: n^{k:.2f}')
+
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_title(title)
+    ax.set_xlabel('Input Faces')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig(filename)
     plt.close()
 
-plot_decimation_effect(df, 'clean_cad', 'Time', 'time_dec', 'Execution Time')
-plot_decimation_effect(df, 'organic_scanned', 'Time', 'time_dec', 'Execution Time')
-plot_decimation_effect(df, 'clean_cad', 'HausdorffDist', 'hd_dec', 'Hausdorff Dist')
-plot_decimation_effect(df, 'organic_scanned', 'HausdorffDist', 'hd_dec', 'Hausdorff Dist')
+def scaling_figures(scaling, fits):
+    figures = []
+    for y_col, filename, title, ylabel in [
+            ('Time', f'{FIGURES_DIR}/scaling_time.pdf', 'Decimation Time vs. Face Count', 'Time (s) - Log Scale'),
+            ('PeakMemMB', f'{FIGURES_DIR}/scaling_memory.pdf', 'Peak Memory vs. Face Count',
+             'Additional Peak RSS (MB) - Log Scale')]:
+        stats = scaling.groupby(['Algorithm', 'InputFaces'], sort=False)[y_col].mean()
+        figures.append(figure(filename, plot_scaling, stats, fits[fits['Metric'] == y_col].reset_index(drop=True),
+                              y_col, filename, title, ylabel))
+    return figures
+
+# 6. Rate-distortion curves (only if rate_distortion.py has been run)
+def plot_rate_distortion(stats, mesh_type, y_col, filename, title, ylabel):
+    # stats: mean and ci95 of y_col per (Algorithm, Keep) for mesh_type
+    fig, ax = plt.subplots(figsize=(8, 6))
+
+    for alg in stats.index.get_level_values('Algorithm').unique():
+        alg_stats = stats.loc[alg].sort_index()
+        ax.errorbar(alg_stats.index * 100, alg_stats['mean'], yerr=alg_stats['ci95'], label=alg, capsize=3,
+                    marker='o' if alg == 'QEM' else 's')
+
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_title(f'{title} - {mesh_type}')
+    ax.set_xlabel('Faces Kept (%) - Log Scale')
+    ax.set_ylabel(ylabel)
+    ax.legend(title='Algorithm')
+    plt.tight_layout()
+    plt.savefig(filename)
+    plt.close()
+
+def rate_distortion_figures(rd):
+    figures = []
+    for mesh_type in rd['Type'].unique():
+        subset = rd[rd['Type'] == mesh_type]
+        for y_col, name, title, ylabel in [
+                ('HausdorffDist', 'rd_error', 'Error vs. Faces Kept', 'Hausdorff Distance - Log Scale'),
+                ('Time', 'rd_time', 'Time to Reach Level vs. Faces Kept', 'Time (s) - Log Scale')]:
+            stats = subset.groupby(['Algorithm', 'Keep'], sort=False)[y_col].agg(['mean', 'sem'])
+            stats['ci95'] = 1.96 * stats['sem'].fillna(0)
+            filename = f'{FIGURES_DIR}/{name}_{mesh_type}.pdf'
+            figures.append(figure(filename, plot_rate_distortion, stats, mesh_type, y_col, filename, title, ylabel))
+    return figures
+
+# 7. Mesh quality of the decimated meshes (only in results that have the columns)
+QUALITY_PLOTS = [
+    ('AspectRatioP95', 'aspect_dec', 'Aspect Ratio (95th percentile)'),
+    ('NormalDevMean', 'normal_dev_dec', 'Normal Deviation (degrees)'),
+    ('AreaChange', 'area_change_dec', 'Relative Area Change'),
+    ('VolumeChange', 'volume_change_dec', 'Relative Volume Change'),
+    ('NonManifoldEdges', 'nonmanifold_dec', 'Non-Manifold Edges'),
+]
+
+def build_figures(results_file=RESULTS_FILE):
+    # Every figure of the report, as figure_cache.figure specs; only the
+    # aggregates each one draws are computed here
+    rows, cells = figure_cache.results_table(results_file)
+    algorithms = list(rows['Algorithm'].unique())
+    figures = []
+
+    for y_col, name, title, ylabel, log_scale in [
+            ('Time', 'time_bar_chart', 'Execution Time by Mesh Type and Algorithm', 'Time (s) - Log Scale', True),
+            ('HausdorffDist', 'hd_bar_chart', 'Hausdorff Distance by Mesh Type and Algorithm', 'Hausdorff Distance', False)]:
+        stats = get_stats(cells, 'Type', y_col)
+        filename = f'{FIGURES_DIR}/{name}.pdf'
+        figures.append(figure(filename, plot_bar_chart, stats['mean'], stats['ci95'], filename, title, ylabel, log_scale))
+
+    for y_col, name, title in [
+            ('Time', 'time_interaction', 'Interaction Plot: Time vs. Mesh Type & Algorithm'),
+            ('HausdorffDist', 'hd_interaction', 'Interaction Plot: Geometric Error vs. Mesh Type & Algorithm')]:
+        filename = f'{FIGURES_DIR}/{name}.pdf'
+        figures.append(figure(filename, plot_interaction, summarize(cells, ['Algorithm', 'Type'], y_col),
+                              algorithms, y_col, filename, title))
+
+    figures += decimation_figures(cells, 'Time', 'time_dec', 'Execution Time')
+    figures += decimation_figures(cells, 'HausdorffDist', 'hd_dec', 'Hausdorff Dist')
+
+    if os.path.exists('scaling_results.csv') and os.path.exists('scaling_fits.csv'):
+        figures += scaling_figures(pd.read_csv('scaling_results.csv'), pd.read_csv('scaling_fits.csv'))
+
+    if os.path.exists('rate_distortion.csv'):
+        figures += rate_distortion_figures(pd.read_csv('rate_distortion.csv'))
+
+    for y_col, filename_suffix, title_prefix in QUALITY_PLOTS:
+        if f'{y_col}_n' in cells.columns and cells[f'{y_col}_n'].sum() > 0:
+            figures += decimation_figures(cells, y_col, filename_suffix, title_prefix)
+    return figures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the report figures whose data or plotting code changed.")
+    parser.add_argument("--input", default=RESULTS_FILE, help="Result table (CSV, Parquet or Arrow)")
+    parser.add_argument("--workers", type=int, default=figure_cache.NUM_WORKERS,
+                        help="Render processes (0 = one per core)")
+    parser.add_argument("--force", action="store_true", help="Render every figure, even unchanged ones")
+    args = parser.parse_args()
 
-print("Figures generated successfully.")
+    # Create figures directory if it doesn't exist
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    figure_cache.build(build_figures(args.input), args.workers, args.force)
+    print("Figures generated successfully.")
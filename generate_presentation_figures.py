@@ -1,18 +1,27 @@
+import argparse
 import matplotlib.pyplot as plt
-import pandas as pd
 import seaborn as sns
 import os
 
-# Set style
-plt.style.use('seaborn-v0_8-whitegrid')
-sns.set_context("talk")
+import figure_cache
+from figure_cache import figure
+
 OUTPUT_DIR = "presentation"
+RESULTS_FILE = "experiment_results.csv"
+
+def set_style():
+    # Applied in the process that renders, not on import
+    plt.style.use('seaborn-v0_8-whitegrid')
+    sns.set_context("talk")
 
-def load_data():
-    return pd.read_csv("experiment_results.csv")
+def load_data(path=RESULTS_FILE):
+    # Rows of the shared cached table (see figure_cache)
+    rows, _ = figure_cache.results_table(path)
+    return rows
 
 def create_execution_time_chart(df):
     """Slide 5: Execution Time Results (Faceted by Decimation)"""
+    set_style()
     # Use catplot for faceting
     g = sns.catplot(
         data=df, x="Type", y="Time", hue="Algorithm", col="Decimation",
@@ -37,6 +46,7 @@ def create_execution_time_chart(df):
 
 def create_geometric_fidelity_chart(df):
     """Slide 6: Geometric Fidelity (Faceted by Decimation)"""
+    set_style()
     g = sns.catplot(
         data=df, x="Type", y="HausdorffDist", hue="Algorithm", col="Decimation",
         kind="bar", errorbar=('ci', 95), capsize=0.1, 
@@ -52,8 +62,23 @@ def create_geometric_fidelity_chart(df):
     plt.savefig(os.path.join(OUTPUT_DIR, "slide6_geometric_fidelity.png"), dpi=300, bbox_inches='tight')
     plt.close()
 
+def build_figures(df):
+    # Each chart gets only the columns it draws, so it is rendered again
+    # only when those change (the bootstrap CIs make these the slow ones)
+    return [
+        figure(os.path.join(OUTPUT_DIR, "slide5_execution_time.png"), create_execution_time_chart,
+               df[["Type", "Algorithm", "Decimation", "Time"]]),
+        figure(os.path.join(OUTPUT_DIR, "slide6_geometric_fidelity.png"), create_geometric_fidelity_chart,
+               df[["Type", "Algorithm", "Decimation", "HausdorffDist"]]),
+    ]
+
 if __name__ == "__main__":
-    df = load_data()
-    create_execution_time_chart(df)
-    create_geometric_fidelity_chart(df)
+    parser = argparse.ArgumentParser(description="Render the presentation charts whose data or plotting code changed.")
+    parser.add_argument("--input", default=RESULTS_FILE, help="Result table (CSV, Parquet or Arrow)")
+    parser.add_argument("--workers", type=int, default=figure_cache.NUM_WORKERS,
+                        help="Render processes (0 = one per core)")
+    parser.add_argument("--force", action="store_true", help="Render every chart, even unchanged ones")
+    args = parser.parse_args()
+
+    figure_cache.build(build_figures(load_data(args.input)), args.workers, args.force)
     print("Figures generated in 'presentation/' directory.")
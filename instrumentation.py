@@ -0,0 +1,264 @@
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Spawned worker processes read their configuration from these variables,
+# so configure() in the parent is enough to trace a whole process pool.
+TRACE_FILE_ENV = "MESH_TRACE_FILE"
+TRACE_FORMAT_ENV = "MESH_TRACE_FORMAT"
+PROFILE_DIR_ENV = "MESH_PROFILE_DIR"
+
+TRACE_FORMATS = ("jsonl", "chrome")
+
+_config = {"path": None, "format": "jsonl", "profile_dir": None}
+_local = threading.local()
+_lock = threading.Lock()
+_profile_count = 0
+
+
+def configure(path=None, fmt="jsonl", profile_dir=None, fresh=True):
+    # path=None disables tracing. fresh=True starts a new trace file; worker
+    # processes configure themselves with fresh=False and append.
+    if fmt not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format {fmt!r}. Use one of: {', '.join(TRACE_FORMATS)}")
+    _config.update(path=path, format=fmt, profile_dir=profile_dir)
+
+    for name, value in ((TRACE_FILE_ENV, path), (TRACE_FORMAT_ENV, fmt), (PROFILE_DIR_ENV, profile_dir)):
+        if value:
+            os.environ[name] = value
+        else:
+            os.environ.pop(name, None)
+
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    if path and fresh:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            # Chrome's trace viewer accepts a JSON array without the closing bracket
+            if fmt == "chrome":
+                f.write("[\n")
+
+
+def enabled():
+    return _config["path"] is not None
+
+
+# --- Memory ---
+
+def _proc_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_kb():
+    return _proc_status_kb("VmRSS")
+
+
+def peak_rss_kb():
+    # Peak RSS since the last reset_peak_rss() (or process start)
+    peak = _proc_status_kb("VmHWM")
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peak //= 1024  # bytes on macOS
+    return peak
+
+
+def reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets VmHWM to the current RSS.
+    # Elsewhere the peak stays process-wide, so spans report an upper bound.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def open_span_peak_rss_kb(record):
+    # Peak RSS inside a span that is still open: nested spans reset the
+    # counter, but fold their peaks into the parent record when they end.
+    # With tracing off, the peak since the caller's last reset_peak_rss().
+    return max(record.get("rss_peak_kb") or 0, peak_rss_kb() or 0) or None
+
+
+# --- Spans ---
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _write(record):
+    if _config["format"] == "chrome":
+        args = {k: v for k, v in record.items() if k not in ("name", "cat", "ts", "dur", "pid", "tid")}
+        event = {
+            "name": record["name"],
+            "cat": record["cat"],
+            "ph": "X",
+            "ts": record["ts"],
+            "dur": record["dur"] * 1e6,
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": args,
+        }
+        line = json.dumps(event, default=str) + ",\n"
+    else:
+        line = json.dumps(record, default=str) + "\n"
+    # One append per event keeps lines from different processes intact
+    with _lock, open(_config["path"], "a") as f:
+        f.write(line)
+
+
+def _start_profile(name):
+    # cProfile cannot nest, so only the outermost profiled span is profiled
+    if not _config["profile_dir"] or getattr(_local, "profiling", False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler (e.g. an outer cProfile run) is active
+        return None
+    _local.profiling = True
+    return profiler
+
+
+def _stop_profile(profiler, name):
+    global _profile_count
+    if profiler is None:
+        return
+    profiler.disable()
+    _local.profiling = False
+    with _lock:
+        _profile_count += 1
+        count = _profile_count
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    profiler.dump_stats(os.path.join(_config["profile_dir"], f"{safe_name}-{os.getpid()}-{count}.prof"))
+
+
+@contextlib.contextmanager
+def span(name, cat="stage", profile=True, **attrs):
+    # Times the enclosed block and, when tracing is on, records its peak RSS
+    # and writes one event. Yields the record; record["dur"] (seconds) is
+    # filled in on exit even when tracing is off, so callers can reuse it.
+    # With a profile directory configured, spans with profile=True are run
+    # under cProfile and dumped to <profile_dir>/<name>-<pid>-<n>.prof.
+    record = {"name": name, "cat": cat}
+    if not enabled():
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["dur"] = time.perf_counter() - start
+        return
+
+    stack = _stack()
+    if stack:
+        # The parent's peak so far would be lost by the reset below
+        parent = stack[-1]
+        parent["rss_peak_kb"] = max(parent["rss_peak_kb"] or 0, peak_rss_kb() or 0)
+    reset_peak_rss()
+
+    record.update(attrs)
+    record.update(
+        pid=os.getpid(),
+        tid=threading.get_ident(),
+        depth=len(stack),
+        parent=stack[-1]["name"] if stack else None,
+        rss_start_kb=current_rss_kb(),
+        rss_peak_kb=None,
+    )
+    stack.append(record)
+    profiler = _start_profile(name) if profile else None
+    status = "ok"
+    record["ts"] = time.perf_counter_ns() / 1e3  # microseconds, shared clock on Linux
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record["dur"] = time.perf_counter() - start
+        _stop_profile(profiler, name)
+        stack.pop()
+        record["status"] = status
+        record["rss_end_kb"] = current_rss_kb()
+        record["rss_peak_kb"] = max(record["rss_peak_kb"] or 0, peak_rss_kb() or 0)
+        if stack:
+            parent = stack[-1]
+            parent["rss_peak_kb"] = max(parent["rss_peak_kb"] or 0, record["rss_peak_kb"])
+        _write(record)
+
+
+def _configure_from_env():
+    path = os.environ.get(TRACE_FILE_ENV)
+    if path:
+        configure(path, os.environ.get(TRACE_FORMAT_ENV) or "jsonl",
+                  os.environ.get(PROFILE_DIR_ENV) or None, fresh=False)
+
+
+_configure_from_env()
+
+
+# --- Reading traces back ---
+
+def load_trace(path):
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line or line in ("[", "]"):
+                continue
+            event = json.loads(line)
+            if "ph" in event:
+                # Chrome event back to the JSONL record layout
+                event = dict(event.pop("args", {}), name=event["name"], cat=event["cat"],
+                             dur=event["dur"] / 1e6, pid=event["pid"])
+            records.append(event)
+    return records
+
+
+def summarize(records):
+    # Per (cat, name): count, total/mean/max seconds and the largest peak RSS
+    stages = {}
+    for r in records:
+        s = stages.setdefault((r["cat"], r["name"]), {"count": 0, "total": 0.0, "max": 0.0, "peak_rss_kb": 0})
+        s["count"] += 1
+        s["total"] += r["dur"]
+        s["max"] = max(s["max"], r["dur"])
+        s["peak_rss_kb"] = max(s["peak_rss_kb"], r.get("rss_peak_kb") or 0)
+    for s in stages.values():
+        s["mean"] = s["total"] / s["count"]
+    return stages
+
+
+def print_summary(records):
+    stages = summarize(records)
+    print(f"{'Stage':<44} {'Count':>6} {'Total s':>10} {'Mean s':>10} {'Max s':>10} {'Peak RSS MB':>12}")
+    for (cat, name), s in sorted(stages.items(), key=lambda kv: -kv[1]["total"]):
+        print(f"{cat + '/' + name:<44} {s['count']:>6} {s['total']:>10.3f} {s['mean']:>10.4f} "
+              f"{s['max']:>10.4f} {s['peak_rss_kb'] / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python instrumentation.py TRACE_FILE")
+        sys.exit(2)
+    print_summary(load_trace(sys.argv[1]))
@@ -0,0 +1,133 @@
+import collections
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+
+import mesh_io
+
+PREFETCH_DEPTH = 2       # Source meshes loaded ahead of the job being run
+WRITE_QUEUE_DEPTH = 8    # Writes waiting for the disk before submitters block
+READ_CHUNK_SIZE = 1 << 20
+
+
+def _read_mesh(path):
+    # (vertices, faces) read fully into memory from a fresh binary cache.
+    # Other files can only be parsed by PyMeshLab, which misbehaves off the
+    # thread that uses it, so they are just read once to warm the page
+    # cache and the parse stays with the job (None).
+    if mesh_io.has_binary(path):
+        vertices, faces = mesh_io.load_binary(path, mmap=False)
+        return vertices.astype(np.float64), faces
+    for name in mesh_io.mesh_files(path):
+        with open(name, "rb") as f:
+            while f.read(READ_CHUNK_SIZE):
+                pass
+    return None
+
+
+def _save_mesh(path, vertices, faces, then):
+    mesh_io.save_binary(path, vertices, faces)
+    if then is not None:
+        then()
+
+
+class IOPipeline:
+    # Background disk I/O for one process: a loader thread that reads the
+    # next source meshes ahead of time and a writer thread that persists
+    # outputs in submission order, so compute does not wait on the disk.
+    # Neither thread calls PyMeshLab; they only move NumPy arrays and bytes.
+    #
+    # Both threads do one operation at a time under a lock that timed
+    # sections hold too (quiet()), so background I/O never runs while a
+    # decimation is being timed; it overlaps with everything else. Pending
+    # writes finish at interpreter exit even without flush().
+
+    def __init__(self, prefetch_depth=PREFETCH_DEPTH, write_depth=WRITE_QUEUE_DEPTH):
+        self.prefetch_depth = prefetch_depth
+        self._loader = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mesh-loader")
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mesh-writer")
+        self._write_slots = threading.BoundedSemaphore(write_depth)
+        self._io_lock = threading.Lock()
+        self._prefetched = collections.OrderedDict()  # abspath -> future of (vertices, faces)
+        self._saves = []  # Mesh writes not yet checked by wait_saves()
+        self.failed_writes = 0
+
+    def _locked(self, fn, *args):
+        with self._io_lock:
+            return fn(*args)
+
+    def quiet(self):
+        # Held around timed sections: waits for the operation in progress
+        # (not the queue) and keeps the next one from starting
+        return self._io_lock
+
+    # --- Loading ---
+
+    def prefetch(self, paths):
+        # Starts loading the first prefetch_depth of `paths` (the upcoming
+        # source meshes, nearest first). Meshes no longer upcoming are dropped.
+        wanted = [os.path.abspath(p) for p in paths[:self.prefetch_depth]]
+        for key in list(self._prefetched):
+            if key not in wanted:
+                self._prefetched.pop(key).cancel()
+        for key in wanted:
+            if key not in self._prefetched:
+                self._prefetched[key] = self._loader.submit(self._locked, _read_mesh, key)
+
+    def take(self, path):
+        # (vertices, faces) of a prefetched mesh, waiting for the load if it
+        # is still running; None if it was not prefetched or failed to load
+        future = self._prefetched.pop(os.path.abspath(path), None)
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result()
+        except Exception:
+            # The caller loads it itself and reports the error
+            return None
+
+    # --- Writing ---
+
+    def submit(self, fn, *args):
+        # Runs fn(*args) on the writer thread after every earlier write.
+        # Blocks while WRITE_QUEUE_DEPTH writes are waiting.
+        self._write_slots.acquire()
+        future = self._writer.submit(self._locked, fn, *args)
+        future.add_done_callback(self._write_done)
+        return future
+
+    def _write_done(self, future):
+        self._write_slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            # Reported here; whoever holds the future decides what fails
+            self.failed_writes += 1
+            print(f"\033[91m    Background write failed: {future.exception()}\033[0m")
+
+    def save_mesh(self, path, mesh, then=None):
+        # Copies the mesh out of PyMeshLab now (the caller may free it
+        # right away) and writes its binary pair (mesh_io.save_binary).
+        # then() runs on the writer after a successful write.
+        future = self.submit(_save_mesh, path, mesh.vertex_matrix(), mesh.face_matrix(), then)
+        self._saves.append(future)
+        return future
+
+    def wait_saves(self):
+        # Waits for the meshes saved since the last call and raises the
+        # first error among them
+        saves, self._saves = self._saves, []
+        for future in saves:
+            future.result()
+
+    def flush(self):
+        # Waits for every write submitted so far
+        self._writer.submit(lambda: None).result()
+
+    def close(self):
+        for future in self._prefetched.values():
+            future.cancel()
+        self._prefetched.clear()
+        self.flush()
+        self._loader.shutdown(cancel_futures=True)
+        self._writer.shutdown()
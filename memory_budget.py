@@ -0,0 +1,114 @@
+import os
+import re
+import weakref
+
+import numpy as np
+
+import mesh_io
+
+# Rough resident cost of mesh data, measured with PyMeshLab 2023.12 on the
+# dataset (vertices are folded into the per-face figure; V ~ F/2 on a
+# closed triangle mesh). Used for admission control and live tracking, so
+# they err on the high side.
+MESH_BYTES_PER_FACE = 128    # one MeshSet layer
+INDEX_BYTES_PER_FACE = 512   # metrics.SurfaceIndex (pieces, KD-trees)
+QUALITY_BYTES_PER_FACE = 256  # metrics.MeshProperties while it is built
+WORKER_BASE_MB = 128         # Interpreter + PyMeshLab/NumPy/SciPy per process
+
+# MeshSet layers alive at the peak of one job, none bigger than the source:
+# cached source, previous level (progressive jobs), the clone being timed
+# and the decimated copy added for the Hausdorff distance
+JOB_MESH_COPIES = 4
+
+_SIZE_RE = re.compile(r"^\s*([0-9.]+)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1 << 20, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_size(text):
+    # "16G", "512MB", "2.5g" -> bytes; a bare number is megabytes
+    match = _SIZE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Invalid memory size: {text!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def mesh_face_count(path):
+    # Face count without building the mesh: the binary cache's array shape
+    # if fresh, else the "f" lines of the OBJ
+    if mesh_io.has_binary(path):
+        return int(np.load(mesh_io.binary_paths(path)[1], mmap_mode="r").shape[0])
+    count = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"f "):
+                count += 1
+    return count
+
+
+def mesh_bytes(mesh):
+    # Estimated resident size of one pymeshlab.Mesh
+    return mesh.face_number() * MESH_BYTES_PER_FACE
+
+
+def job_bytes(face_count, metric_backend="pymeshlab"):
+    # Estimated peak of one job on a mesh of `face_count` faces
+    total = JOB_MESH_COPIES * face_count * MESH_BYTES_PER_FACE
+    # Quality metrics: the source's MeshProperties plus one of the decimated mesh
+    total += 2 * face_count * QUALITY_BYTES_PER_FACE
+    if metric_backend == "kdtree":
+        # Index of the source plus one of the (smaller) decimated mesh
+        total += 2 * face_count * INDEX_BYTES_PER_FACE
+    return total
+
+
+def workers_for_budget(budget_bytes, peak_job_bytes, max_workers):
+    # Concurrency that keeps every worker's largest job within the budget.
+    # Never below one: a single job over the budget still runs, serially.
+    per_worker = peak_job_bytes + WORKER_BASE_MB * (1 << 20)
+    return max(1, min(max_workers, budget_bytes // per_worker))
+
+
+def _layers(ms):
+    # Layer ids are not reused after a delete, so they can have gaps
+    found, mesh_id = 0, 0
+    while found < ms.mesh_number():
+        if ms.mesh_id_exists(mesh_id):
+            found += 1
+            yield ms.mesh(mesh_id)
+        mesh_id += 1
+
+
+class MeshTracker:
+    # Estimated bytes held by live MeshSets in this process. A MeshSet is
+    # counted from track() until release() or until it is garbage collected;
+    # track() it again after adding or deleting layers.
+
+    def __init__(self):
+        self.live_bytes = 0
+        self.peak_bytes = 0
+        self._finalizers = {}
+
+    def track(self, ms):
+        self.untrack(ms)
+        size = sum(mesh_bytes(mesh) for mesh in _layers(ms))
+        self.live_bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+        self._finalizers[id(ms)] = weakref.finalize(ms, self._forget, id(ms), size)
+        return ms
+
+    def untrack(self, ms):
+        finalizer = self._finalizers.get(id(ms))
+        if finalizer is not None:
+            finalizer()
+
+    def release(self, ms):
+        # Frees every layer now instead of whenever the last reference goes
+        self.untrack(ms)
+        ms.clear()
+
+    def reset_peak(self):
+        self.peak_bytes = self.live_bytes
+
+    def _forget(self, key, size):
+        self._finalizers.pop(key, None)
+        self.live_bytes -= size
@@ -0,0 +1,135 @@
+import collections
+import hashlib
+import os
+
+import pymeshlab
+
+import mesh_io
+from metrics import MeshProperties, SurfaceIndex
+
+HASH_CHUNK_SIZE = 1 << 20  # 1 MB
+MESH_CACHE_SIZE = 4  # Source meshes kept in memory per process
+
+
+def file_hash(filepath):
+    # Content hash of a mesh file, used to key caches and results
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def mesh_hash(path):
+    # Content hash of the mesh at `path` in the form it will be loaded from
+    # (binary cache if fresh, else the file). One file hashes like file_hash.
+    files = mesh_io.mesh_files(path)
+    if len(files) == 1:
+        return file_hash(files[0])
+    h = hashlib.sha256()
+    for name in files:
+        h.update(file_hash(name).encode("ascii"))
+    return h.hexdigest()
+
+
+def clone_meshset(mesh):
+    # New single-layer MeshSet holding an in-memory copy of `mesh`.
+    # Much cheaper than re-parsing the file with load_new_mesh.
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(mesh)
+    return ms
+
+
+class MeshCache:
+    # Parses each source mesh once and hands out cheap in-memory clones.
+    # Keeps the `max_meshes` most recently used meshes per process; evicted
+    # meshes are freed right away. With a memory_budget.MeshTracker, cached
+    # meshes count as live mesh memory. With an io_pipeline.IOPipeline as
+    # `prefetcher`, meshes it has loaded ahead are taken from it.
+
+    def __init__(self, max_meshes=MESH_CACHE_SIZE, tracker=None):
+        self.max_meshes = max_meshes
+        self.tracker = tracker
+        self.prefetcher = None
+        self._meshes = collections.OrderedDict()
+        self._indexes = {}
+        self._properties = {}
+        self._hashes = {}
+
+    def get(self, filepath):
+        return self.meshset(filepath).current_mesh()
+
+    def meshset(self, filepath):
+        # The cached MeshSet itself. Callers may add layers temporarily but
+        # must delete them and leave the source mesh current.
+        key = os.path.abspath(filepath)
+        if key in self._meshes:
+            self._meshes.move_to_end(key)
+            return self._meshes[key]
+
+        # The MeshSet owns the mesh, so it is the MeshSet that is cached.
+        # The binary cache is used when it is fresh, skipping the OBJ parse.
+        arrays = self.prefetcher.take(filepath) if self.prefetcher is not None else None
+        ms = mesh_io.meshset_from_arrays(*arrays) if arrays is not None else mesh_io.load_meshset(filepath)
+        if self.tracker is not None:
+            self.tracker.track(ms)
+
+        self._meshes[key] = ms
+        self.trim()
+        return ms
+
+    def trim(self, max_meshes=None):
+        # Evicts down to `max_meshes` (default: the cache size)
+        limit = self.max_meshes if max_meshes is None else max_meshes
+        while len(self._meshes) > limit:
+            evicted, ms = self._meshes.popitem(last=False)
+            self._indexes.pop(evicted, None)
+            self._properties.pop(evicted, None)
+            self._free(ms)
+
+    def _free(self, ms):
+        if self.tracker is not None:
+            self.tracker.release(ms)
+        else:
+            ms.clear()
+
+    def surface_index(self, filepath):
+        # metrics.SurfaceIndex of the source mesh, built once and reused for
+        # every decimated variant compared against it. Built straight from
+        # the memory-mapped binary cache when there is one.
+        key = os.path.abspath(filepath)
+        if key not in self._indexes:
+            if mesh_io.has_binary(filepath):
+                self._indexes[key] = SurfaceIndex(*mesh_io.load_binary(filepath))
+            else:
+                self._indexes[key] = SurfaceIndex.from_mesh(self.get(filepath))
+        return self._indexes[key]
+
+    def mesh_properties(self, filepath):
+        # metrics.MeshProperties of the source mesh, the reference for the
+        # quality columns of every decimated variant
+        key = os.path.abspath(filepath)
+        if key not in self._properties:
+            if mesh_io.has_binary(filepath):
+                self._properties[key] = MeshProperties(*mesh_io.load_binary(filepath))
+            else:
+                self._properties[key] = MeshProperties.from_mesh(self.get(filepath))
+        return self._properties[key]
+
+    def clone(self, filepath):
+        return clone_meshset(self.get(filepath))
+
+    def content_hash(self, filepath):
+        # Memoized mesh_hash, invalidated when the files change on disk
+        key = (os.path.abspath(filepath),)
+        for name in mesh_io.mesh_files(filepath):
+            stat = os.stat(name)
+            key += (stat.st_mtime_ns, stat.st_size)
+        if key not in self._hashes:
+            self._hashes[key] = mesh_hash(filepath)
+        return self._hashes[key]
+
+    def clear(self):
+        self.trim(0)
+        self._indexes.clear()
+        self._properties.clear()
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pymeshlab
+
+# Binary mesh cache: two raw .npy arrays next to each OBJ,
+#   <stem>.vertices.npy  float32 (V, 3)
+#   <stem>.faces.npy     int32   (F, 3)
+# np.load(mmap_mode="r") maps them without parsing or copying.
+VERTEX_SUFFIX = ".vertices.npy"
+FACE_SUFFIX = ".faces.npy"
+VERTEX_DTYPE = np.float32
+FACE_DTYPE = np.int32
+
+
+def binary_paths(path):
+    # Binary cache paths for a mesh path (".obj" or any other extension)
+    stem = os.path.splitext(path)[0]
+    return stem + VERTEX_SUFFIX, stem + FACE_SUFFIX
+
+
+def _save_array(path, array):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def save_binary(path, vertices, faces):
+    # Faces are written last, so a half-written pair is never fresh
+    vertex_path, face_path = binary_paths(path)
+    _save_array(vertex_path, np.ascontiguousarray(vertices, dtype=VERTEX_DTYPE))
+    _save_array(face_path, np.ascontiguousarray(faces, dtype=FACE_DTYPE))
+
+
+def save_mesh_binary(path, mesh):
+    save_binary(path, mesh.vertex_matrix(), mesh.face_matrix())
+
+
+def has_binary(path):
+    # True if the binary pair exists and is not older than `path` (when
+    # `path` itself exists, e.g. an OBJ that was re-exported later)
+    vertex_path, face_path = binary_paths(path)
+    if not (os.path.exists(vertex_path) and os.path.exists(face_path)):
+        return False
+    if os.path.exists(path):
+        newest = os.path.getmtime(path)
+        return min(os.path.getmtime(vertex_path), os.path.getmtime(face_path)) >= newest
+    return True
+
+
+def load_binary(path, mmap=True):
+    # (vertices, faces) as read-only memory maps, or in-memory arrays with mmap=False
+    vertex_path, face_path = binary_paths(path)
+    mode = "r" if mmap else None
+    return np.load(vertex_path, mmap_mode=mode), np.load(face_path, mmap_mode=mode)
+
+
+def load_meshset(path, prefer_binary=True):
+    # MeshSet for `path`, from the binary cache when it is fresh. PyMeshLab
+    # keeps its own double-precision copy, so this is one copy instead of a
+    # text parse.
+    if prefer_binary and has_binary(path):
+        return meshset_from_arrays(*load_binary(path))
+    ms = pymeshlab.MeshSet()
+    ms.load_new_mesh(path)
+    return ms
+
+
+def meshset_from_arrays(vertices, faces):
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(pymeshlab.Mesh(vertex_matrix=np.asarray(vertices, dtype=np.float64),
+                               face_matrix=np.asarray(faces)))
+    return ms
+
+
+def save_meshset(ms, path, obj=False):
+    # Binary cache always; the OBJ at `path` only when asked for (it is
+    # for looking at, nothing in the pipeline needs it). The OBJ goes
+    # first so the binary pair is never older than it.
+    if obj:
+        ms.save_current_mesh(path)
+    save_mesh_binary(path, ms.current_mesh())
+
+
+def mesh_files(path):
+    # Files holding the mesh at `path`: the binary pair when fresh, else the file itself
+    if has_binary(path):
+        return list(binary_paths(path))
+    return [path]
+
+
+def mesh_exists(path):
+    return has_binary(path) or os.path.exists(path)
+
+
+def mesh_mtime(path):
+    # Last modification of the mesh in whichever form it is stored, or None
+    times = [os.path.getmtime(f) for f in mesh_files(path) if os.path.exists(f)]
+    return max(times) if times else None
+
+
+def list_meshes(dir_path, ext=".obj"):
+    # Sorted mesh paths in `dir_path`, named `<stem><ext>` whether the mesh
+    # is stored as that file, as a binary pair, or both
+    stems = set()
+    for name in os.listdir(dir_path) if os.path.isdir(dir_path) else []:
+        if name.endswith(VERTEX_SUFFIX):
+            stem = name[:-len(VERTEX_SUFFIX)]
+            if os.path.exists(os.path.join(dir_path, stem + FACE_SUFFIX)):
+                stems.add(stem)
+        elif name.endswith(ext):
+            stems.add(name[:-len(ext)])
+    return sorted(os.path.join(dir_path, stem + ext) for stem in stems)
+
+
+def load_arrays(path, prefer_binary=True):
+    # (vertices, faces) without going through PyMeshLab when the binary
+    # cache is fresh (memory-mapped, zero-copy)
+    if prefer_binary and has_binary(path):
+        return load_binary(path)
+    ms = pymeshlab.MeshSet()
+    ms.load_new_mesh(path)
+    mesh = ms.current_mesh()
+    return mesh.vertex_matrix(), mesh.face_matrix()
@@ -0,0 +1,435 @@
+import itertools
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Points per batch when querying
+BATCH_SIZE = 65536
+# Upper bound on (point, candidate piece) pairs held in memory at once
+MAX_PAIRS = 1 << 21
+# Nearest pieces examined per point and size class in the first pass
+INITIAL_CANDIDATES = 8
+# Points per ball query for the points the first pass cannot settle
+BALL_QUERY_CHUNK = 4096
+# Triangles with an edge longer than this multiple of the median longest
+# edge are bisected, so long slivers do not inflate the search radius
+SPLIT_EDGE_FACTOR = 2.0
+# Pieces per face, at most (the bisection length is coarsened to fit)
+MAX_PIECES_PER_FACE = 4
+# Pieces are grouped in size classes of this radius ratio, one KD-tree each
+SIZE_CLASS_RATIO = 4.0
+# Extra area-weighted surface samples per vertex on top of the vertices themselves
+FACE_SAMPLES_PER_VERTEX = 1.0
+# Sample points generated (and measured) at a time
+SAMPLE_CHUNK = 1 << 20
+PERCENTILES = (50, 90, 95, 99)
+
+
+class SurfaceIndex:
+    # Spatial index over the triangles of one mesh. Build it once per mesh
+    # and reuse it for every distance query against that surface.
+    #
+    # Long triangles are bisected into pieces, and pieces are grouped into
+    # size classes with a KD-tree over their centroids. A piece not among
+    # the k nearest centroids of its class is at least (k-th distance -
+    # class radius) away; only points where that bound could still beat
+    # the best distance found so far get a ball query. Results are exact.
+
+    def __init__(self, vertices, faces):
+        # Kept as given so memory-mapped arrays (mesh_io) are not copied;
+        # the gathered triangles are double precision either way
+        self.vertices = np.asarray(vertices)
+        self.faces = np.asarray(faces)
+        self.triangles = self.vertices[self.faces].astype(np.float64)  # (F, 3, 3)
+
+        edge1 = self.triangles[:, 1] - self.triangles[:, 0]
+        edge2 = self.triangles[:, 2] - self.triangles[:, 0]
+        self.areas = 0.5 * np.linalg.norm(np.cross(edge1, edge2), axis=1)
+
+        pieces, owners = _split_long_triangles(self.triangles)
+        centroids = pieces.mean(axis=1)
+        radius = np.linalg.norm(pieces - centroids[:, None, :], axis=2).max(axis=1)
+
+        # (tree, pieces, owning face ids, piece radii, class radius) per size class
+        self.classes = []
+        if len(pieces):
+            smallest = max(radius.min(), 1e-12)
+            size_class = np.floor(np.log(np.maximum(radius, smallest) / smallest) / np.log(SIZE_CLASS_RATIO))
+            for c in np.unique(size_class):
+                ids = np.flatnonzero(size_class == c)
+                self.classes.append((cKDTree(centroids[ids]), pieces[ids], owners[ids], radius[ids], float(radius[ids].max())))
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        # From a pymeshlab.Mesh
+        return cls(mesh.vertex_matrix(), mesh.face_matrix())
+
+    @property
+    def face_number(self):
+        return len(self.faces)
+
+    def sample(self, rng, samples_per_vertex=FACE_SAMPLES_PER_VERTEX):
+        # Vertices plus area-weighted random points on the faces
+        return np.concatenate(list(self.sample_chunks(rng, samples_per_vertex)))
+
+    def sample_chunks(self, rng, samples_per_vertex=FACE_SAMPLES_PER_VERTEX, chunk_size=SAMPLE_CHUNK):
+        # The points of sample() in chunks of at most chunk_size, so only
+        # one chunk of points is in memory at a time. Meshes below
+        # chunk_size draw exactly the points sample() always has.
+        for start in range(0, len(self.vertices), chunk_size):
+            yield np.asarray(self.vertices[start:start + chunk_size], dtype=np.float64)
+        n = int(len(self.vertices) * samples_per_vertex)
+        if n == 0 or self.areas.sum() <= 0:
+            return
+        p = self.areas / self.areas.sum()
+        for start in range(0, n, chunk_size):
+            m = min(chunk_size, n - start)
+            face_ids = rng.choice(len(self.faces), size=m, p=p)
+            u = rng.random((m, 2))
+            flip = u.sum(axis=1) > 1
+            u[flip] = 1 - u[flip]
+            tri = self.triangles[face_ids]
+            yield tri[:, 0] + u[:, :1] * (tri[:, 1] - tri[:, 0]) + u[:, 1:] * (tri[:, 2] - tri[:, 0])
+
+    def distances(self, points, batch_size=BATCH_SIZE):
+        # Exact unsigned distance from each point to this surface
+        return self.closest(points, batch_size)[0]
+
+    def closest(self, points, batch_size=BATCH_SIZE):
+        # (distance, closest face id) for each point
+        points = np.asarray(points, dtype=np.float64)
+        dist = np.empty(len(points))
+        face = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), batch_size):
+            stop = start + batch_size
+            dist[start:stop], face[start:stop] = self._closest(points[start:stop])
+        return dist, face
+
+    def _closest(self, points):
+        best = np.full(len(points), np.inf)
+        best_face = np.zeros(len(points), dtype=np.int64)
+
+        # First pass over every class gives a good upper bound quickly
+        all_ids = np.arange(len(points))
+        bounds = [
+            self._search(points, all_ids, min(INITIAL_CANDIDATES, size_class[0].n), size_class, best, best_face)
+            for size_class in self.classes
+        ]
+
+        # Then look at every piece that could still be closer, only for the
+        # points where the first pass does not already prove the answer
+        for size_class, kth in zip(self.classes, bounds):
+            tree, radius = size_class[0], size_class[4]
+            if tree.n <= INITIAL_CANDIDATES:
+                continue
+            todo = all_ids[best > kth - radius]
+            if len(todo):
+                self._search_ball(points, todo, size_class, best, best_face)
+
+        return best, best_face
+
+    def _search(self, points, ids, k, size_class, best, best_face):
+        # Checks the k nearest pieces of one size class for points[ids],
+        # updating best/best_face in place. Returns the k-th centroid
+        # distance per point.
+        tree, pieces, owners, piece_radius, _ = size_class
+        kth = np.full(len(points), np.inf)
+        chunk = max(1, MAX_PAIRS // k)
+        for start in range(0, len(ids), chunk):
+            sub = ids[start:start + chunk]
+            centroid_dist, idx = tree.query(points[sub], k=k)
+            if k == 1:
+                centroid_dist, idx = centroid_dist[:, None], idx[:, None]
+            kth[sub] = centroid_dist[:, -1]
+
+            # Only pieces whose bounding sphere could beat the current best
+            rows, cols = np.nonzero(centroid_dist - piece_radius[idx] < best[sub][:, None])
+            self._update(points, sub[rows], idx[rows, cols], pieces, owners, best, best_face)
+        return kth
+
+    def _search_ball(self, points, ids, size_class, best, best_face):
+        # Every piece of the class whose centroid is within best + class
+        # radius of the point; nothing outside that ball can be closer.
+        # Hits are counted first and the points split so that no query
+        # returns more than MAX_PAIRS of them (a few points in a dense
+        # region can otherwise hit millions of pieces).
+        tree, radius = size_class[0], size_class[4]
+        for start in range(0, len(ids), BALL_QUERY_CHUNK):
+            sub = ids[start:start + BALL_QUERY_CHUNK]
+            r = best[sub] + radius
+            counts = tree.query_ball_point(points[sub], r=r, return_length=True)
+            sub, r, ends = sub[counts > 0], r[counts > 0], np.cumsum(counts[counts > 0])
+            group_start = 0
+            while group_start < len(sub):
+                limit = (ends[group_start - 1] if group_start else 0) + MAX_PAIRS
+                group_end = max(group_start + 1, int(np.searchsorted(ends, limit, side="right")))
+                group = slice(group_start, group_end)
+                self._ball_update(points, sub[group], r[group], size_class, best, best_face)
+                group_start = group_end
+
+    def _ball_update(self, points, sub, r, size_class, best, best_face):
+        tree, pieces, owners, piece_radius, _ = size_class
+        hits = tree.query_ball_point(points[sub], r=r, return_sorted=False)
+        counts = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+        rows = np.repeat(sub, counts)
+        cols = np.fromiter(itertools.chain.from_iterable(hits), dtype=np.int64, count=counts.sum())
+
+        # Same bounding-sphere filter as _search before the exact test
+        centroid_dist = np.linalg.norm(points[rows] - tree.data[cols], axis=1)
+        keep = centroid_dist - piece_radius[cols] < best[rows]
+        rows, cols = rows[keep], cols[keep]
+        for pair_start in range(0, len(rows), MAX_PAIRS):
+            pair = slice(pair_start, pair_start + MAX_PAIRS)
+            self._update(points, rows[pair], cols[pair], pieces, owners, best, best_face)
+
+    @staticmethod
+    def _update(points, point_ids, piece_ids, pieces, owners, best, best_face):
+        # Exact distances for (point, piece) pairs; keep the best per point
+        if not len(point_ids):
+            return
+        d = point_triangle_distance(points[point_ids], pieces[piece_ids])
+        order = np.lexsort((d, point_ids))
+        point_ids, piece_ids, d = point_ids[order], piece_ids[order], d[order]
+        first = np.r_[True, point_ids[1:] != point_ids[:-1]]
+        point_ids, piece_ids, d = point_ids[first], piece_ids[first], d[first]
+        better = d < best[point_ids]
+        best[point_ids[better]] = d[better]
+        best_face[point_ids[better]] = owners[piece_ids[better]]
+
+
+def _edge_lengths(triangles):
+    return np.stack([
+        np.linalg.norm(triangles[:, 1] - triangles[:, 0], axis=1),
+        np.linalg.norm(triangles[:, 2] - triangles[:, 1], axis=1),
+        np.linalg.norm(triangles[:, 0] - triangles[:, 2], axis=1),
+    ], axis=1)
+
+
+def _split_long_triangles(triangles):
+    # Longest-edge bisection of every triangle with an edge longer than h.
+    # Returns (pieces, owning triangle ids); the pieces of a triangle cover
+    # it exactly, so distances to pieces are distances to the triangle.
+    owners = np.arange(len(triangles))
+    if len(triangles) == 0:
+        return triangles, owners
+
+    lengths = _edge_lengths(triangles)
+    longest = lengths.max(axis=1)
+    h = max(SPLIT_EDGE_FACTOR * np.median(longest), 1e-12)
+
+    # Rough piece count (~ length/h for slivers, ~ area/h^2 for fat
+    # triangles); coarsen h until it fits the budget
+    edge1 = triangles[:, 1] - triangles[:, 0]
+    edge2 = triangles[:, 2] - triangles[:, 0]
+    areas = 0.5 * np.linalg.norm(np.cross(edge1, edge2), axis=1)
+    budget = MAX_PIECES_PER_FACE * len(triangles)
+    while np.sum(np.maximum(1, 2 * longest / h + 4 * areas / (h * h))) > budget:
+        h *= 1.5
+
+    pieces = triangles
+    while True:
+        lengths = _edge_lengths(pieces)
+        split = lengths.max(axis=1) > h
+        if not split.any():
+            return pieces, owners
+
+        keep, keep_owners = pieces[~split], owners[~split]
+        tri, tri_owners = pieces[split], owners[split]
+        # Rotate corners so that edge (0, 1) is the longest
+        roll = lengths[split].argmax(axis=1)
+        order = (np.arange(3)[None, :] + roll[:, None]) % 3
+        tri = np.take_along_axis(tri, order[:, :, None], axis=1)
+        mid = 0.5 * (tri[:, 0] + tri[:, 1])
+        first = np.stack([tri[:, 0], mid, tri[:, 2]], axis=1)
+        second = np.stack([mid, tri[:, 1], tri[:, 2]], axis=1)
+
+        pieces = np.concatenate([keep, first, second])
+        owners = np.concatenate([keep_owners, tri_owners, tri_owners])
+
+
+def point_triangle_distance(p, tri):
+    # Vectorized closest-point-on-triangle distance (Ericson, Real-Time
+    # Collision Detection 5.1.5). p: (..., 3), tri: (..., 3, 3), broadcastable.
+    a, b, c = tri[..., 0, :], tri[..., 1, :], tri[..., 2, :]
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+
+    d1 = np.einsum("...i,...i", ab, ap)
+    d2 = np.einsum("...i,...i", ac, ap)
+    d3 = np.einsum("...i,...i", ab, bp)
+    d4 = np.einsum("...i,...i", ac, bp)
+    d5 = np.einsum("...i,...i", ab, cp)
+    d6 = np.einsum("...i,...i", ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Interior: barycentric projection onto the plane
+        denom = va + vb + vc
+        v = vb / denom
+        w = vc / denom
+        closest = a + ab * v[..., None] + ac * w[..., None]
+
+        # Edge regions
+        bc_w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        on_bc = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        closest = np.where(on_bc[..., None], b + (c - b) * bc_w[..., None], closest)
+
+        ac_w = d2 / (d2 - d6)
+        on_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        closest = np.where(on_ac[..., None], a + ac * ac_w[..., None], closest)
+
+        ab_v = d1 / (d1 - d3)
+        on_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        closest = np.where(on_ab[..., None], a + ab * ab_v[..., None], closest)
+
+    # Vertex regions
+    closest = np.where(((d6 >= 0) & (d5 <= d6))[..., None], c, closest)
+    closest = np.where(((d3 >= 0) & (d4 <= d3))[..., None], b, closest)
+    closest = np.where(((d1 <= 0) & (d2 <= 0))[..., None], a, closest)
+
+    # Degenerate (zero-area) triangles: fall back to the nearest vertex
+    dist = np.linalg.norm(p - closest, axis=-1)
+    degenerate = ~np.isfinite(dist)
+    if degenerate.any():
+        vertex_dist = np.linalg.norm(p[..., None, :] - tri, axis=-1).min(axis=-1)
+        dist = np.where(degenerate, vertex_dist, dist)
+    return dist
+
+
+def summarize_distances(d):
+    out = {
+        "max": float(d.max()) if len(d) else 0.0,
+        "mean": float(d.mean()) if len(d) else 0.0,
+        "rms": float(np.sqrt(np.mean(d * d))) if len(d) else 0.0,
+    }
+    if len(d):
+        for q, value in zip(PERCENTILES, np.percentile(d, PERCENTILES)):
+            out[f"p{q}"] = float(value)
+    else:
+        out.update({f"p{q}": 0.0 for q in PERCENTILES})
+    return out
+
+
+def _directed_distances(index_from, index_to, rng, samples_per_vertex):
+    # Distances to index_to from the samples of index_from, sampled chunk by chunk
+    chunks = [index_to.distances(points) for points in index_from.sample_chunks(rng, samples_per_vertex)]
+    return np.concatenate(chunks) if chunks else np.empty(0)
+
+
+def surface_distance(index_a, index_b, seed=0, samples_per_vertex=FACE_SAMPLES_PER_VERTEX):
+    # Two-sided surface distance between two indexed meshes in one pass.
+    # Returns max (= two-sided Hausdorff), mean, RMS and percentiles over
+    # the samples of both directions, plus the one-sided maxima.
+    rng = np.random.default_rng(seed)
+    d_ab = _directed_distances(index_a, index_b, rng, samples_per_vertex)
+    d_ba = _directed_distances(index_b, index_a, rng, samples_per_vertex)
+
+    result = summarize_distances(np.concatenate([d_ab, d_ba]))
+    result["max_ab"] = float(d_ab.max()) if len(d_ab) else 0.0
+    result["max_ba"] = float(d_ba.max()) if len(d_ba) else 0.0
+    return result
+
+
+def distance_columns(result):
+    # Result-row columns; HausdorffDist keeps its meaning (two-sided max)
+    return {
+        "HausdorffDist": result["max"],
+        "MeanDist": result["mean"],
+        "RMSDist": result["rms"],
+        "P95Dist": result["p95"],
+        "P99Dist": result["p99"],
+    }
+
+
+DISTANCE_FIELDNAMES = ["MeanDist", "RMSDist", "P95Dist", "P99Dist"]
+
+
+# --- Mesh quality ---
+
+# Aspect ratios above this (and those of zero-area triangles) are clipped
+ASPECT_RATIO_CAP = 1e6
+
+QUALITY_FIELDNAMES = ["InitialVertices", "FinalVertices", "AspectRatioMedian", "AspectRatioP95",
+                      "NormalDevMean", "NormalDevP95", "BoundaryEdges", "NonManifoldEdges",
+                      "AreaChange", "VolumeChange"]
+
+
+class MeshProperties:
+    # Per-face geometry and topology of one mesh from a single pass over
+    # its vertex and face arrays. Build the original's once per mesh and
+    # compare every decimated variant against it with quality_columns.
+
+    def __init__(self, vertices, faces):
+        vertices = np.asarray(vertices)
+        faces = np.asarray(faces, dtype=np.int64)
+        self.vertex_number = len(vertices)
+        self.face_number = len(faces)
+        triangles = vertices[faces].astype(np.float64)  # (F, 3, 3)
+
+        cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        double_area = np.linalg.norm(cross, axis=1)
+        self.areas = 0.5 * double_area
+        self.area = float(self.areas.sum())
+        # Divergence theorem; only meaningful for closed meshes
+        self.volume = float(np.einsum("ij,ij->", triangles[:, 0], cross) / 6)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.normals = cross / double_area[:, None]
+            # Longest edge x perimeter / (4 sqrt(3) area): 1 for equilateral triangles
+            lengths = _edge_lengths(triangles)
+            aspect = lengths.max(axis=1) * lengths.sum(axis=1) / (4 * np.sqrt(3) * self.areas)
+        self.aspect_ratios = np.where(np.isfinite(aspect), np.minimum(aspect, ASPECT_RATIO_CAP), ASPECT_RATIO_CAP)
+        self.centroids = triangles.mean(axis=1)
+
+        # Undirected edges by how many faces share them: 1 = boundary, >2 = non-manifold
+        edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        _, counts = np.unique(edges[:, 0] * max(self.vertex_number, 1) + edges[:, 1], return_counts=True)
+        self.boundary_edges = int((counts == 1).sum())
+        self.nonmanifold_edges = int((counts > 2).sum())
+        self._centroid_tree = None
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        # From a pymeshlab.Mesh
+        return cls(mesh.vertex_matrix(), mesh.face_matrix())
+
+    def nearest_faces(self, points):
+        # Face whose centroid is nearest to each point
+        if self._centroid_tree is None:
+            self._centroid_tree = cKDTree(self.centroids)
+        return self._centroid_tree.query(points)[1]
+
+
+def _relative_change(new, old):
+    return (new - old) / abs(old) if old else None
+
+
+def quality_columns(original, decimated):
+    # Result-row columns comparing two MeshProperties. Normal deviation is
+    # the angle in degrees between each decimated face and the original
+    # face nearest its centroid (mean weighted by area, P95 over faces).
+    valid = np.isfinite(decimated.normals).all(axis=1)
+    deviation = np.empty(0)
+    if original.face_number and valid.any():
+        nearest = original.nearest_faces(decimated.centroids[valid])
+        cos = np.einsum("ij,ij->i", decimated.normals[valid], original.normals[nearest])
+        # Zero-area original faces have no normal and count as no deviation
+        deviation = np.degrees(np.arccos(np.clip(np.nan_to_num(cos, nan=1.0), -1.0, 1.0)))
+    weights = decimated.areas[valid]
+    return {
+        "InitialVertices": original.vertex_number,
+        "FinalVertices": decimated.vertex_number,
+        "AspectRatioMedian": float(np.median(decimated.aspect_ratios)) if decimated.face_number else None,
+        "AspectRatioP95": float(np.percentile(decimated.aspect_ratios, 95)) if decimated.face_number else None,
+        "NormalDevMean": float(np.average(deviation, weights=weights)) if weights.sum() > 0 else None,
+        "NormalDevP95": float(np.percentile(deviation, 95)) if len(deviation) else None,
+        "BoundaryEdges": decimated.boundary_edges,
+        "NonManifoldEdges": decimated.nonmanifold_edges,
+        "AreaChange": _relative_change(decimated.area, original.area),
+        "VolumeChange": _relative_change(decimated.volume, original.volume),
+    }
@@ -1,101 +1,397 @@
+import argparse
+import concurrent.futures
 import glob
+import json
+import multiprocessing
 import os
+import struct
+import time
 
 import pymeshlab
 
+import instrumentation
+import mesh_io
+import provenance
+from mesh_cache import file_hash
+
 # Setup paths
 RAW_DIRS = {
     "modelnet40": "./raw_downloads/modelnet40",  # Put your 15 .off files here
     "thingi10k": "./raw_downloads/thingi10k",  # Put your 15 .stl files here
 }
 PROCESSED_DIRS = {"modelnet40": "./dataset/clean_cad", "thingi10k": "./dataset/organic_scanned"}
+MANIFEST_FILE = "./dataset/preprocess_manifest.json"
 
 MIN_FACE_COUNT = 2000  # Threshold to reject too-simple models
+NUM_WORKERS = 1  # Worker processes (1 = serial)
+SAVE_OBJ = False  # Outputs are binary .npy pairs (mesh_io.py); OBJ copies are opt-in
 
 
-def preprocess_models():
-    for key, raw_path in RAW_DIRS.items():
-        out_path = PROCESSED_DIRS[key]
-        os.makedirs(out_path, exist_ok=True)
+# --- Cheap header checks ---
+
+def off_face_count(filepath):
+    # Face count from an OFF header ("OFF" then "nv nf ne", comments allowed).
+    # Handles the ModelNet40 quirk where the counts follow "OFF" on the same line.
+    with open(filepath, "rb") as f:
+        tokens = []
+        for raw in f:
+            line = raw.split(b"#", 1)[0].strip()
+            if not line:
+                continue
+            if not tokens and line.upper().startswith(b"OFF"):
+                line = line[3:].strip()
+                tokens.append(b"OFF")
+                if not line:
+                    continue
+            tokens.extend(line.split())
+            if len(tokens) >= 3:
+                break
+    if len(tokens) < 3 or tokens[0] != b"OFF":
+        return None
+    try:
+        return int(tokens[2])
+    except ValueError:
+        return None
 
-        files = glob.glob(os.path.join(raw_path, "*"))
-        print(f"--- Processing {key} ({len(files)} files) ---")
 
-        for filepath in files:
-            filename = os.path.basename(filepath)
-            name_only, ext = os.path.splitext(filename)
+def stl_face_count(filepath):
+    # Triangle count from a binary STL header. ASCII STL has no count, so
+    # None is returned and the mesh has to be parsed.
+    size = os.path.getsize(filepath)
+    if size < 84:
+        return None
+    with open(filepath, "rb") as f:
+        f.seek(80)
+        (count,) = struct.unpack("<I", f.read(4))
+    # "solid" is also a legal start of a binary header, so trust the size
+    if size != 84 + 50 * count:
+        return None
+    return count
+
+
+def header_face_count(filepath):
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".off":
+        return off_face_count(filepath)
+    if ext == ".stl":
+        return stl_face_count(filepath)
+    return None
+
+
+# --- Repair chain ---
+
+def basic_cleaning(ms):
+    ms.meshing_merge_close_vertices()
+    ms.meshing_remove_duplicate_faces()
+    ms.meshing_remove_duplicate_vertices()
+
+
+def remove_small_components(ms):
+    # Remove small floating disconnected pieces (noise often causes non-manifold errors)
+    ms.meshing_remove_connected_component_by_face_number(mincomponentsize=50)
+
+
+def repair_non_manifold_edges(ms):
+    # Repair Non-Manifold Edges by removing faces sharing them
+    # This makes the mesh "open" (holes) but "manifold" (valid for math)
+    ms.meshing_repair_non_manifold_edges(method="Remove Faces")
+
+
+def repair_non_manifold_vertices(ms):
+    ms.meshing_repair_non_manifold_vertices(vertdispratio=0)
+
+
+def re_orient(ms):
+    # Now that it is manifold, we can safely re-orient
+    try:
+        # Use geometric heuristic to orient faces (better for disconnected components?)
+        ms.meshing_re_orient_faces_by_geometry()
+    except Exception:
+        # Fallback to coherent orientation if geometric fails.
+        # If that fails too the geometry is too broken to re-orient.
+        ms.meshing_re_orient_faces_coherently()
+
+    # Inverted normals are common in ModelNet40, but an unconditional
+    # meshing_invert_face_orientation(forceflip=True) broke other meshes,
+    # so we rely on the re-orientation above.
+
+
+def compute_normals(ms):
+    # Smooth shading
+    ms.compute_normal_per_vertex()
+
+
+def normalize_scale(ms):
+    ms.compute_matrix_from_scaling_or_normalization(axisx=1.0, axisy=1.0, axisz=1.0, unitflag=True, freeze=True)
+
+
+# Applied in order; each step is timed separately in the manifest
+REPAIR_STEPS = [
+    ("basic_cleaning", basic_cleaning),
+    ("remove_small_components", remove_small_components),
+    ("repair_non_manifold_edges", repair_non_manifold_edges),
+    ("repair_non_manifold_vertices", repair_non_manifold_vertices),
+    ("re_orient", re_orient),
+    ("compute_normals", compute_normals),
+    ("normalize_scale", normalize_scale),
+]
+
+
+# --- Manifest ---
+
+def load_manifest(path=MANIFEST_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
 
+def save_manifest(manifest, path=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(task, entry):
+    # A file is skipped if the previous run saw the same source contents and
+    # either rejected it (too simple, a duplicate or derived geometry) or
+    # wrote an output that is newer than the source.
+    if not entry or entry.get("status") not in ("processed", "rejected", "duplicate", "derived"):
+        return False
+    if entry["status"] == "processed":
+        out_mtime = mesh_io.mesh_mtime(task["output"])
+        if out_mtime is None or out_mtime < os.path.getmtime(task["source"]):
+            return False
+        if task.get("save_obj") and not os.path.exists(task["output"]):
+            return False
+    return entry.get("source_hash") == file_hash(task["source"])
+
+
+# --- Pipeline ---
+
+def build_tasks(save_obj=SAVE_OBJ):
+    tasks = []
+    for key, raw_path in RAW_DIRS.items():
+        out_path = PROCESSED_DIRS[key]
+        for filepath in sorted(glob.glob(os.path.join(raw_path, "*"))):
+            filename = os.path.basename(filepath)
             if filename.startswith("."):
                 continue
+            name_only = os.path.splitext(filename)[0]
+            tasks.append({
+                "dataset": key,
+                "source": filepath,
+                "output": os.path.join(out_path, name_only + ".obj"),
+                "save_obj": save_obj,
+            })
+    return tasks
 
+
+def process_file(task):
+    # Runs the repair chain on one raw file and returns its manifest entry
+    with instrumentation.span("file", cat="preprocess", profile=False, source=task["source"]):
+        return _process_file(task)
+
+
+def _process_file(task):
+    filepath = task["source"]
+    filename = os.path.basename(filepath)
+    start = time.perf_counter()
+    entry = {
+        "dataset": task["dataset"],
+        "output": task["output"],
+        "source_hash": None,
+        "header_faces": None,
+        "initial_faces": None,
+        "final_faces": None,
+        "geometry_hash": None,
+        "output_hash": None,
+        "steps": {},
+    }
+
+    def finish(status, message=None):
+        entry["status"] = status
+        entry["total_time"] = time.perf_counter() - start
+        if message:
+            entry["message"] = message
+            print(f"Skipping {filename}: {message}")
+        return entry
+
+    try:
+        with instrumentation.span("hash", cat="preprocess", source=filepath) as s:
+            entry["source_hash"] = file_hash(filepath)
+        entry["steps"]["hash"] = s["dur"]
+
+        # Reject too-simple models before paying for a full parse
+        header_faces = header_face_count(filepath)
+        entry["header_faces"] = header_faces
+        if header_faces is not None and header_faces < MIN_FACE_COUNT:
+            return finish("rejected", f"Too few faces ({header_faces} in header).")
+
+        with instrumentation.span("load", cat="preprocess", source=filepath) as s:
             ms = pymeshlab.MeshSet()
             ms.load_new_mesh(filepath)
+        entry["steps"]["load"] = s["dur"]
 
-            print(f"Processing: {filename}")
+        # Check face count
+        initial_face_count = ms.current_mesh().face_number()
+        entry["initial_faces"] = initial_face_count
+        if initial_face_count < MIN_FACE_COUNT:
+            return finish("rejected", "Too few faces.")
 
-            # Check face count
-            initial_face_count = ms.current_mesh().face_number()
-            print(f"  Initial faces: {initial_face_count}")
-            if initial_face_count < MIN_FACE_COUNT:
-                print(f"Skipping {filename}: Too few faces.")
-                continue
+        # Geometry seen before (another download, or a cleaned or decimated
+        # mesh copied back into the raw folders) is not processed again. A
+        # download only repeats one recorded before it, so a rerun keeps the
+        # first of two copies.
+        with instrumentation.span("fingerprint", cat="preprocess", source=filepath) as s:
+            entry["geometry_hash"] = provenance.mesh_geometry_hash(ms.current_mesh())
+            with provenance.ProvenanceIndex() as index:
+                original = index.find(entry["geometry_hash"], stages=("raw",), exclude=filepath,
+                                      before=first_seen(index, filepath))
+                derived = index.find(entry["geometry_hash"], stages=("cleaned", "decimated"), exclude=filepath)
+        entry["steps"]["fingerprint"] = s["dur"]
+        if original is not None and os.path.exists(original["path"]):
+            entry["same_geometry_as"] = original["path"]
+            return finish("duplicate", f"Same geometry as {original['path']}.")
+        if derived is not None:
+            entry["same_geometry_as"] = derived["path"]
+            return finish("derived", f"Same geometry as the {derived['stage']} mesh {derived['path']}.")
 
-            # --- STEP 1: Basic Cleaning ---
-            ms.meshing_merge_close_vertices()
-            ms.meshing_remove_duplicate_faces()
-            ms.meshing_remove_duplicate_vertices()
+        for step_name, step in REPAIR_STEPS:
+            try:
+                with instrumentation.span(step_name, cat="preprocess", source=filepath) as s:
+                    step(ms)
+            except Exception as e:
+                return finish("failed", f"{step_name} failed ({e}).")
+            entry["steps"][step_name] = s["dur"]
+
+        # Export
+        os.makedirs(os.path.dirname(task["output"]), exist_ok=True)
+        with instrumentation.span("save", cat="preprocess", source=filepath) as s:
+            mesh_io.save_meshset(ms, task["output"], obj=task.get("save_obj", SAVE_OBJ))
+        entry["steps"]["save"] = s["dur"]
+        entry["final_faces"] = ms.current_mesh().face_number()
+        entry["output_hash"] = provenance.mesh_geometry_hash(ms.current_mesh())
 
-            # --- STEP 2: Geometric Repair (THE NEW FIX) ---
-            # 1. Remove small floating disconnected pieces (noise often causes non-manifold errors)
-            ms.meshing_remove_connected_component_by_face_number(mincomponentsize=50)
+        print(f"Fixed & Converted: {filename} ({initial_face_count} -> {entry['final_faces']} faces)")
+        return finish("processed")
 
-            # 2. Repair Non-Manifold Edges by removing faces sharing them
-            # This makes the mesh "open" (holes) but "manifold" (valid for math)
-            ms.meshing_repair_non_manifold_edges(method="Remove Faces")
+    except Exception as e:
+        return finish("failed", f"{e}")
 
-            # 3. Repair Non-Manifold Vertices
-            ms.meshing_repair_non_manifold_vertices(vertdispratio=0)
 
-            # --- STEP 3: Re-orienting ---
-            # Now that it is manifold, we can safely re-orient
+def iter_processed(tasks, num_workers):
+    # Yields (task, entry) as files finish, in completion order
+    if num_workers <= 1:
+        for task in tasks:
+            yield task, process_file(task)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx) as pool:
+        futures = {pool.submit(process_file, task): task for task in tasks}
+        for future in concurrent.futures.as_completed(futures):
+            task = futures[future]
             try:
-                # Use geometric heuristic to orient faces (better for disconnected components?)
-                ms.meshing_re_orient_faces_by_geometry()
-            except Exception:
-                # Fallback to coherent orientation if geometric fails
-                try:
-                    ms.meshing_re_orient_faces_coherently()
-                except Exception:
-                    print(f"Skipping {filename}: Geometry too broken to re-orient.")
-                    continue
+                yield task, future.result()
+            except Exception as e:
+                # Worker died (e.g. a crash inside PyMeshLab); keep going
+                print(f"\033[91mFailed {os.path.basename(task['source'])}: {e}\033[0m")
+                yield task, {"dataset": task["dataset"], "output": task["output"],
+                             "status": "failed", "message": str(e), "steps": {}}
+
+
+def first_seen(index, path):
+    # When `path` was first recorded, None if it never was
+    known = index.get(path)
+    return known["created_at"] if known is not None else None
+
+
+def record_provenance(index, task, entry):
+    # Adds the raw file and its cleaned output to the provenance index. A
+    # duplicate that a worker running at the same time let through is
+    # caught here: its output is removed and the entry marked.
+    if not entry.get("geometry_hash"):
+        return
+    source = task["source"]
+    if entry["status"] == "processed":
+        other = index.find(entry["geometry_hash"], stages=("raw",), exclude=source,
+                           before=first_seen(index, source))
+        if other is not None and os.path.exists(other["path"]):
+            for name in list(mesh_io.binary_paths(task["output"])) + [task["output"]]:
+                if os.path.exists(name):
+                    os.remove(name)
+            entry.update(status="duplicate", same_geometry_as=other["path"],
+                         message=f"Same geometry as {other['path']}.")
+            print(f"Skipping {os.path.basename(source)}: {entry['message']}")
+    details = {"dataset": task["dataset"]}
+    if entry.get("same_geometry_as"):
+        details["same_geometry_as"] = entry["same_geometry_as"]
+    index.record(source, entry["geometry_hash"], "raw", faces=entry.get("initial_faces"), **details)
+    if entry["status"] == "processed":
+        index.record(task["output"], entry["output_hash"], "cleaned", parent=source,
+                     faces=entry.get("final_faces"), dataset=task["dataset"])
 
-            # Fix for dark meshes (inverted normals) common in ModelNet40
-            # We force flip to ensure outside is outside.
-            # Note: re_orient_faces_coherently makes them consistent, but might be consistently wrong (inside out).
-            # Checking volume or similar might be better, but for now, let's try flipping if it looks dark.
-            # Actually, let's just ensure normals are computed correctly.
-            # If the user says it looks like the picture (dark silhouette), it's likely inverted.
-            # Let's add a step to invert.
-            # ms.meshing_invert_face_orientation(forceflip=True) 
-            
-            # Fix for dark meshes (inverted normals) common in ModelNet40
-            # Reverted unconditional flip as it broke other meshes.
-            # We will rely on re_orient_faces_coherently for now.
-            # If specific meshes are problematic, we might need a more sophisticated check.
-            
-            # Smooth shading
-            ms.compute_normal_per_vertex()
-
-            # --- STEP 4: Scaling ---
-            ms.compute_matrix_from_scaling_or_normalization(axisx=1.0, axisy=1.0, axisz=1.0, unitflag=True, freeze=True)
-
-            # Export
-            final_face_count = ms.current_mesh().face_number()
-            print(f"  Final faces: {final_face_count}")
-            out_name = os.path.join(out_path, name_only + ".obj")
-            ms.save_current_mesh(out_name)
-            print(f"Fixed & Converted: {filename}\n")
+
+def print_step_summary(entries):
+    totals = {}
+    for entry in entries:
+        for step_name, seconds in entry.get("steps", {}).items():
+            totals[step_name] = totals.get(step_name, 0.0) + seconds
+    if not totals:
+        return
+    overall = sum(totals.values())
+    print("\n--- Time per step (processed this run) ---")
+    for step_name, seconds in sorted(totals.items(), key=lambda kv: -kv[1]):
+        print(f"  {step_name:<30} {seconds:8.3f}s  {100 * seconds / overall:5.1f}%")
+
+
+def preprocess_models(num_workers=NUM_WORKERS, force=False, manifest_path=MANIFEST_FILE, save_obj=SAVE_OBJ):
+    manifest = load_manifest(manifest_path)
+    tasks = build_tasks(save_obj)
+
+    todo = []
+    for task in tasks:
+        if not force and is_up_to_date(task, manifest.get(task["source"])):
+            continue
+        todo.append(task)
+    print(f"--- Preprocessing {len(todo)} of {len(tasks)} files ({len(tasks) - len(todo)} unchanged) ---")
+
+    done = []
+    with provenance.ProvenanceIndex() as index:
+        for task, entry in iter_processed(todo, num_workers):
+            record_provenance(index, task, entry)
+            manifest[task["source"]] = entry
+            done.append(entry)
+            # Saved as files finish so an interrupted run keeps its progress
+            save_manifest(manifest, manifest_path)
+
+    print_step_summary(done)
+    return manifest
 
 
 if __name__ == "__main__":
-    preprocess_models()
+    parser = argparse.ArgumentParser(description="Clean, repair and normalize the raw models.")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Number of worker processes (1 = serial, 0 = one per core)")
+    parser.add_argument("--save-obj", action="store_true",
+                        help="Also write the cleaned meshes as OBJ for inspection")
+    parser.add_argument("--trace", default=None,
+                        help="Write span timings and peak RSS of every step to this file")
+    parser.add_argument("--trace-format", choices=instrumentation.TRACE_FORMATS, default="jsonl",
+                        help="jsonl: one record per line; chrome: load in chrome://tracing or Perfetto")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Run each step under cProfile and dump .prof files here (needs --trace)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess every file, even if it is unchanged since the last run")
+    args = parser.parse_args()
+    if args.trace:
+        instrumentation.configure(args.trace, args.trace_format, args.profile_dir)
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    preprocess_models(num_workers=workers, force=args.force, save_obj=args.save_obj)
@@ -0,0 +1,266 @@
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+import decimation_algorithms
+import mesh_io
+
+PROVENANCE_FILE = "provenance.sqlite"
+
+# Lineage stages: a raw download, its cleaned benchmark source
+# (model_preprocessor.py), and a decimated output (experiment_runner.py)
+STAGES = ("raw", "cleaned", "decimated")
+
+# Stem of a file saved by experiment_runner.decimated_path, e.g.
+# "190698-frog_statue_Clustering_50pct", for outputs the index has not seen
+DERIVED_NAME_RE = re.compile(r"_(?:%s)(?:_.+)?_\d+pct$" % "|".join(
+    re.escape(name) for name in sorted(decimation_algorithms.ALGORITHMS, key=len, reverse=True)))
+
+
+def geometry_hash(vertices, faces):
+    # Fingerprint of a triangle mesh's geometry. It ignores vertex and face
+    # order and face orientation, so re-exports and format conversions hash
+    # alike. Coordinates are compared at the binary cache's float32
+    # precision, so a mesh hashes the same in memory and on disk.
+    vertices = np.asarray(vertices, dtype=mesh_io.VERTEX_DTYPE)
+    faces = np.asarray(faces, dtype=np.int64)
+    h = hashlib.sha256()
+    if len(vertices) == 0 or len(faces) == 0:
+        h.update(b"empty")
+        return h.hexdigest()
+    # Vertices renumbered by position; coincident ones merge
+    positions, ids = np.unique(vertices, axis=0, return_inverse=True)
+    tris = np.sort(ids.reshape(-1)[faces], axis=1)
+    tris = tris[np.lexsort(tris.T[::-1])]
+    h.update(np.ascontiguousarray(positions).tobytes())
+    h.update(np.ascontiguousarray(tris).tobytes())
+    return h.hexdigest()
+
+
+def mesh_geometry_hash(mesh):
+    return geometry_hash(mesh.vertex_matrix(), mesh.face_matrix())
+
+
+def _key(path):
+    return os.path.normpath(path)
+
+
+def _file_state(path):
+    # (mtime_ns, size) of the files holding the mesh at `path`
+    mtime, size = 0, 0
+    for name in mesh_io.mesh_files(path):
+        stat = os.stat(name)
+        mtime, size = max(mtime, stat.st_mtime_ns), size + stat.st_size
+    return mtime, size
+
+
+class ProvenanceIndex:
+    # SQLite table of every mesh the pipeline has seen: its geometry hash,
+    # its stage and the mesh it was made from. Lookups by path and by hash
+    # go through indexes, so they stay cheap at Thingi10K scale.
+    # Worker processes may write concurrently; SQLite serializes them.
+    # SQLite locking is not reliable on shared filesystems, so shard nodes
+    # open the shared index with readonly=True and record into their own
+    # (merged by `sharding.py merge`).
+
+    def __init__(self, path=PROVENANCE_FILE, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        # Outputs are recorded on the runner's writer thread (io_pipeline)
+        # once saved, one thread at a time
+        if not readonly:
+            self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        elif os.path.exists(path):
+            self.conn = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True,
+                                        timeout=60, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS meshes (
+                path TEXT PRIMARY KEY,
+                geometry_hash TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                parent_path TEXT,
+                parent_hash TEXT,
+                faces INTEGER,
+                details TEXT NOT NULL,
+                mtime_ns INTEGER,
+                size INTEGER,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS meshes_by_hash ON meshes (geometry_hash, created_at)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _rows(self, cur):
+        names = [d[0] for d in cur.description]
+        rows = [dict(zip(names, values)) for values in cur]
+        for row in rows:
+            row["details"] = json.loads(row["details"])
+        return rows
+
+    def get(self, path):
+        rows = self._rows(self.conn.execute("SELECT * FROM meshes WHERE path = ?", (_key(path),)))
+        return rows[0] if rows else None
+
+    def record(self, path, geometry_hash, stage, parent=None, faces=None, **details):
+        # Adds or updates the mesh at `path`. The parent's hash is taken
+        # from the index when the parent is known.
+        if self.readonly:
+            raise ValueError(f"{self.path} is open read-only")
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage!r}. Use one of: {', '.join(STAGES)}")
+        parent_entry = self.get(parent) if parent else None
+        mtime, size = _file_state(path) if mesh_io.mesh_exists(path) else (None, None)
+        self.conn.execute(
+            """INSERT OR REPLACE INTO meshes
+               (path, geometry_hash, stage, parent_path, parent_hash, faces, details, mtime_ns, size, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT created_at FROM meshes WHERE path = ?), ?))""",
+            (_key(path), geometry_hash, stage, _key(parent) if parent else None,
+             parent_entry["geometry_hash"] if parent_entry else None, faces,
+             json.dumps(details, sort_keys=True), mtime, size, _key(path), time.time()),
+        )
+        self.conn.commit()
+
+    def find(self, geometry_hash, stages=STAGES, exclude=None, before=None):
+        # Earliest recorded mesh with this geometry in one of `stages`, other
+        # than `exclude` and the meshes made from it (and first recorded
+        # before the time `before`, if given); None if there is none
+        marks = ",".join("?" * len(stages))
+        exclude = _key(exclude) if exclude else ""
+        cur = self.conn.execute(
+            f"""SELECT * FROM meshes WHERE geometry_hash = ? AND stage IN ({marks})
+                AND path != ? AND COALESCE(parent_path, '') != ? AND (? IS NULL OR created_at < ?)
+                ORDER BY created_at LIMIT 1""",
+            (geometry_hash, *stages, exclude, exclude, before, before),
+        )
+        rows = self._rows(cur)
+        return rows[0] if rows else None
+
+    def lineage(self, path):
+        # [entry of `path`, its parent, ..., the raw download] as far as known
+        chain, seen = [], set()
+        entry = self.get(path)
+        while entry is not None and entry["path"] not in seen:
+            chain.append(entry)
+            seen.add(entry["path"])
+            entry = self.get(entry["parent_path"]) if entry["parent_path"] else None
+        return chain
+
+    def fingerprint(self, path, stage="cleaned"):
+        # Geometry hash of the mesh at `path`, from the index while the
+        # files are unchanged; otherwise the mesh is read and hashed and
+        # recorded (keeping its stage and parent if already known), unless
+        # the index is read-only
+        entry = self.get(path)
+        if entry is not None and (entry["mtime_ns"], entry["size"]) == _file_state(path):
+            return entry["geometry_hash"]
+        vertices, faces = mesh_io.load_arrays(path)
+        digest = geometry_hash(vertices, faces)
+        if self.readonly:
+            return digest
+        if entry is not None:
+            self.record(path, digest, entry["stage"], entry["parent_path"], len(faces), **entry["details"])
+        else:
+            self.record(path, digest, stage, faces=len(faces))
+        return digest
+
+    def merge_index(self, path):
+        # Copies every mesh of another index (a shard's) into this one. A
+        # mesh already here keeps its first-seen time, and outputs whose
+        # parent was unknown to the shard get the parent's hash from here.
+        self.conn.execute("ATTACH DATABASE ? AS other", (path,))
+        try:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO meshes
+                   (path, geometry_hash, stage, parent_path, parent_hash, faces, details, mtime_ns, size, created_at)
+                   SELECT o.path, o.geometry_hash, o.stage, o.parent_path, o.parent_hash, o.faces, o.details,
+                          o.mtime_ns, o.size, COALESCE((SELECT created_at FROM meshes WHERE path = o.path), o.created_at)
+                   FROM other.meshes o"""
+            )
+            self.conn.execute(
+                """UPDATE meshes SET parent_hash = (SELECT p.geometry_hash FROM meshes p WHERE p.path = meshes.parent_path)
+                   WHERE parent_hash IS NULL AND parent_path IS NOT NULL"""
+            )
+            self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE other")
+
+
+def filter_sources(models, index):
+    # Splits [(mesh_type, path)] benchmark sources into the ones to run and
+    # {path: reason} for the ones to skip: decimated outputs (known to the
+    # index, or named like one) and duplicates of an earlier source
+    kept, skipped, seen = [], {}, {}
+    for mesh_type, path in models:
+        if DERIVED_NAME_RE.search(os.path.splitext(os.path.basename(path))[0]):
+            skipped[path] = "named like a decimated output"
+            continue
+        digest = index.fingerprint(path)
+        derived = index.find(digest, stages=("decimated",), exclude=path)
+        if derived is not None:
+            skipped[path] = f"decimated output of {derived['parent_path'] or 'an unknown mesh'} ({derived['path']})"
+        elif digest in seen:
+            skipped[path] = f"same geometry as {seen[digest]}"
+        else:
+            seen[digest] = path
+            kept.append((mesh_type, path))
+    return kept, skipped
+
+
+def print_lineage(chain):
+    for depth, entry in enumerate(chain):
+        line = f"{'  ' * depth}{entry['stage']:<9} {entry['path']} [{entry['geometry_hash'][:12]}]"
+        if entry["faces"] is not None:
+            line += f" {entry['faces']} faces"
+        if entry["details"]:
+            line += " (" + ", ".join(f"{k}={v}" for k, v in sorted(entry["details"].items())) + ")"
+        print(line)
+
+
+if __name__ == "__main__":
+    # The runner imports this module, so its settings are only pulled in here
+    import experiment_runner
+
+    parser = argparse.ArgumentParser(description="Geometry-hash provenance of raw, cleaned and decimated meshes.")
+    parser.add_argument("--index", default=PROVENANCE_FILE, help="Provenance database")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan = sub.add_parser("scan", help="Fingerprint the benchmark sources and list the ones the runner skips")
+    scan.add_argument("--dataset", action="append", default=None, metavar="TYPE=DIR",
+                      help="Dataset directory per mesh type (as given to experiment_runner.py)")
+    lineage = sub.add_parser("lineage", help="Print where a mesh came from")
+    lineage.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    with ProvenanceIndex(args.index) as index:
+        if args.command == "scan":
+            dataset_dirs = (experiment_runner.parse_dataset_dirs(args.dataset) if args.dataset
+                            else experiment_runner.DATASET_DIRS)
+            models = [(mesh_type, path) for mesh_type, dir_path in dataset_dirs.items()
+                      for path in mesh_io.list_meshes(dir_path)]
+            kept, skipped = filter_sources(models, index)
+            print(f"{len(kept)} of {len(models)} sources are benchmarked")
+            for path, reason in skipped.items():
+                print(f"  skip {path}: {reason}")
+        else:
+            for path in args.paths:
+                chain = index.lineage(path)
+                if not chain:
+                    print(f"{path}: not in {args.index}")
+                print_lineage(chain)
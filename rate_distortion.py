@@ -0,0 +1,150 @@
+import argparse
+import os
+
+import decimation_algorithms
+import instrumentation
+import timing
+from experiment_runner import (DATASET_DIRS, MESH_CACHE, METRIC_BACKEND, SKIP_DUPLICATES, benchmark_sources,
+                               measure_distances, search_threshold)
+from mesh_cache import clone_meshset
+from metrics import DISTANCE_FIELDNAMES
+from result_store import write_csv_atomic
+
+RD_RESULTS_FILE = "rate_distortion.csv"
+
+# Fractions of the original face count to keep, densest first
+LADDER = [0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.02, 0.01]
+ALGORITHMS = ["QEM", "Clustering"]
+
+# Many levels per model, so fewer repeats than the main sweep
+RD_TIMING = timing.timing_config(min_repeats=3, max_repeats=10)
+
+FIELDNAMES = ['Model', 'Type', 'Algorithm', 'Keep', 'InitialFaces', 'TargetFaces', 'FinalFaces',
+              'Time', 'IncrementalTime', 'TimeRSE', 'TimeRepeats', 'Progressive',
+              'TuningProbes', 'TuningTime', 'HausdorffDist'] + DISTANCE_FIELDNAMES
+
+
+def run_ladder(filepath, mesh_type, algo, ladder, timing_config, metric_backend=METRIC_BACKEND, progressive=True):
+    # One row per level of `ladder` for one model and algorithm.
+    #
+    # Progressive algorithms (QEM) decimate each level from the previous
+    # level's result; as in experiment_runner, Time is the whole chain down
+    # to that level and IncrementalTime the step from the level above. Threshold-driven algorithms start from the
+    # original every time, but each threshold search is warm-started from
+    # the previous level and bracketed by every earlier probe.
+    filename = os.path.basename(filepath)
+    mesh_orig = MESH_CACHE.get(filepath)
+    initial_faces = mesh_orig.face_number()
+    spec = decimation_algorithms.get_algorithm(algo)
+    chained = progressive and spec['progressive']
+    threshold_driven = spec['face_control'] == decimation_algorithms.FACE_CONTROL_THRESHOLD
+
+    rows = []
+    probes = {}
+    previous = None  # (threshold, target) of the level above
+    ms_prev = None
+    cumulative = 0.0
+
+    for keep in sorted(ladder, reverse=True):
+        target_faces = max(int(initial_faces * keep), 1)
+
+        threshold = None
+        probes_before = len(probes)
+        with instrumentation.span("tune", model=filename, algorithm=algo, keep=keep) as tune:
+            if threshold_driven:
+                # Face count scales roughly with threshold^-2 (cells on a surface)
+                guess = previous[0] * (previous[1] / target_faces) ** 0.5 if previous else None
+                threshold = search_threshold(mesh_orig, target_faces, algo, probes=probes, guess=guess)
+                previous = (threshold, target_faces)
+
+        base = ms_prev.current_mesh() if chained and ms_prev is not None else mesh_orig
+        with instrumentation.span("decimate", model=filename, algorithm=algo, keep=keep):
+            stats, ms = timing.measure(
+                lambda ms_run: decimation_algorithms.apply(ms_run, algo, target_faces, threshold),
+                lambda: clone_meshset(base),
+                config=timing_config
+            )
+        cumulative = cumulative + stats['median'] if chained else stats['median']
+
+        mesh_dec = ms.current_mesh()
+        with instrumentation.span("hausdorff", model=filename, algorithm=algo, keep=keep):
+            distances = measure_distances(filepath, mesh_orig, mesh_dec, metric_backend)
+
+        row = {
+            'Model': filename,
+            'Type': mesh_type,
+            'Algorithm': algo,
+            'Keep': keep,
+            'InitialFaces': initial_faces,
+            'TargetFaces': target_faces,
+            'FinalFaces': mesh_dec.face_number(),
+            'Time': cumulative,
+            'IncrementalTime': stats['median'],
+            'TimeRSE': stats['rse'],
+            'TimeRepeats': stats['repeats'],
+            'Progressive': chained,
+            'TuningProbes': len(probes) - probes_before,
+            'TuningTime': tune['dur'],
+        }
+        row.update(distances)
+        rows.append(row)
+        print(f"    {filename} keep={keep:<5} {algo}: Time={cumulative:.4f}s "
+              f"(incremental {stats['median']:.4f}s), HD={distances['HausdorffDist']:.6f}, "
+              f"Faces={row['FinalFaces']}, probes={row['TuningProbes']}")
+
+        if chained:
+            ms_prev = ms
+    return rows
+
+
+def run_rate_distortion(ladder=None, algorithms=None, timing_config=None, metric_backend=METRIC_BACKEND,
+                        progressive=True, skip_duplicates=SKIP_DUPLICATES):
+    ladder = ladder or LADDER
+    algorithms = algorithms or ALGORITHMS
+    timing_config = timing_config or RD_TIMING
+    rows = []
+
+    # Same sources as the main sweep (duplicates and decimated outputs left out)
+    sources = benchmark_sources(DATASET_DIRS, skip_duplicates)
+    for mesh_type in DATASET_DIRS:
+        files = [path for source_type, path in sources if source_type == mesh_type]
+        print(f"--- {mesh_type} ({len(files)} files, {len(ladder)} levels) ---")
+        for filepath in files:
+            for algo in algorithms:
+                try:
+                    rows.extend(run_ladder(filepath, mesh_type, algo, ladder, timing_config,
+                                           metric_backend, progressive))
+                except Exception as e:
+                    print(f"\033[91m    Failed {algo} on {os.path.basename(filepath)}: {e}\033[0m")
+            # Completed models survive an interrupted sweep
+            write_csv_atomic(RD_RESULTS_FILE, FIELDNAMES, rows)
+
+    print(f"Rate-distortion sweep complete. Results saved to {RD_RESULTS_FILE}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time / error / face-count curves over a dense decimation ladder.")
+    parser.add_argument("--ladder", default=",".join(str(k) for k in LADDER),
+                        help="Comma-separated fractions of the original faces to keep")
+    parser.add_argument("--algorithms", default=",".join(ALGORITHMS),
+                        help="Comma-separated algorithms. Registered: " + ", ".join(decimation_algorithms.ALGORITHMS))
+    parser.add_argument("--independent", action="store_true",
+                        help="Decimate every level from the original, even for progressive algorithms")
+    parser.add_argument("--max-repeats", type=int, default=RD_TIMING['max_repeats'],
+                        help="Upper bound on timed runs per level")
+    parser.add_argument("--metric-backend", choices=["pymeshlab", "kdtree"], default=METRIC_BACKEND,
+                        help="Surface distance implementation")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Also run sources that duplicate another one or are decimated outputs "
+                             "(see provenance.py)")
+    args = parser.parse_args()
+
+    ladder = [float(k) for k in args.ladder.split(",") if k.strip()]
+    algorithms = [a.strip() for a in args.algorithms.split(",") if a.strip()]
+    for algo in algorithms:
+        decimation_algorithms.get_algorithm(algo)
+    config = dict(RD_TIMING, max_repeats=args.max_repeats,
+                  min_repeats=min(RD_TIMING['min_repeats'], args.max_repeats))
+    run_rate_distortion(ladder, algorithms, config, args.metric_backend, progressive=not args.independent,
+                        skip_duplicates=not args.keep_duplicates)
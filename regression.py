@@ -0,0 +1,181 @@
+import argparse
+import datetime
+import sys
+
+import numpy as np
+import pandas as pd
+from statsmodels.stats.multitest import multipletests
+
+import resampling
+import timing
+from result_store import STORE_FILE, ResultStore, write_csv_atomic
+
+REPORT_FILE = "regression_report.csv"
+
+ALPHA = 0.05  # Family-wise, Holm-corrected over every compared job
+# Significant slowdowns smaller than this (relative, on the median) are
+# treated as host noise and not flagged
+MIN_SLOWDOWN = 0.10
+# Relative HausdorffDist increase flagged as an error regression. The
+# distance of a job is deterministic, so no test is needed.
+ERROR_TOLERANCE = 0.01
+N_RESAMPLES = 10000
+SEED = 0
+
+# Environment fields shown side by side
+ENVIRONMENT_FIELDS = ["label", "created", "pymeshlab_version", "numpy_version", "scipy_version", "python",
+                      "cpu_model", "usable_cores", "workers", "threads", "git_sha", "host"]
+
+FIELDNAMES = ['Model', 'Type', 'Algorithm', 'Params', 'Decimation', 'BaseTime', 'NewTime', 'TimeRatio',
+              'DiffCILow', 'DiffCIHigh', 'TimeP', 'TimePHolm', 'BaseHD', 'NewHD', 'HDChange', 'Status']
+
+
+def time_samples(row):
+    # Timed repeats of a result row without Tukey outliers (see timing.py);
+    # rows from before the timing harness have only Time
+    raw = row.get('TimeSamples')
+    samples = [float(s) for s in raw.split(";") if s] if raw else [float(row['Time'])]
+    return np.array(timing.split_outliers(samples)[0])
+
+
+def compare_job(base, new, index, n_resamples=N_RESAMPLES, seed=SEED):
+    # Permutation p-value and BCa interval of mean(new) - mean(base) over
+    # the timed repeats of one job (resampling.py), plus the error change
+    a, b = time_samples(base), time_samples(new)
+    result = {
+        'Model': new['Model'], 'Type': new['Type'], 'Algorithm': new['Algorithm'],
+        'Params': new.get('Params', ''), 'Decimation': new['Decimation'],
+        'BaseTime': float(base['Time']), 'NewTime': float(new['Time']),
+        'TimeRatio': float(new['Time']) / float(base['Time']) if float(base['Time']) > 0 else np.nan,
+        'DiffCILow': None, 'DiffCIHigh': None, 'TimeP': None, 'TimePHolm': None,
+        'BaseHD': float(base['HausdorffDist']), 'NewHD': float(new['HausdorffDist']),
+    }
+    result['HDChange'] = ((result['NewHD'] - result['BaseHD']) / result['BaseHD']
+                          if result['BaseHD'] > 0 else (np.inf if result['NewHD'] > 0 else 0.0))
+    if len(a) >= 2 and len(b) >= 2:
+        extreme = resampling.permutation_chunk(a, b, n_resamples, np.random.SeedSequence([seed, index, 1]))
+        boot = resampling.bootstrap_chunk(a, b, n_resamples, np.random.SeedSequence([seed, index, 0]))
+        result['TimeP'] = (extreme + 1) / (n_resamples + 1)
+        result['DiffCILow'], result['DiffCIHigh'] = resampling.bca_interval(a, b, boot)
+    return result
+
+
+def compare_runs(base_rows, new_rows, alpha=ALPHA, min_slowdown=MIN_SLOWDOWN, error_tolerance=ERROR_TOLERANCE,
+                 n_resamples=N_RESAMPLES):
+    # One report row per job present in both runs ({job_id: row} each).
+    # Status: "slower" / "error" (regressions, both may apply), "faster" or "ok".
+    shared = sorted(set(base_rows) & set(new_rows),
+                    key=lambda j: (new_rows[j]['Type'], new_rows[j]['Model'], new_rows[j]['Algorithm'],
+                                   new_rows[j].get('Params', ''), new_rows[j]['Decimation']))
+    report = [compare_job(base_rows[j], new_rows[j], i, n_resamples) for i, j in enumerate(shared)]
+
+    tested = [r for r in report if r['TimeP'] is not None]
+    if tested:
+        holm = multipletests([r['TimeP'] for r in tested], alpha=alpha, method='holm')[1]
+        for r, p in zip(tested, holm):
+            r['TimePHolm'] = float(p)
+    for r in report:
+        significant = r.get('TimePHolm') is not None and r['TimePHolm'] < alpha
+        flags = []
+        if significant and r['TimeRatio'] > 1 + min_slowdown and r['DiffCILow'] > 0:
+            flags.append('slower')
+        if r['HDChange'] > error_tolerance:
+            flags.append('error')
+        if not flags and significant and r['TimeRatio'] < 1 - min_slowdown and r['DiffCIHigh'] < 0:
+            flags.append('faster')
+        r['Status'] = "+".join(flags) or 'ok'
+    return report
+
+
+def is_regression(row):
+    return 'slower' in row['Status'] or 'error' in row['Status']
+
+
+def _environment(run):
+    meta = run['metadata']
+    threads = {k: v for k, v in (meta.get('thread_env') or {}).items() if v}
+    return {
+        'label': run['label'] or '',
+        'created': datetime.datetime.fromtimestamp(run['created_at']).strftime('%Y-%m-%d %H:%M'),
+        'threads': ", ".join(f"{k}={v}" for k, v in threads.items()) or 'default',
+        'git_sha': ((meta.get('git_sha') or '?')[:12] + ('+dirty' if meta.get('git_dirty') else '')),
+        **{k: meta.get(k) for k in ENVIRONMENT_FIELDS if k in meta and k != 'git_sha'},
+    }
+
+
+def print_runs(store):
+    print(f"{'Run':<24} {'Label':<20} {'Rows':>5}  {'PyMeshLab':<10} {'Git':<13} CPU")
+    for run in store.runs():
+        env = _environment(run)
+        print(f"{run['run_id']:<24} {env['label']:<20} {run['rows']:>5}  {env.get('pymeshlab_version') or '?':<10} "
+              f"{env['git_sha']:<13} {env.get('cpu_model') or '?'}")
+
+
+def print_comparison(base_run, new_run, report):
+    print("\n--- Environment ---")
+    base_env, new_env = _environment(base_run), _environment(new_run)
+    print(f"{'':<18} {'baseline ' + base_run['run_id']:<40} {'candidate ' + new_run['run_id']:<40}")
+    for field in ENVIRONMENT_FIELDS:
+        a, b = base_env.get(field), new_env.get(field)
+        marker = '' if a == b or field in ('created', 'label') else '  *'
+        print(f"{field:<18} {str(a):<40} {str(b):<40}{marker}")
+
+    print("\n--- Per-job comparison (flagged jobs; Holm-corrected permutation test on timed repeats) ---")
+    table = pd.DataFrame(report, columns=FIELDNAMES)
+    flagged = table[table['Status'] != 'ok']
+    if flagged.empty:
+        print("  No significant changes.")
+    else:
+        print(flagged.drop(columns=['DiffCILow', 'DiffCIHigh', 'TimeP']).to_string(
+            index=False, float_format=lambda v: f"{v:.4g}"))
+
+    counts = table['Status'].value_counts()
+    print(f"\n{len(report)} jobs compared: " + ", ".join(f"{n} {status}" for status, n in counts.items()))
+    if len(table):
+        print(f"Median time ratio (candidate / baseline): {table['TimeRatio'].median():.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two recorded benchmark runs and exit non-zero on a "
+                                                 "significant slowdown or error increase.")
+    parser.add_argument("--store", default=STORE_FILE, help="Result store written by experiment_runner.py")
+    parser.add_argument("--list", action="store_true", help="List recorded runs and exit")
+    parser.add_argument("--baseline", default="previous",
+                        help="Run id (or prefix), label, 'latest' or 'previous' (default)")
+    parser.add_argument("--candidate", default="latest", help="Run to check against the baseline")
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--min-slowdown", type=float, default=MIN_SLOWDOWN,
+                        help="Relative slowdown of the median below which nothing is flagged")
+    parser.add_argument("--error-tolerance", type=float, default=ERROR_TOLERANCE,
+                        help="Relative HausdorffDist increase flagged as an error regression")
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES,
+                        help="Permutations and bootstrap resamples per job")
+    args = parser.parse_args()
+
+    with ResultStore(args.store) as store:
+        if args.list:
+            print_runs(store)
+            sys.exit(0)
+        base_run, new_run = store.find_run(args.baseline), store.find_run(args.candidate)
+        if base_run is None or new_run is None:
+            missing = args.baseline if base_run is None else args.candidate
+            print(f"Error: no run matches '{missing}' in {args.store}. Recorded runs:")
+            print_runs(store)
+            sys.exit(2)
+        base_rows, new_rows = store.run_rows(base_run['run_id']), store.run_rows(new_run['run_id'])
+
+    report = compare_runs(base_rows, new_rows, args.alpha, args.min_slowdown, args.error_tolerance,
+                          args.resamples)
+    print_comparison(base_run, new_run, report)
+    only = len(set(base_rows) ^ set(new_rows))
+    if only:
+        print(f"{only} jobs ran in only one of the two runs and were not compared.")
+    write_csv_atomic(REPORT_FILE, FIELDNAMES, report)
+    print(f"Report saved to {REPORT_FILE}")
+
+    regressions = [r for r in report if is_regression(r)]
+    if regressions:
+        print(f"\033[91mREGRESSION: {len(regressions)} of {len(report)} jobs are significantly slower "
+              f"or less accurate than the baseline.\033[0m")
+        sys.exit(1)
+    print("No regressions against the baseline.")
@@ -0,0 +1,197 @@
+import argparse
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+from data_analysis import RESPONSES, RESULTS_FILE, Groups, load_results
+from result_store import write_csv_atomic
+
+RESAMPLING_RESULTS_FILE = "resampling_results.csv"
+
+N_RESAMPLES = 20000     # Bootstrap resamples per contrast
+N_PERMUTATIONS = 20000  # Label permutations per contrast
+CONFIDENCE = 0.95
+SEED = 0
+# Index-matrix entries (resamples x rows) generated at a time. Work is cut
+# into chunks of this size and every chunk has its own seed, derived from
+# SEED, the contrast and the chunk number only, so results do not depend
+# on the number of workers.
+CHUNK_ELEMENTS = 1 << 22
+NUM_WORKERS = 0  # 0 = one per core
+
+FIELDNAMES = ['Response', 'Type', 'Decimation', 'AlgorithmA', 'AlgorithmB', 'NA', 'NB',
+              'MeanA', 'MeanB', 'Diff', 'CILow', 'CIHigh', 'PermutationP', 'Resamples', 'Permutations']
+
+
+def build_contrasts(df):
+    # One contrast per response, Type x Decimation cell and pair of
+    # algorithms: (description, values A, values B). Statistic: mean(B) - mean(A).
+    cells = Groups(df, ['Type', 'Decimation', 'Algorithm'])
+    by_cell = {}
+    for (mesh_type, decimation, algo), idx in zip(cells.labels, cells.indices):
+        by_cell.setdefault((mesh_type, decimation), []).append((algo, idx))
+
+    contrasts = []
+    for response in RESPONSES:
+        values = df[response].to_numpy(dtype=float)
+        for (mesh_type, decimation), algos in by_cell.items():
+            for (algo_a, idx_a), (algo_b, idx_b) in itertools.combinations(algos, 2):
+                contrasts.append(({
+                    'Response': response, 'Type': mesh_type, 'Decimation': decimation,
+                    'AlgorithmA': algo_a, 'AlgorithmB': algo_b,
+                }, values[idx_a], values[idx_b]))
+    return contrasts
+
+
+def _chunks(total, rows):
+    # (start, size) of the chunks `total` resamples of `rows` rows are cut into
+    size = max(1, CHUNK_ELEMENTS // max(rows, 1))
+    return [(start, min(size, total - start)) for start in range(0, total, size)]
+
+
+def _seed(seed, contrast, kind, chunk):
+    return np.random.SeedSequence([seed, contrast, kind, chunk])
+
+
+def bootstrap_chunk(a, b, size, seed_seq):
+    # mean(B*) - mean(A*) for `size` resamples; each row of an index
+    # matrix is one resample with replacement
+    rng = np.random.default_rng(seed_seq)
+    idx_a = rng.integers(0, len(a), size=(size, len(a)))
+    idx_b = rng.integers(0, len(b), size=(size, len(b)))
+    return b[idx_b].mean(axis=1) - a[idx_a].mean(axis=1)
+
+
+def permutation_chunk(a, b, size, seed_seq):
+    # Number of label permutations whose |mean difference| reaches the observed one
+    rng = np.random.default_rng(seed_seq)
+    pooled = np.concatenate([a, b])
+    observed = abs(b.mean() - a.mean())
+    perms = rng.permuted(np.broadcast_to(np.arange(len(pooled)), (size, len(pooled))), axis=1)
+    sum_a = pooled[perms[:, :len(a)]].sum(axis=1)
+    diff = (pooled.sum() - sum_a) / len(b) - sum_a / len(a)
+    # Relative tolerance so permutations equal to the observed split count
+    return int((np.abs(diff) >= observed * (1 - 1e-12)).sum())
+
+
+def jackknife_acceleration(a, b):
+    # BCa acceleration for mean(B) - mean(A) from leave-one-out estimates of
+    # each sample (the other held fixed), as scipy.stats.bootstrap does
+    num = den = 0.0
+    for sample, sign in ((a, -1.0), (b, 1.0)):
+        n = len(sample)
+        if n < 2:
+            continue
+        loo = sign * (sample.sum() - sample) / (n - 1)
+        u = (n - 1) * (loo.mean() - loo)
+        num += (u ** 3).sum() / n ** 3
+        den += (u ** 2).sum() / n ** 2
+    return num / (6 * den ** 1.5) if den > 0 else 0.0
+
+
+def bca_interval(a, b, boot, confidence=CONFIDENCE):
+    # Bias-corrected and accelerated percentile interval of mean(B) - mean(A)
+    theta = b.mean() - a.mean()
+    if boot.min() == boot.max():
+        return theta, theta
+    z0 = stats.norm.ppf(((boot < theta).sum() + (boot <= theta).sum()) / (2 * len(boot)))
+    accel = jackknife_acceleration(a, b)
+    z = stats.norm.ppf([(1 - confidence) / 2, (1 + confidence) / 2])
+    levels = stats.norm.cdf(z0 + (z0 + z) / (1 - accel * (z0 + z)))
+    if not np.all(np.isfinite(levels)):
+        # z0 is infinite when theta lies outside every resample; fall back to the percentile interval
+        levels = (1 + np.array([-confidence, confidence])) / 2
+    low, high = np.quantile(boot, levels)
+    return float(low), float(high)
+
+
+# --- Worker process state ---
+_SAMPLES = None
+
+
+def _init_worker(samples):
+    # The samples are shipped once per worker, not with every chunk
+    global _SAMPLES
+    _SAMPLES = samples
+
+
+def _run_chunk(task):
+    contrast, kind, chunk, size, seed = task
+    a, b = _SAMPLES[contrast]
+    fn = bootstrap_chunk if kind == 0 else permutation_chunk
+    return task, fn(a, b, size, _seed(seed, contrast, kind, chunk))
+
+
+def run_resampling(contrasts, n_resamples=N_RESAMPLES, n_permutations=N_PERMUTATIONS, num_workers=NUM_WORKERS,
+                   seed=SEED, confidence=CONFIDENCE):
+    # BCa interval and permutation p-value per contrast; one result row each
+    samples = [(a, b) for _, a, b in contrasts]
+    tasks = []
+    for i, (a, b) in enumerate(samples):
+        for kind, total in ((0, n_resamples), (1, n_permutations)):
+            for chunk, (_, size) in enumerate(_chunks(total, len(a) + len(b))):
+                tasks.append((i, kind, chunk, size, seed))
+
+    boots = {i: {} for i in range(len(samples))}
+    extremes = [0] * len(samples)
+    num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+    if num_workers > 1 and len(tasks) > 1:
+        print(f"Resampling {len(contrasts)} contrasts in {len(tasks)} chunks on {num_workers} worker processes...")
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx,
+                                                    initializer=_init_worker, initargs=(samples,)) as pool:
+            done = pool.map(_run_chunk, tasks, chunksize=max(1, len(tasks) // (4 * num_workers)))
+            results = list(done)
+    else:
+        print(f"Resampling {len(contrasts)} contrasts in {len(tasks)} chunks...")
+        _init_worker(samples)
+        results = [_run_chunk(task) for task in tasks]
+
+    for (i, kind, chunk, _, _), value in results:
+        if kind == 0:
+            boots[i][chunk] = value
+        else:
+            extremes[i] += value
+
+    rows = []
+    for i, (info, a, b) in enumerate(contrasts):
+        boot = np.concatenate([boots[i][c] for c in sorted(boots[i])])
+        low, high = bca_interval(a, b, boot, confidence)
+        rows.append(dict(info, NA=len(a), NB=len(b), MeanA=a.mean(), MeanB=b.mean(), Diff=b.mean() - a.mean(),
+                         CILow=low, CIHigh=high,
+                         # Two-sided; the observed labelling counts as one permutation
+                         PermutationP=(extremes[i] + 1) / (n_permutations + 1),
+                         Resamples=n_resamples, Permutations=n_permutations))
+    return rows
+
+
+def print_resampling(rows, confidence=CONFIDENCE):
+    print(f"\n--- Bootstrap (BCa, {confidence:.0%}) and permutation tests: mean(B) - mean(A) ---")
+    table = pd.DataFrame(rows, columns=FIELDNAMES).drop(columns=['Resamples', 'Permutations'])
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BCa bootstrap intervals and permutation tests "
+                                                 "for every Algorithm contrast per Type x Decimation.")
+    parser.add_argument("--input", default=RESULTS_FILE,
+                        help="Results as CSV, Parquet or Arrow/Feather (see data_analysis.py)")
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES,
+                        help="Bootstrap resamples per contrast")
+    parser.add_argument("--permutations", type=int, default=N_PERMUTATIONS,
+                        help="Label permutations per contrast")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Worker processes (0 = one per core); results do not depend on it")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    contrasts = build_contrasts(load_results(args.input))
+    rows = run_resampling(contrasts, args.resamples, args.permutations, args.workers, args.seed)
+    print_resampling(rows)
+    write_csv_atomic(RESAMPLING_RESULTS_FILE, FIELDNAMES, rows)
+    print(f"Resampling results saved to {RESAMPLING_RESULTS_FILE}")
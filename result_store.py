@@ -0,0 +1,223 @@
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+STORE_FILE = "experiment_results.sqlite"
+
+
+def job_key(mesh_hash, algorithm, params, target, library_version):
+    # Content-addressed key of one result row. Any change to the mesh
+    # contents, the algorithm settings or the library gives a new key.
+    payload = json.dumps(
+        [mesh_hash, algorithm, params, target, library_version], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def job_id(mesh_hash, algorithm, params, target):
+    # Identity of a job across runs: job_key without the library version,
+    # so the same job can be compared before and after an upgrade
+    payload = json.dumps([mesh_hash, algorithm, params, target], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    # SQLite table of result rows keyed by job_key().
+    # Rows are stored as JSON so new result columns need no migration.
+    #
+    # Every sweep is also recorded as a run (environment metadata) with its
+    # own copy of the rows it produced, keyed by job_id(), so runs on other
+    # machines or library versions can be compared side by side.
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        # Writes may be handed to a background writer thread (io_pipeline),
+        # one thread at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                job_key TEXT PRIMARY KEY,
+                mesh_hash TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                params TEXT NOT NULL,
+                target REAL NOT NULL,
+                library_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                mesh_type TEXT NOT NULL,
+                row TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                label TEXT,
+                metadata TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS run_results (
+                run_id TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                job_key TEXT NOT NULL,
+                row TEXT NOT NULL,
+                PRIMARY KEY (run_id, job_id)
+            )"""
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def has(self, key):
+        cur = self.conn.execute("SELECT 1 FROM results WHERE job_key = ?", (key,))
+        return cur.fetchone() is not None
+
+    def existing_keys(self, keys):
+        found = set()
+        keys = list(keys)
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = self.conn.execute(f"SELECT job_key FROM results WHERE job_key IN ({marks})", chunk)
+            found.update(k for (k,) in cur)
+        return found
+
+    def put(self, key, meta, row):
+        # Committed immediately so an interrupted sweep keeps every finished job
+        self.conn.execute(
+            """INSERT OR REPLACE INTO results
+               (job_key, mesh_hash, algorithm, params, target, library_version,
+                model, mesh_type, row, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                key,
+                meta["mesh_hash"],
+                meta["algorithm"],
+                json.dumps(meta["params"], sort_keys=True),
+                meta["target"],
+                meta["library_version"],
+                row["Model"],
+                row["Type"],
+                json.dumps(row),
+                time.time(),
+            ),
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        cur = self.conn.execute("SELECT row FROM results WHERE job_key = ?", (key,))
+        found = cur.fetchone()
+        return json.loads(found[0]) if found else None
+
+    def rows(self, keys=None):
+        # Rows for `keys` in the given order (missing keys are skipped),
+        # or every stored row if keys is None.
+        if keys is None:
+            cur = self.conn.execute("SELECT row FROM results ORDER BY mesh_type, model, created_at")
+            return [json.loads(r) for (r,) in cur]
+        rows = []
+        for key in keys:
+            row = self.get(key)
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    # --- Runs ---
+
+    def start_run(self, run_id, metadata, label=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO runs (run_id, label, metadata, created_at) VALUES (?, ?, ?, ?)",
+            (run_id, label, json.dumps(metadata, sort_keys=True), time.time()),
+        )
+        self.conn.commit()
+
+    def put_run_row(self, run_id, job_id, key, row):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO run_results (run_id, job_id, job_key, row) VALUES (?, ?, ?, ?)",
+            (run_id, job_id, key, json.dumps(row)),
+        )
+        self.conn.commit()
+
+    def runs(self):
+        # Every run, oldest first: dicts with run_id, label, created_at, metadata, rows
+        cur = self.conn.execute(
+            """SELECT r.run_id, r.label, r.created_at, r.metadata, COUNT(rr.job_id)
+               FROM runs r LEFT JOIN run_results rr ON rr.run_id = r.run_id
+               GROUP BY r.run_id ORDER BY r.created_at"""
+        )
+        return [{"run_id": run_id, "label": label, "created_at": created_at,
+                 "metadata": json.loads(metadata), "rows": count}
+                for run_id, label, created_at, metadata, count in cur]
+
+    def find_run(self, ref):
+        # A run by id, id prefix or label (latest run with that label);
+        # "latest" / "previous" are the last and second to last runs
+        runs = self.runs()
+        if ref in ("latest", "previous"):
+            offset = 1 if ref == "latest" else 2
+            return runs[-offset] if len(runs) >= offset else None
+        for run in reversed(runs):
+            if run["run_id"] == ref or run["label"] == ref:
+                return run
+        matches = [run for run in runs if run["run_id"].startswith(ref)]
+        return matches[-1] if len(matches) == 1 else None
+
+    def run_rows(self, run_id):
+        # {job_id: row} of one run
+        cur = self.conn.execute("SELECT job_id, row FROM run_results WHERE run_id = ?", (run_id,))
+        return {jid: json.loads(row) for jid, row in cur}
+
+    # --- Sharded runs ---
+
+    def merge_store(self, path):
+        # Copies every result row and run of another store (a shard's) into
+        # this one; rows already here with the same key are replaced
+        self.conn.execute("ATTACH DATABASE ? AS other", (path,))
+        try:
+            for table in ("results", "runs", "run_results"):
+                self.conn.execute(f"INSERT OR REPLACE INTO {table} SELECT * FROM other.{table}")
+            self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE other")
+
+    def combine_runs(self, run_id, metadata, run_ids, label=None):
+        # Records one run holding the rows of `run_ids` (the shards of one sweep)
+        self.start_run(run_id, metadata, label)
+        for source in run_ids:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO run_results (run_id, job_id, job_key, row)
+                   SELECT ?, job_id, job_key, row FROM run_results WHERE run_id = ?""",
+                (run_id, source),
+            )
+        self.conn.commit()
+
+    def to_dataframe(self, keys=None):
+        import pandas as pd
+
+        return pd.DataFrame(self.rows(keys))
+
+    def export_csv(self, path, fieldnames, rows=None):
+        # The CSV is a view over the store (all rows unless `rows` is given)
+        write_csv_atomic(path, fieldnames, self.rows() if rows is None else rows)
+
+
+def write_csv_atomic(path, fieldnames, rows):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    os.replace(tmp_path, path)
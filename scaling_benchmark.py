@@ -0,0 +1,234 @@
+import argparse
+import concurrent.futures
+import csv
+import multiprocessing
+import os
+
+import numpy as np
+import pymeshlab
+
+import decimation_algorithms
+import instrumentation
+import mesh_io
+import timing
+from experiment_runner import DATASET_DIRS, SKIP_DUPLICATES, benchmark_sources, search_threshold
+from mesh_cache import clone_meshset
+from result_store import write_csv_atomic
+
+SCALING_RESULTS_FILE = "scaling_results.csv"
+SCALING_FITS_FILE = "scaling_fits.csv"
+
+# The ladder starts at BASE_FACES and every rung is one midpoint subdivision
+# (4x the faces) of the previous one, up to MAX_FACES.
+BASE_FACES = 10_000
+MAX_FACES = 3_000_000
+TARGET_PCT = 0.1  # Keep 10% of each rung's faces (90% reduction)
+ALGORITHMS = ["QEM", "Clustering"]
+
+# Large rungs take seconds per run, so fewer repeats than the main sweep
+SCALING_TIMING = timing.timing_config(warmups=0, min_repeats=3, max_repeats=10, time_budget=30.0)
+
+FIELDNAMES = ['Model', 'Type', 'Algorithm', 'Rung', 'InputFaces', 'TargetFaces', 'FinalFaces',
+              'Time', 'TimeMin', 'TimeRSE', 'TimeRepeats', 'PeakMemMB', 'BaseMemMB']
+FIT_FIELDNAMES = ['Algorithm', 'Metric', 'Coefficient', 'Exponent', 'R2', 'Points']
+
+
+def subdivide_midpoint(vertices, faces):
+    # 1-to-4 midpoint subdivision. Unlike MeshLab's subdivision filters it
+    # does not require a manifold mesh, which most raw CAD models are not.
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    edges.sort(axis=1)
+    unique_edges, edge_id = np.unique(edges, axis=0, return_inverse=True)
+    midpoints = vertices[unique_edges].mean(axis=1)
+
+    m = edge_id.reshape(3, -1).T + len(vertices)  # midpoints of edges 01, 12, 20
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+    new_faces = np.concatenate([
+        np.stack([a, m[:, 0], m[:, 2]], axis=1),
+        np.stack([m[:, 0], b, m[:, 1]], axis=1),
+        np.stack([m[:, 2], m[:, 1], c], axis=1),
+        np.stack([m[:, 0], m[:, 1], m[:, 2]], axis=1),
+    ])
+    return np.concatenate([vertices, midpoints]), new_faces.astype(np.int32)
+
+
+def subdivide_meshset(ms):
+    mesh = ms.current_mesh()
+    vertices, faces = subdivide_midpoint(mesh.vertex_matrix(), mesh.face_matrix())
+    ms.clear()
+    ms.add_mesh(pymeshlab.Mesh(vertex_matrix=vertices, face_matrix=faces))
+
+
+def build_ladder(mesh, base_faces=BASE_FACES, max_faces=MAX_FACES):
+    # Yields (rung, MeshSet) from base_faces up to max_faces. The source is
+    # first brought to base_faces (QEM down, or subdivided up if smaller),
+    # then subdivided once per rung.
+    ms = clone_meshset(mesh)
+    while ms.current_mesh().face_number() < base_faces:
+        subdivide_meshset(ms)
+    if ms.current_mesh().face_number() > base_faces:
+        decimation_algorithms.apply(ms, "QEM", base_faces)
+
+    rung = 0
+    while ms.current_mesh().face_number() <= max_faces:
+        yield rung, ms
+        subdivide_meshset(ms)
+        rung += 1
+
+
+def _peak_memory_run(vertices, faces, algo, target_faces, threshold):
+    # Runs in a fresh process: the allocator has not grown its heap yet, so
+    # the RSS peak above the baseline is what the decimation really needs
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(pymeshlab.Mesh(vertex_matrix=vertices, face_matrix=faces))
+    del vertices, faces
+    base_kb = instrumentation.current_rss_kb() or 0
+    instrumentation.reset_peak_rss()
+    decimation_algorithms.apply(ms, algo, target_faces, threshold)
+    peak_kb = instrumentation.peak_rss_kb() or 0
+    return max(peak_kb - base_kb, 0) / 1024, base_kb / 1024
+
+
+def measure_peak_memory(mesh, algo, target_faces, threshold):
+    # One extra untimed run in a new process. Returns (additional peak MB,
+    # baseline MB with the input mesh loaded).
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        future = pool.submit(_peak_memory_run, mesh.vertex_matrix(), mesh.face_matrix(),
+                             algo, target_faces, threshold)
+        return future.result()
+
+
+def run_rung(model, mesh_type, algo, rung, ms_rung, timing_config):
+    mesh = ms_rung.current_mesh()
+    input_faces = mesh.face_number()
+    target_faces = int(input_faces * TARGET_PCT)
+
+    threshold = None
+    if decimation_algorithms.get_algorithm(algo)['face_control'] == decimation_algorithms.FACE_CONTROL_THRESHOLD:
+        threshold = search_threshold(mesh, target_faces, algo)
+
+    stats, ms = timing.measure(
+        lambda ms_run: decimation_algorithms.apply(ms_run, algo, target_faces, threshold),
+        lambda: clone_meshset(mesh),
+        config=timing_config
+    )
+    final_faces = ms.current_mesh().face_number()
+    del ms
+
+    peak_mb, base_mb = measure_peak_memory(mesh, algo, target_faces, threshold)
+    row = {
+        'Model': model,
+        'Type': mesh_type,
+        'Algorithm': algo,
+        'Rung': rung,
+        'InputFaces': input_faces,
+        'TargetFaces': target_faces,
+        'FinalFaces': final_faces,
+        'Time': stats['median'],
+        'TimeMin': stats['min'],
+        'TimeRSE': stats['rse'],
+        'TimeRepeats': stats['repeats'],
+        'PeakMemMB': peak_mb,
+        'BaseMemMB': base_mb,
+    }
+    print(f"    {model} rung {rung} ({input_faces} faces) {algo}: "
+          f"Time={stats['median']:.4f}s, PeakMem=+{peak_mb:.1f}MB, Faces={final_faces}")
+    return row
+
+
+def fit_power_law(n, y):
+    # Least-squares fit of y = c * n^k in log-log space. Returns (c, k, r2).
+    n = np.asarray(n, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = (n > 0) & (y > 0)
+    if keep.sum() < 2:
+        return float('nan'), float('nan'), float('nan')
+    x, z = np.log(n[keep]), np.log(y[keep])
+    k, log_c = np.polyfit(x, z, 1)
+    residual = z - (k * x + log_c)
+    total = ((z - z.mean()) ** 2).sum()
+    r2 = 1.0 - (residual ** 2).sum() / total if total > 0 else 1.0
+    return float(np.exp(log_c)), float(k), float(r2)
+
+
+def fit_scaling(rows):
+    # Empirical complexity per algorithm: exponent k of time and peak memory
+    # against input faces (k ~ 1 is linear, k ~ 1.1 is typical of n log n)
+    fits = []
+    for algo in sorted({r['Algorithm'] for r in rows}):
+        subset = [r for r in rows if r['Algorithm'] == algo]
+        for metric in ('Time', 'PeakMemMB'):
+            c, k, r2 = fit_power_law([r['InputFaces'] for r in subset], [r[metric] for r in subset])
+            fits.append({'Algorithm': algo, 'Metric': metric, 'Coefficient': c,
+                         'Exponent': k, 'R2': r2, 'Points': len(subset)})
+    return fits
+
+
+def select_models(all_models=False, skip_duplicates=SKIP_DUPLICATES):
+    # One model per mesh type by default; the ladder dominates run time.
+    # Same sources as the main sweep (duplicates and decimated outputs left out).
+    sources = benchmark_sources(DATASET_DIRS, skip_duplicates)
+    models = []
+    for mesh_type in DATASET_DIRS:
+        files = [path for source_type, path in sources if source_type == mesh_type]
+        models.extend((mesh_type, f) for f in (files if all_models else files[:1]))
+    return models
+
+
+def run_scaling(models, algorithms=None, base_faces=BASE_FACES, max_faces=MAX_FACES, timing_config=None):
+    algorithms = algorithms or ALGORITHMS
+    timing_config = timing_config or SCALING_TIMING
+    rows = []
+
+    for mesh_type, filepath in models:
+        model = os.path.basename(filepath)
+        print(f"--- {model} ({mesh_type}) ---")
+        source = mesh_io.load_meshset(filepath)
+
+        for rung, ms_rung in build_ladder(source.current_mesh(), base_faces, max_faces):
+            for algo in algorithms:
+                try:
+                    with instrumentation.span("scaling_rung", model=model, algorithm=algo, rung=rung):
+                        rows.append(run_rung(model, mesh_type, algo, rung, ms_rung, timing_config))
+                except Exception as e:
+                    print(f"\033[91m    Failed {algo} on {model} rung {rung}: {e}\033[0m")
+            # Partial results survive an out-of-memory kill on the next rung
+            write_csv_atomic(SCALING_RESULTS_FILE, FIELDNAMES, rows)
+
+    fits = fit_scaling(rows)
+    with open(SCALING_FITS_FILE, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIT_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(fits)
+
+    print("\n--- Empirical complexity (y = c * faces^k) ---")
+    for fit in fits:
+        print(f"  {fit['Algorithm']:<12} {fit['Metric']:<10} k={fit['Exponent']:.3f}  R2={fit['R2']:.3f}")
+    print(f"Results saved to {SCALING_RESULTS_FILE} and {SCALING_FITS_FILE}")
+    return rows, fits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decimation time and memory versus face count.")
+    parser.add_argument("--all-models", action="store_true",
+                        help="Run every model instead of the first one of each mesh type")
+    parser.add_argument("--algorithms", default=",".join(ALGORITHMS),
+                        help="Comma-separated algorithms. Registered: " + ", ".join(decimation_algorithms.ALGORITHMS))
+    parser.add_argument("--base-faces", type=int, default=BASE_FACES,
+                        help="Face count of the lowest rung")
+    parser.add_argument("--max-faces", type=int, default=MAX_FACES,
+                        help="Stop before a rung would exceed this many faces")
+    parser.add_argument("--max-repeats", type=int, default=SCALING_TIMING['max_repeats'],
+                        help="Upper bound on timed runs per rung")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Also run sources that duplicate another one or are decimated outputs "
+                             "(see provenance.py)")
+    args = parser.parse_args()
+
+    algorithms = [a.strip() for a in args.algorithms.split(",") if a.strip()]
+    for algo in algorithms:
+        decimation_algorithms.get_algorithm(algo)
+    config = dict(SCALING_TIMING, max_repeats=args.max_repeats,
+                  min_repeats=min(SCALING_TIMING['min_repeats'], args.max_repeats))
+    run_scaling(select_models(args.all_models, not args.keep_duplicates), algorithms, args.base_faces, args.max_faces, config)
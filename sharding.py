@@ -0,0 +1,234 @@
+import argparse
+import csv
+import json
+import os
+import socket
+import sys
+import time
+
+import memory_budget
+import mesh_io
+import provenance
+from result_store import ResultStore, write_csv_atomic
+
+# Partial results of every node and the face-count manifest they share.
+# Must be on the filesystem all nodes see.
+SHARD_DIR = "shards"
+MANIFEST_FILE = os.path.join(SHARD_DIR, "face_counts.json")
+
+# Fixed per-model cost (load, tuning, metrics) in faces, so many small
+# models are not all piled onto one shard
+MODEL_BASE_FACES = 5000
+
+
+def parse_shard(text):
+    # "2/8" -> (2, 8); shards are numbered from 0
+    try:
+        index, count = (int(part) for part in str(text).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {text!r}, expected INDEX/COUNT such as 0/4") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {text!r}: INDEX must be in 0..COUNT-1")
+    return index, count
+
+
+def shard_path(path, index, count, shard_dir=SHARD_DIR):
+    # Per-shard variant of an output file:
+    # experiment_results.csv -> shards/experiment_results.shard-01-of-04.csv
+    name = os.path.basename(path)
+    stem, ext = name.split(".", 1) if "." in name else (name, "")
+    return os.path.join(shard_dir, f"{stem}.shard-{index:02d}-of-{count:02d}" + (f".{ext}" if ext else ""))
+
+
+def list_models(dataset_dirs):
+    # [(mesh_type, path)] in the order the runner queues them
+    return [(mesh_type, path) for mesh_type, dir_path in dataset_dirs.items()
+            for path in mesh_io.list_meshes(dir_path)]
+
+
+def _file_state(path):
+    # (mtime_ns, size) of the files holding the mesh at `path`
+    mtime, size = 0, 0
+    for name in mesh_io.mesh_files(path):
+        stat = os.stat(name)
+        mtime, size = max(mtime, stat.st_mtime_ns), size + stat.st_size
+    return mtime, size
+
+
+def face_counts(models, manifest_file=MANIFEST_FILE):
+    # {path: faces} of every model. Counting means reading every OBJ, so the
+    # counts are kept in a manifest next to the partial results, with the
+    # (mtime_ns, size) they were counted at; the first node writes it and
+    # the others reuse it. A model edited since is counted again. Every node
+    # must see the same dataset, or the shards will not line up.
+    counts = {}
+    if os.path.exists(manifest_file):
+        try:
+            with open(manifest_file) as f:
+                counts = json.load(f)
+        except (OSError, ValueError):
+            counts = {}
+    states = {path: _file_state(path) for _, path in models}
+    missing = [path for _, path in models
+               if not isinstance(counts.get(path), dict)
+               or (counts[path].get("mtime_ns"), counts[path].get("size")) != states[path]]
+    if missing:
+        print(f"Counting faces of {len(missing)} models for sharding...")
+        for path in missing:
+            mtime, size = states[path]
+            counts[path] = {"faces": memory_budget.mesh_face_count(path), "mtime_ns": mtime, "size": size}
+        os.makedirs(os.path.dirname(manifest_file) or ".", exist_ok=True)
+        # Nodes racing here write identical content, so last rename wins
+        tmp_path = f"{manifest_file}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(counts, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_file)
+    return {path: counts[path]["faces"] for _, path in models}
+
+
+def assign_shards(weights, count):
+    # {path: shard index}: longest-processing-time greedy over `weights`
+    # ({path: weight}). Heaviest model first, each onto the lightest shard
+    # (lowest index on ties, paths break weight ties), so every node
+    # computes the same assignment from the same counts.
+    loads = [0] * count
+    assignment = {}
+    for path in sorted(weights, key=lambda p: (-weights[p], p)):
+        shard = min(range(count), key=lambda i: (loads[i], i))
+        assignment[path] = shard
+        loads[shard] += weights[path]
+    return assignment
+
+
+def plan_shards(models, count, manifest_file=MANIFEST_FILE):
+    # (assignment {path: shard}, per-shard loads in faces) of the
+    # [(mesh_type, path)] sources the runner benchmarks
+    # (experiment_runner.benchmark_sources, duplicates already left out)
+    counts = face_counts(models, manifest_file)
+    weights = {path: faces + MODEL_BASE_FACES for path, faces in counts.items()}
+    assignment = assign_shards(weights, count)
+    loads = [0] * count
+    for path, shard in assignment.items():
+        loads[shard] += counts[path]
+    return assignment, loads
+
+
+def shard_models(models, index, count, manifest_file=MANIFEST_FILE):
+    # Set of model paths shard `index` of `count` runs
+    assignment, loads = plan_shards(models, count, manifest_file)
+    models = {path for path, shard in assignment.items() if shard == index}
+    total = sum(loads) or 1
+    print(f"Shard {index}/{count}: {len(models)} of {len(assignment)} models, "
+          f"{loads[index]} faces ({100 * loads[index] / total:.1f}% of the dataset)")
+    return models
+
+
+def merge_shards(count, results_file, fieldnames, store_file, metadata_file, dataset_dirs,
+                 allow_missing=False, run_label=None, provenance_file=None):
+    # Combines the partial results of shards 0..count-1 into the files an
+    # unsharded run writes: the CSV (in the unsharded row order), the store
+    # (every shard's rows and runs, plus one run spanning all shards), the
+    # run metadata and, with provenance_file, the provenance index of the
+    # meshes the shards saved. Returns the merged rows.
+    partials = [shard_path(results_file, i, count) for i in range(count)]
+    missing = [i for i, path in enumerate(partials) if not os.path.exists(path)]
+    if missing and not allow_missing:
+        raise FileNotFoundError(f"Shards {', '.join(map(str, missing))} of {count} have not finished "
+                                f"(no {partials[missing[0]]})")
+
+    rows = []
+    for i, path in enumerate(partials):
+        if i in missing:
+            continue
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            extra = set(reader.fieldnames or []) ^ set(fieldnames)
+            if extra:
+                print(f"\033[91m    Warning: shard {i} has different columns ({', '.join(sorted(extra))}); "
+                      f"merging the common ones\033[0m")
+            shard_rows = list(reader)
+        print(f"  Shard {i}: {len(shard_rows)} rows")
+        rows.extend(shard_rows)
+
+    # Stable sort by model, so each model's rows keep the order its shard wrote them in
+    order = {(mesh_type, os.path.basename(path)): n for n, (mesh_type, path) in enumerate(list_models(dataset_dirs))}
+    rows.sort(key=lambda row: order.get((row['Type'], row['Model']), len(order)))
+    write_csv_atomic(results_file, fieldnames, rows)
+
+    shard_meta = []
+    for i in range(count):
+        path = shard_path(metadata_file, i, count)
+        if i not in missing and os.path.exists(path):
+            with open(path) as f:
+                shard_meta.append(json.load(f))
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-merged"
+    with ResultStore(store_file) as store:
+        for i in range(count):
+            path = shard_path(store_file, i, count)
+            if i not in missing and os.path.exists(path):
+                store.merge_store(path)
+        # Environment of the first shard; every shard's is kept under "shards"
+        metadata = {k: v for k, v in (shard_meta[0] if shard_meta else {}).items()
+                    if k not in ('run_id', 'label', 'shard')}
+        metadata.update(shards=shard_meta, shard_count=count, missing_shards=missing)
+        store.combine_runs(run_id, metadata, [m['run_id'] for m in shard_meta], run_label)
+
+    if provenance_file:
+        with provenance.ProvenanceIndex(provenance_file) as index:
+            for i in range(count):
+                path = shard_path(provenance_file, i, count)
+                if i not in missing and os.path.exists(path):
+                    index.merge_index(path)
+
+    tmp_path = f"{metadata_file}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(metadata, run_id=run_id, label=run_label), f, indent=2, sort_keys=True)
+    os.replace(tmp_path, metadata_file)
+    print(f"Merged {count - len(missing)} of {count} shards ({len(rows)} rows) into {results_file}; "
+          f"recorded as run {run_id} in {store_file}")
+    return rows
+
+
+if __name__ == "__main__":
+    # The runner imports this module, so its settings are only pulled in here
+    import experiment_runner
+
+    parser = argparse.ArgumentParser(description="Plan and merge sharded benchmark runs. Run each shard with "
+                                                 "experiment_runner.py --shard INDEX/COUNT.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    plan = sub.add_parser("plan", help="Print the models and faces every shard gets")
+    plan.add_argument("--shards", type=int, required=True)
+    plan.add_argument("--verbose", action="store_true", help="List the models of every shard")
+    plan.add_argument("--keep-duplicates", action="store_true",
+                      help="Plan for a run with --keep-duplicates")
+    merge = sub.add_parser("merge", help=f"Combine finished shards into {experiment_runner.RESULTS_FILE}")
+    merge.add_argument("--shards", type=int, required=True)
+    merge.add_argument("--allow-missing", action="store_true",
+                       help="Merge the shards that have finished even if some have not")
+    merge.add_argument("--run-label", default=None, help="Label of the merged run (see regression.py)")
+    for p in (plan, merge):
+        p.add_argument("--dataset", action="append", default=None, metavar="TYPE=DIR",
+                       help="Dataset directory per mesh type (as given to experiment_runner.py)")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    dataset_dirs = experiment_runner.parse_dataset_dirs(args.dataset) if args.dataset else experiment_runner.DATASET_DIRS
+
+    if args.command == "plan":
+        sources = experiment_runner.benchmark_sources(dataset_dirs, not args.keep_duplicates)
+        assignment, loads = plan_shards(sources, args.shards)
+        total = sum(loads) or 1
+        for i, load in enumerate(loads):
+            models = sorted(path for path, shard in assignment.items() if shard == i)
+            print(f"Shard {i}: {len(models)} models, {load} faces ({100 * load / total:.1f}%)")
+            if args.verbose:
+                for path in models:
+                    print(f"    {path}")
+    else:
+        try:
+            merge_shards(args.shards, experiment_runner.RESULTS_FILE, experiment_runner.FIELDNAMES,
+                         experiment_runner.STORE_FILE, experiment_runner.RUN_METADATA_FILE, dataset_dirs,
+                         args.allow_missing, args.run_label, experiment_runner.PROVENANCE_FILE)
+        except FileNotFoundError as e:
+            print(f"\033[91mError: {e}\033[0m")
+            sys.exit(1)
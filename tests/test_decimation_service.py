@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pymeshlab
+
+import decimation_service
+from decimation_service import DecimationClient, DecimationService, handle_connection
+
+
+class ServiceTest(unittest.IsolatedAsyncioTestCase):
+    # A service on a temporary Unix socket, driven by DecimationClient
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.mesh_path = os.path.join(self.dir, "sphere.obj")
+        ms = pymeshlab.MeshSet()
+        ms.create_sphere(subdiv=2)
+        ms.save_current_mesh(self.mesh_path)
+
+        self.service = await DecimationService(os.path.join(self.dir, "spool"), num_workers=1,
+                                               max_queued=2).start()
+        self.socket = os.path.join(self.dir, "service.sock")
+        self.server = await asyncio.start_unix_server(
+            lambda reader, writer: handle_connection(self.service, reader, writer), path=self.socket)
+        self.client = DecimationClient(unix_socket=self.socket, timeout=120)
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.service.close()
+
+    def post(self, query, body):
+        response = self.client._request("POST", "/decimate?" + query, body)
+        return response.status, response.getheader("Retry-After"), response.read()
+
+    async def test_streams_accepted_then_results(self):
+        events = await asyncio.to_thread(lambda: list(self.client.decimate(self.mesh_path, "QEM", [0.5])))
+        self.assertEqual(events[0]['event'], 'accepted')
+        self.assertEqual([job['keep'] for job in events[0]['jobs']], [0.5])
+        self.assertEqual([event['event'] for event in events[1:]], ['result'])
+        self.assertEqual(events[1]['job'], events[0]['jobs'][0]['job'])
+        self.assertLess(events[1]['metrics']['FinalFaces'], events[1]['metrics']['InitialFaces'])
+        vertices, faces = await asyncio.to_thread(self.client.mesh, events[1]['job'])
+        self.assertEqual(len(faces), events[1]['metrics']['FinalFaces'])
+
+    async def test_full_queue_refuses_whole_request(self):
+        # Runners stopped, so queued jobs stay queued: one of two slots taken
+        for task in self.service._runners:
+            task.cancel()
+        await asyncio.gather(*self.service._runners, return_exceptions=True)
+        with open(self.mesh_path, "rb") as f:
+            body = f.read()
+        mesh_hash = await self.service.store_upload(body, "obj")
+        await self.service.submit(mesh_hash, "obj", "QEM", 0.3, wait=False)
+
+        status, retry_after, data = await asyncio.to_thread(
+            self.post, "algorithm=QEM&keep=0.2,0.1&format=obj", body)
+        self.assertEqual(status, 503)
+        self.assertEqual(retry_after, str(decimation_service.RETRY_AFTER))
+        self.assertIn('error', json.loads(data))
+        # No level of the refused request was left queued or registered
+        status = self.service.status()
+        self.assertEqual((status['queued'], status['rejected']), (1, 1))
+        self.assertEqual(len(self.service._jobs), 1)
+
+        # More new levels than the queue holds can never fit
+        status, _, data = await asyncio.to_thread(self.post, "algorithm=QEM&keep=0.2,0.1,0.05&format=obj", body)
+        self.assertEqual(status, 400)
+
+    async def test_oversized_upload(self):
+        with mock.patch.object(decimation_service, "MAX_UPLOAD_BYTES", 100):
+            status, _, data = await asyncio.to_thread(self.post, "algorithm=QEM&keep=0.5&format=obj", b"v 0 0 0\n" * 50)
+        self.assertEqual(status, 413)
+        self.assertIn('error', json.loads(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
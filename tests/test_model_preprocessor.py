@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pymeshlab
+
+import model_preprocessor
+
+
+class DuplicateRerunTest(unittest.TestCase):
+    # Two downloads with the same geometry: the one recorded first is
+    # processed and the other is its duplicate, also on --force reruns
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.addCleanup(os.chdir, self.cwd)
+        raw_dir = os.path.join("raw", "thingi10k")
+        os.makedirs(raw_dir)
+        ms = pymeshlab.MeshSet()
+        ms.create_sphere(subdiv=4)
+        ms.save_current_mesh(os.path.join(raw_dir, "49316-face.stl"))
+        shutil.copy(os.path.join(raw_dir, "49316-face.stl"), os.path.join(raw_dir, "99999-face-dup.stl"))
+        for name, value in [("RAW_DIRS", {"thingi10k": raw_dir}), ("PROCESSED_DIRS", {"thingi10k": "clean"})]:
+            patcher = mock.patch.object(model_preprocessor, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def statuses(self, **kwargs):
+        manifest = model_preprocessor.preprocess_models(manifest_path="manifest.json", **kwargs)
+        return {os.path.basename(path): entry["status"] for path, entry in manifest.items()}
+
+    def test_force_rerun_keeps_first_copy(self):
+        expected = {"49316-face.stl": "processed", "99999-face-dup.stl": "duplicate"}
+        self.assertEqual(self.statuses(), expected)
+        self.assertEqual(self.statuses(force=True), expected)
+        self.assertEqual(self.statuses(force=True, num_workers=2), expected)
+        self.assertTrue(model_preprocessor.mesh_io.mesh_exists(os.path.join("clean", "49316-face.obj")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import contextlib
+import gc
+import math
+import statistics
+import time
+
+# Defaults for measure(); the runner exposes them on the command line
+WARMUPS = 1
+MIN_REPEATS = 5
+MAX_REPEATS = 50
+TARGET_RSE = 0.02  # Stop once the standard error is within 2% of the mean
+TIME_BUDGET = 5.0  # Seconds of timed work per job before giving up on TARGET_RSE
+DISABLE_GC = True
+OUTLIER_IQR_FACTOR = 1.5  # Tukey fences
+
+
+def timing_config(warmups=WARMUPS, min_repeats=MIN_REPEATS, max_repeats=MAX_REPEATS,
+                  target_rse=TARGET_RSE, time_budget=TIME_BUDGET, disable_gc=DISABLE_GC):
+    # Plain dict so it can be shipped to worker processes with each job
+    return {
+        "warmups": warmups,
+        "min_repeats": min(min_repeats, max_repeats),
+        "max_repeats": max_repeats,
+        "target_rse": target_rse,
+        "time_budget": time_budget,
+        "disable_gc": disable_gc,
+    }
+
+
+def split_outliers(samples, factor=OUTLIER_IQR_FACTOR):
+    # Returns (inliers, outliers) using Tukey's fences on the sample quartiles
+    if len(samples) < 4:
+        return list(samples), []
+    q1, _, q3 = statistics.quantiles(samples, n=4)
+    iqr = q3 - q1
+    low, high = q1 - factor * iqr, q3 + factor * iqr
+    inliers = [s for s in samples if low <= s <= high]
+    outliers = [s for s in samples if s < low or s > high]
+    return inliers, outliers
+
+
+def relative_standard_error(samples):
+    if len(samples) < 2:
+        return math.inf
+    mean = statistics.fmean(samples)
+    if mean <= 0:
+        return math.inf
+    return statistics.stdev(samples) / math.sqrt(len(samples)) / mean
+
+
+def summarize(samples):
+    # Mean, stdev and RSE are computed without outliers; min and median use every sample
+    inliers, outliers = split_outliers(samples)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(inliers),
+        "stdev": statistics.stdev(inliers) if len(inliers) > 1 else 0.0,
+        "rse": relative_standard_error(inliers),
+        "repeats": len(samples),
+        "outliers": len(outliers),
+        "samples": list(samples),
+    }
+
+
+@contextlib.contextmanager
+def gc_disabled(enabled=True):
+    was_enabled = gc.isenabled()
+    if enabled:
+        gc.disable()
+    try:
+        yield
+    finally:
+        if enabled and was_enabled:
+            gc.enable()
+
+
+def measure(fn, setup, config=None, guard=contextlib.nullcontext, teardown=None):
+    # Times fn(setup()) until the relative standard error drops below
+    # target_rse (after min_repeats) or the time budget / max_repeats is hit.
+    # setup() runs outside the timed region; guard() wraps each timed call.
+    # Every state but the last is dropped (and passed to teardown(), if
+    # given) before the next setup(), so at most one is alive at a time.
+    # Returns (stats, state) where state is what the last timed call ran on.
+    config = config or timing_config()
+    teardown = teardown or (lambda state: None)
+
+    for _ in range(config["warmups"]):
+        state = setup()
+        fn(state)
+        teardown(state)
+        del state
+
+    samples = []
+    state = None
+    budget_start = time.perf_counter()
+    while True:
+        if state is not None:
+            teardown(state)
+            state = None
+        state = setup()
+        with guard(), gc_disabled(config["disable_gc"]):
+            start_time = time.perf_counter_ns()
+            fn(state)
+            end_time = time.perf_counter_ns()
+        samples.append((end_time - start_time) / 1e9)
+
+        n = len(samples)
+        if n >= config["max_repeats"]:
+            break
+        if n >= config["min_repeats"]:
+            inliers, _ = split_outliers(samples)
+            if relative_standard_error(inliers) <= config["target_rse"]:
+                break
+            if time.perf_counter() - budget_start >= config["time_budget"]:
+                break
+
+    return summarize(samples), state
+
+
+def timing_columns(stats):
+    # Result-row columns for one job. Time is the median, which is robust to
+    # the odd slow sample; the rest describe the sample distribution.
+    return {
+        "Time": stats["median"],
+        "TimeMin": stats["min"],
+        "TimeMean": stats["mean"],
+        "TimeStdev": stats["stdev"],
+        "TimeRSE": stats["rse"],
+        "TimeRepeats": stats["repeats"],
+        "TimeOutliers": stats["outliers"],
+        "TimeSamples": ";".join(f"{s:.9f}" for s in stats["samples"]),
+    }
+
+
+TIMING_FIELDNAMES = ["TimeMin", "TimeMean", "TimeStdev", "TimeRSE", "TimeRepeats", "TimeOutliers", "TimeSamples"]